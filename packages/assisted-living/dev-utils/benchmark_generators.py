@@ -0,0 +1,358 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time as timer
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+import pytz
+from generators.utils import generate_uuid, get_loinc_codes, seed_stream
+from generators.config import VITAL_RANGES, PRESCRIPTION_TEMPLATES, DOSAGE_INSTRUCTIONS
+from generators.observations import (
+    generate_vital_series_for_resident,
+    make_observation,
+)
+from generators.prescriptions import generate_prescriptions_for_resident
+from generators.prescription_administration import (
+    generate_prescription_administration_for_resident,
+)
+from generators.financials import generate_financial_data_for_resident
+
+# --- Configuration ---
+DEV_UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATOR_SCRIPT = os.path.join(DEV_UTILS_DIR, "generate_demo_subcollection_data.py")
+SNOMED_DIR = os.path.join(DEV_UTILS_DIR, "..", "demo-data", "snomed-examples")
+# Every case ends on the same date, so runs are comparable across days
+AS_OF = pytz.utc.localize(datetime(2025, 1, 1))
+OBSERVATIONS_PER_RESIDENT = 50
+VITALS_EVERY_HOURS = 4
+DEFAULT_SEED = 20250101
+DEFAULT_RESIDENTS = [100, 1000]
+DEFAULT_SPANS = [90, 365, 1095]
+# Metrics compared by `compare`, and whether a higher value is better
+METRICS = {
+    "records_per_sec": True,
+    "alloc_peak_bytes": False,
+    "peak_rss_kb": False,
+}
+
+
+# --- Cases ---
+# Each case does its setup untimed and returns a callable that generates the
+# records and returns how many it made.
+def _staff_ids(seed: int) -> list:
+    seed_stream(seed, "staff")
+    return [generate_uuid() for _ in range(6)]
+
+
+def observations_case(seed: int, residents: int, span_days: int):
+    start = AS_OF - timedelta(days=span_days)
+    staff_ids = _staff_ids(seed)
+    loinc_codes = get_loinc_codes(VITAL_RANGES)
+    seed_stream(seed, "benchmark", "observations")
+    calls = [
+        (random.choice(loinc_codes), generate_uuid())
+        for _ in range(residents * OBSERVATIONS_PER_RESIDENT)
+    ]
+
+    def run() -> int:
+        for code, resident_id in calls:
+            make_observation(code, resident_id, staff_ids, start, AS_OF)
+        return len(calls)
+
+    return run
+
+
+def vital_series_case(seed: int, residents: int, span_days: int):
+    start = AS_OF - timedelta(days=span_days)
+    staff_ids = _staff_ids(seed)
+    loinc_codes = get_loinc_codes(VITAL_RANGES)
+    seed_stream(seed, "benchmark", "residents")
+    resident_ids = [generate_uuid() for _ in range(residents)]
+
+    def run() -> int:
+        count = 0
+        for resident_id in resident_ids:
+            seed_stream(seed, resident_id, "observations")
+            count += len(
+                generate_vital_series_for_resident(
+                    resident_id,
+                    staff_ids,
+                    start,
+                    AS_OF,
+                    loinc_codes,
+                    VITALS_EVERY_HOURS,
+                )
+            )
+        return count
+
+    return run
+
+
+def emar_case(seed: int, residents: int, span_days: int):
+    start = AS_OF - timedelta(days=span_days)
+    staff_ids = _staff_ids(seed)
+    seed_stream(seed, "benchmark", "residents")
+    resident_ids = [generate_uuid() for _ in range(residents)]
+    prescriptions = {}
+    for resident_id in resident_ids:
+        seed_stream(seed, resident_id, "prescriptions")
+        prescriptions[resident_id] = generate_prescriptions_for_resident(
+            resident_id,
+            staff_ids,
+            start,
+            start + timedelta(days=span_days // 2),
+            AS_OF,
+            PRESCRIPTION_TEMPLATES,
+            DOSAGE_INSTRUCTIONS,
+        )
+
+    def run() -> int:
+        count = 0
+        for resident_id in resident_ids:
+            seed_stream(seed, resident_id, "prescription_administration")
+            count += len(
+                generate_prescription_administration_for_resident(
+                    resident_id, prescriptions[resident_id], staff_ids, AS_OF
+                )
+            )
+        return count
+
+    return run
+
+
+def financials_case(seed: int, residents: int, span_days: int):
+    start = AS_OF - timedelta(days=span_days)
+    seed_stream(seed, "benchmark", "residents")
+    resident_ids = [generate_uuid() for _ in range(residents)]
+
+    def run() -> int:
+        count = 0
+        for resident_id in resident_ids:
+            seed_stream(seed, resident_id, "financials")
+            data = generate_financial_data_for_resident(
+                resident_id, "Benchmark Resident", start, AS_OF
+            )
+            count += sum(len(records) for records in data.values())
+        return count
+
+    return run
+
+
+def end_to_end_case(seed: int, residents: int, span_days: int):
+    """Runs the generator script on synthesised residents in a scratch directory.
+
+    The run ends at `AS_OF` like the other cases, and `--since` limits the
+    windowed collections to the last `span_days`. Residents, prescriptions,
+    care plans and the ledger still cover the script's whole date range.
+    """
+
+    def run() -> int:
+        with tempfile.TemporaryDirectory() as scratch:
+            os.makedirs(os.path.join(scratch, "demo-data"))
+            os.symlink(
+                os.path.abspath(SNOMED_DIR),
+                os.path.join(scratch, "demo-data", "snomed-examples"),
+            )
+            subprocess.run(
+                [
+                    sys.executable,
+                    GENERATOR_SCRIPT,
+                    "--format=jsonl",
+                    f"--seed={seed}",
+                    f"--as-of={AS_OF.date()}",
+                    f"--since={(AS_OF - timedelta(days=span_days)).date()}",
+                    f"--residents={residents}",
+                ],
+                cwd=scratch,
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            count = 0
+            # Synthesised residents are written under their own output root
+            synthetic_dir = os.path.join(scratch, "demo-data", "synthetic")
+            for root, _, files in os.walk(synthetic_dir):
+                for name in files:
+                    if name.endswith(".jsonl"):
+                        with open(os.path.join(root, name), "rb") as f:
+                            count += sum(1 for _ in f)
+            return count
+
+    return run
+
+
+CASES = {
+    "make_observation": observations_case,
+    "vital_series": vital_series_case,
+    "emar": emar_case,
+    "financials": financials_case,
+    "end_to_end": end_to_end_case,
+}
+# The end-to-end case runs in a child process, so tracemalloc cannot see it
+UNTRACED_CASES = {"end_to_end"}
+
+
+# --- Measurement ---
+def measure(name: str, seed: int, residents: int, span_days: int, repeat: int) -> dict:
+    """Runs one case in the current (fresh) process and returns its metrics.
+
+    Throughput is the best of `repeat` timed runs. Peak RSS is read before
+    the traced run, since tracemalloc's own bookkeeping inflates it.
+    """
+    run = CASES[name](seed, residents, span_days)
+    best, records = None, 0
+    for _ in range(repeat):
+        started = timer.perf_counter()
+        records = run()
+        elapsed = timer.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    usage = resource.RUSAGE_CHILDREN if name in UNTRACED_CASES else resource.RUSAGE_SELF
+    peak_rss_kb = resource.getrusage(usage).ru_maxrss
+
+    alloc_peak_bytes = None
+    if name not in UNTRACED_CASES:
+        tracemalloc.start()
+        run()
+        alloc_peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "records": records,
+        "seconds": round(best, 4),
+        "records_per_sec": round(records / best, 1) if best else None,
+        "alloc_peak_bytes": alloc_peak_bytes,
+        "peak_rss_kb": peak_rss_kb,
+    }
+
+
+def case_key(name: str, residents: int, span_days: int) -> str:
+    return f"{name}/residents={residents}/span={span_days}d"
+
+
+def run_benchmarks(args) -> None:
+    cases = []
+    for name in args.cases:
+        for residents in args.residents:
+            for span_days in args.spans:
+                cases.append((name, residents, span_days))
+
+    results = {}
+    # A fresh spawned process per case keeps peak RSS and imports isolated
+    context = get_context("spawn")
+    for name, residents, span_days in cases:
+        key = case_key(name, residents, span_days)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[key] = pool.submit(
+                measure, name, args.seed, residents, span_days, args.repeat
+            ).result()
+        result = results[key]
+        print(
+            f"{key:<45} {result['records']:>10} rec "
+            f"{result['records_per_sec']:>12,.0f} rec/s "
+            f"{result['peak_rss_kb'] / 1024:>8.1f} MiB RSS"
+        )
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(pytz.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}.")
+
+
+def compare_benchmarks(args) -> None:
+    """Exits non-zero when any shared case regressed by more than the threshold."""
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)["results"]
+    with open(args.current, "r") as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    for key in sorted(baseline.keys() & current.keys()):
+        for metric, higher_is_better in METRICS.items():
+            before, after = baseline[key].get(metric), current[key].get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = -change if higher_is_better else change
+            marker = "REGRESSION" if regressed > args.threshold else ""
+            print(f"{key:<45} {metric:<17} {change:>+8.1%} {marker}")
+            if marker:
+                regressions.append((key, metric))
+    for key in sorted(baseline.keys() ^ current.keys()):
+        print(f"{key:<45} only in {'baseline' if key in baseline else 'current'}")
+
+    if regressions:
+        print(
+            f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}."
+        )
+        exit(1)
+    print("No regressions.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the demo data generators and compares runs against a baseline."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser(
+        "run", help="Run the benchmarks and save the results."
+    )
+    run_parser.add_argument(
+        "--output",
+        default="dev-utils/benchmarks/results.json",
+        help="Where to write the JSON results; save one as a baseline to compare against.",
+    )
+    run_parser.add_argument(
+        "--cases", nargs="+", choices=list(CASES), default=list(CASES)
+    )
+    run_parser.add_argument(
+        "--residents", nargs="+", type=int, default=DEFAULT_RESIDENTS
+    )
+    run_parser.add_argument(
+        "--spans",
+        nargs="+",
+        type=int,
+        default=DEFAULT_SPANS,
+        help="Date spans in days, ending on the fixed benchmark date.",
+    )
+    run_parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    run_parser.add_argument(
+        "--repeat", type=int, default=3, help="Timed runs per case; the best is kept."
+    )
+    run_parser.set_defaults(handler=run_benchmarks)
+
+    compare_parser = commands.add_parser(
+        "compare", help="Fail if the current results regressed against a baseline."
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Largest tolerated relative regression per metric (0.10 = 10%%).",
+    )
+    compare_parser.set_defaults(handler=compare_benchmarks)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.handler(args)
@@ -0,0 +1,79 @@
+import argparse
+import os
+from pipeline.diff import DatasetDiff
+from pipeline.readers import RecordFormatError
+from pipeline.serialisers import get_serialiser
+from validate_references import dataset_dictionaries, dataset_paths
+
+DEFAULT_OUTPUT = "demo-data/dataset-diff.jsonl"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Diffs two generated datasets into the Firestore set, update and delete operations that turn the old one into the new one."
+    )
+    parser.add_argument("old", help="Directory of the dataset currently deployed.")
+    parser.add_argument(
+        "new",
+        help="Directory of the regenerated dataset, e.g. demo-data/synthetic after a --residents run.",
+    )
+    parser.add_argument(
+        "--output",
+        default=DEFAULT_OUTPUT,
+        help=f"JSONL file for the operations (default: {DEFAULT_OUTPUT}).",
+    )
+    parser.add_argument(
+        "--memory-mb",
+        type=float,
+        default=1024,
+        help="Memory for sorting both datasets; beyond it, sorted runs spill to disk.",
+    )
+    parser.add_argument(
+        "--spill-dir", help="Where sorted runs go (default: the system temp dir)."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    datasets = {}
+    for data_dir in (args.old, args.new):
+        paths = dataset_paths(data_dir)
+        if "residents" not in paths:
+            print(f"Error: no residents file found in {data_dir}.")
+            exit(1)
+        datasets[data_dir] = paths
+    old_paths, new_paths = datasets[args.old], datasets[args.new]
+    if old_paths.keys() != new_paths.keys():
+        print(
+            "Warning: only one dataset has "
+            f"{', '.join(sorted(old_paths.keys() ^ new_paths.keys()))}; "
+            "its documents are all set or deleted."
+        )
+    dumps = get_serialiser("auto").dumps
+    counts = {"set": 0, "update": 0, "delete": 0}
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    diff = DatasetDiff(int(args.memory_mb * 2**20), args.spill_dir)
+    try:
+        with open(args.output, "wb") as f:
+            for operation in diff.run(
+                old_paths,
+                new_paths,
+                dataset_dictionaries(args.old, old_paths),
+                dataset_dictionaries(args.new, new_paths),
+            ):
+                f.write(dumps(operation) + b"\n")
+                counts[operation["op"]] += 1
+    except RecordFormatError as error:
+        print(f"Error: {error}")
+        exit(1)
+    print(
+        f"Wrote {sum(counts.values())} operations to {args.output}: "
+        f"{counts['set']} set, {counts['update']} update, {counts['delete']} delete."
+    )
+    for name, unresolved in diff.unresolved.items():
+        if unresolved:
+            print(
+                f"Warning: {unresolved} care plan activities in the {name} dataset "
+                "have no care plan and were left out."
+            )
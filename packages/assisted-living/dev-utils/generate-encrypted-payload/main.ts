@@ -10,6 +10,7 @@ import {
   // @ts-ignore ... Dockerfile copies path into job container
 } from './lib/encryption.ts'
 import * as fs from 'fs'
+import * as readline from 'readline'
 // @ts-ignore ... can't find type def, not making a .d.ts either
 import JSONStream from 'minipass-json-stream'
 
@@ -104,8 +105,29 @@ const MAX_IN_MEMORY_SIZE = 1_000_000 // 1MB
  * @yields {Object} Each individual JSON object/record from the file.
  */
 async function* loadPlaintextData(collectionName: string) {
+  const jsonlDataPath = `${PLAINTEXT_INPUT_DIR}/${collectionName}/data-plain.jsonl`
   const rawDataPath = `${PLAINTEXT_INPUT_DIR}/${collectionName}/data-plain.json`
 
+  // Prefer the line-delimited output of `--format jsonl`, one document per line
+  if (fs.existsSync(jsonlDataPath)) {
+    console.log(`Streaming JSONL file: ${collectionName}`)
+    const lines = readline.createInterface({
+      input: fs.createReadStream(jsonlDataPath),
+      crlfDelay: Infinity,
+    })
+    let chunk = []
+    for await (const line of lines) {
+      if (!line) continue
+      chunk.push(JSON.parse(line))
+      if (chunk.length > 99_999) {
+        yield chunk
+        chunk = []
+      }
+    }
+    if (chunk.length > 0) yield chunk
+    return
+  }
+
   if (!fs.existsSync(rawDataPath)) {
     console.warn(
       `Warning: Plaintext data file not found for ${collectionName}. Skipping.`,
@@ -1,15 +1,20 @@
+import argparse
+import copy
 import json
 import os
-from datetime import datetime, timedelta
-from random import choice, random
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from datetime import date, datetime, time, timedelta
+from random import SystemRandom, choice, random
 import pytz  # Added for timezone handling
 from generators.utils import (
-    convert_times,
     load_snomed_file,
     load_allergy_reactions,
     get_loinc_codes,
-    generate_uuid,
     get_random_datetime,
+    seed_stream,
 )
 from generators.config import (
     VITAL_RANGES,
@@ -21,21 +26,78 @@ from generators.prescriptions import generate_prescriptions_for_resident
 from generators.prescription_administration import (
     generate_prescription_administration_for_resident,
 )
-from generators.observations import generate_observations_for_resident
+from generators.observations import (
+    generate_observations_for_resident,
+    generate_vital_series_for_resident,
+)
 from generators.diagnostic_history import generate_diagnostic_history_for_resident
 from generators.episodes_of_care import generate_episodes_of_care_for_resident
 from generators.care_plans import generate_care_plans_for_resident
 from generators.addresses import generate_address_for_resident
-from generators.identifiers import generate_identifiers_for_resident
+from generators.identifiers import (
+    allocate_resident_code,
+    generate_identifiers_for_resident,
+)
 from generators.financials import generate_financial_data_for_resident
 from generators.tasks import generate_tasks_for_resident
 from generators.procedures import generate_procedures_for_resident
 from generators.encounters import generate_encounters_for_resident
 from generators.goals import generate_goals
+from generators import residents as residents_module
+from generators.residents import (
+    DEFAULT_PROVIDER_ID,
+    SyntheticResidents,
+    facility_providers,
+    facility_staff_ids,
+    provider_ids,
+    synthesise_facilities,
+)
+from pipeline.compression import (
+    COMPRESSIONS,
+    CompressionError,
+    load_dictionary,
+    save_dictionaries,
+    train_dictionaries,
+)
+from pipeline.bigquery import BIGQUERY_FORMATS, BIGQUERY_TABLES, BigQueryExport
+from pipeline.cache import GeneratorCache, merge_cache_stats
+from pipeline.checkpoint import (
+    RESIDENTS_FILE as CHECKPOINT_RESIDENTS_FILE,
+    CheckpointError,
+    load_progress,
+    load_run,
+    save_progress,
+    start_checkpoints,
+)
+from pipeline.encryption import LocalKms, ResidentKeys, encrypt_resident_documents
+from pipeline.manifest import (
+    CONTENT_MANIFEST_FILE,
+    config_digest,
+    content_manifest,
+    save_manifest,
+    source_digest,
+)
+from pipeline.parquet import PARQUET_COLUMNS, ClinicalParquetExport
+from pipeline.partitions import MANIFEST_FILE, PARTITION_MODES, PartitionedWriters
+from pipeline.profiling import Profiler
+from pipeline.schemas import VALIDATED_COLLECTIONS, SchemaError, SchemaValidator
+from pipeline.serialisers import SERIALISERS, get_serialiser
+from pipeline.writers import (
+    OUTPUT_FORMATS,
+    JsonArrayWriter,
+    JsonlWriter,
+    PayloadWriter,
+    open_writers,
+    close_writers,
+    merge_shards,
+)
 
 # --- Configuration ---
 RESIDENTS_FILE = "demo-data/residents/data-plain.json"
 SUBCOLLECTIONS_DIR = "demo-data"
+# Residents synthesised with --residents, and everything generated for them,
+# go here by default, so a capacity run never overwrites the hand-made data
+SYNTHETIC_DIR = os.path.join(SUBCOLLECTIONS_DIR, "synthetic")
 SUBCOLLECTION_FILES = {
     "allergies": "allergies/data-plain.json",
     "prescriptions": "prescriptions/data-plain.json",
@@ -58,6 +120,56 @@ SUBCOLLECTION_FILES = {
     "encounters": "encounters/data-plain.json",
     "goals": "goals/data-plain.json",
 }
+# Enriched residents are written alongside their subcollections
+OUTPUT_FILES = {
+    "residents": os.path.relpath(RESIDENTS_FILE, SUBCOLLECTIONS_DIR)
+} | SUBCOLLECTION_FILES
+# Worker shards, relative to the output dir like the paths below
+SHARDS_DIR = "shards"
+# Only written when residents are synthesised with --residents; with
+# --providers each provider's facilities are written to its own file
+FACILITIES_FILE = "facilities/data.json"
+PROVIDER_FACILITIES_FILE = "providers/{provider_id}/facilities/data.json"
+SYNTHESISED_FILES = {"emergency_contacts": "emergency_contacts/data-plain.json"}
+# Hand-made contacts of the hand-made residents, read back for --encrypt
+EMERGENCY_CONTACTS_FILE = "demo-data/emergency_contacts/data-plain.json"
+# --encrypt writes every resident and subcollection document here, as the
+# {path, data} lines generate-encrypted-payload/main.ts produces
+ENCRYPTED_PAYLOAD_FILE = "firestore-encrypted-payload.jsonl"
+DEFAULT_KEK_FILE = os.path.join(SUBCOLLECTIONS_DIR, "local-kms.json")
+# --bigquery writes load files for the *_raw tables here, one per event date
+BIGQUERY_DIR = "bigquery"
+# --parquet writes flattened eMAR, observations and encounters here
+PARQUET_DIR = "parquet"
+# --partition-by splits the per-collection files and the encrypted payload
+# into one directory per partition here, listed in its manifest.json
+PARTITIONS_DIR = "partitions"
+# Outputs besides the per-collection files, by path relative to the output dir
+EXTRA_OUTPUTS = {
+    "encrypted_payload": ENCRYPTED_PAYLOAD_FILE,
+    "bigquery": BIGQUERY_DIR,
+    "parquet": PARQUET_DIR,
+    "partitions": PARTITIONS_DIR,
+}
+# --zstd-dict saves the dictionary each collection was compressed with here;
+# `zstd -D <dir>/<collection>.dict -d` needs it to decompress
+ZSTD_DICT_DIR = "zstd-dicts"
+# Code whose changes can change the output, hashed into the content
+# manifest as its generator version
+DEV_UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATOR_SOURCES = [
+    os.path.abspath(__file__),
+    os.path.join(DEV_UTILS_DIR, "generators"),
+    os.path.join(DEV_UTILS_DIR, "pipeline"),
+]
+# --cache keeps generator results here, evicting the least recently used
+# beyond --cache-mb
+GENERATOR_CACHE_FILE = os.path.join(SUBCOLLECTIONS_DIR, "generator-cache.sqlite")
+# --checkpoint-every saves each resident range's progress here, and --resume
+# picks the run up from it; it is removed once the run completes
+CHECKPOINT_DIR = "checkpoint"
+# --profile writes <prefix>.txt and <prefix>.pstats
+PROFILE_PREFIX = os.path.join(SUBCOLLECTIONS_DIR, "profile")
 
 SNOMED_DISORDERS_FILE = "demo-data/snomed-examples/disorders.txt"
 SNOMED_ALLERGY_NAMES_FILE = "demo-data/snomed-examples/allergies/name.txt"
@@ -65,206 +177,1010 @@ SNOMED_ALLERGY_REACTIONS_FILE = "demo-data/snomed-examples/allergies/reaction.tx
 SNOMED_ALLERGY_SUBSTANCES_FILE = "demo-data/snomed-examples/allergies/substance.txt"
 
 
-# --- Main Script ---
-if __name__ == "__main__":
-    START_DATE = pytz.utc.localize(datetime(2023, 1, 1))
-    INTERMEDIARY_DATE = pytz.utc.localize(datetime(2024, 1, 1))
-    # General END_DATE can be in the future for things like prescriptions, care plans
-    END_DATE = datetime.now(pytz.utc) + timedelta(days=365)
-    # Financial END_DATE should only be up to the present
-    FINANCIAL_END_DATE = datetime.now(pytz.utc)
-    NUM_STAFF = 6
-    STAFF_IDS = [generate_uuid() for _ in range(NUM_STAFF)]
+# --- Generation ---
+def load_reference_data() -> dict:
+    """Loads the SNOMED and LOINC lookups shared by every resident."""
+    return {
+        "snomed_allergy_names": load_snomed_file(SNOMED_ALLERGY_NAMES_FILE),
+        "snomed_allergy_reactions": load_allergy_reactions(
+            SNOMED_ALLERGY_REACTIONS_FILE
+        ),
+        "snomed_allergy_substances": load_snomed_file(SNOMED_ALLERGY_SUBSTANCES_FILE),
+        "snomed_disorders": load_snomed_file(SNOMED_DISORDERS_FILE),
+        "loinc_codes": get_loinc_codes(VITAL_RANGES),
+    }
 
-    os.makedirs(os.path.dirname(RESIDENTS_FILE), exist_ok=True)
 
-    try:
-        with open(RESIDENTS_FILE, "r") as f:
-            residents_data = json.load(f)
-    except FileNotFoundError:
-        print(f"Error: Residents file not found at {RESIDENTS_FILE}.")
-        exit(1)
+def call_generator(name: str, generator, *args):
+    """Calls a generator directly, when no `GeneratorCache` is in use."""
+    return generator(*args)
 
-    all_allergies = []
-    all_prescriptions = []
-    all_observations = []
-    all_diagnostic_history = []
-    all_claims = []
-    all_accounts = []
-    all_charges = []
-    all_payments = []
-    all_adjustments = []
-    all_coverages = []
-    all_prescription_administration = []
-    all_episodes_of_care = []
-    all_care_plans = []
-    all_care_plan_activities = []
-    all_identifiers = []
-    all_tasks = []
-    all_procedures = []
-    all_encounters = []
-    all_goals = []
-    all_goal_ids = []
-    all_addresses = []
-
-    snomed_allergy_names = load_snomed_file(SNOMED_ALLERGY_NAMES_FILE)
-    snomed_allergy_reactions = load_allergy_reactions(SNOMED_ALLERGY_REACTIONS_FILE)
-    snomed_allergy_substances = load_snomed_file(SNOMED_ALLERGY_SUBSTANCES_FILE)
-    snomed_disorders = load_snomed_file(SNOMED_DISORDERS_FILE)
-    loinc_codes = get_loinc_codes(VITAL_RANGES)
-
-    for i, resident in enumerate(residents_data):
-        resident_id = resident["id"]
-        resident["data"]["resident_code"] = f"{i+1:05d}"  # Add resident_code
-        resident["data"]["created_at"] = get_random_datetime(START_DATE, END_DATE)
-
-        # Decide whether to deactivate the resident (e.g., 20% chance)
-        if random() < 0.2:
-            # Ensure deactivation date is after creation date
-            deactivation_start_date = resident["data"]["created_at"]
-            resident["data"]["deactivated_at"] = get_random_datetime(
-                deactivation_start_date, END_DATE
-            )
-        else:
-            resident["data"]["deactivated_at"] = None
 
-        # Determine the effective end date for generating subcollection data
-        effective_end_date = (
-            resident["data"]["deactivated_at"]
-            if resident["data"]["deactivated_at"]
-            else END_DATE
+def generate_resident_records(
+    index: int, resident: dict, run: dict, cache=None
+) -> dict:
+    """Enriches one resident in place and returns its records keyed by subcollection.
+
+    `run` holds the run-wide settings: seed, dates, window, vitals_every,
+    reference and total_residents. Every generator draws from its own stream seeded by the
+    seed, the resident ID and the subcollection, so a resident's output does
+    not depend on which residents were generated before it or in which process.
+    Staff come from the roster of the resident's facility. With a `cache`,
+    generators whose code, config and inputs are unchanged are not rerun.
+    """
+    seed, dates, reference = (
+        run["seed"],
+        run["dates"],
+        run["reference"],
+    )
+    resident_id = resident["id"]
+    generate = partial(cache.call, seed, resident_id) if cache else call_generator
+    staff_ids = facility_staff_ids(seed, resident["data"]["facility_id"])
+    seed_stream(seed, resident_id, "residents")
+    resident["data"]["resident_code"] = allocate_resident_code(
+        index, run["total_residents"]
+    )
+    resident["data"]["created_at"] = get_random_datetime(dates["start"], dates["end"])
+
+    # Decide whether to deactivate the resident (e.g., 20% chance)
+    if random() < 0.2:
+        # Ensure deactivation date is after creation date
+        deactivation_start_date = resident["data"]["created_at"]
+        resident["data"]["deactivated_at"] = get_random_datetime(
+            deactivation_start_date, dates["end"]
         )
+    else:
+        resident["data"]["deactivated_at"] = None
 
-        # Ensure financial data does not go past the current date or deactivation date
-        effective_financial_end_date = min(effective_end_date, FINANCIAL_END_DATE)
-
-        # Generate data for each subcollection
-        goal_data = generate_goals(resident_id)
-        all_allergies.extend(
-            generate_allergies_for_resident(
-                resident_id,
-                STAFF_IDS,
-                START_DATE,
-                effective_end_date, # Use general effective_end_date for clinical
-                snomed_allergy_names,
-                snomed_allergy_reactions,
-                snomed_allergy_substances,
-            )
+    # Determine the effective end date for generating subcollection data
+    effective_end_date = (
+        resident["data"]["deactivated_at"]
+        if resident["data"]["deactivated_at"]
+        else dates["end"]
+    )
+
+    # Ensure financial data does not go past the current date or deactivation date
+    effective_financial_end_date = min(effective_end_date, dates["financial_end"])
+
+    records = {}
+
+    # Generate data for each subcollection
+    seed_stream(seed, resident_id, "goals")
+    goal_data = generate("goals", generate_goals, resident_id)
+    seed_stream(seed, resident_id, "allergies")
+    records["allergies"] = generate(
+        "allergies",
+        generate_allergies_for_resident,
+        resident_id,
+        staff_ids,
+        dates["start"],
+        effective_end_date,  # Use general effective_end_date for clinical
+        reference["snomed_allergy_names"],
+        reference["snomed_allergy_reactions"],
+        reference["snomed_allergy_substances"],
+    )
+    seed_stream(seed, resident_id, "prescriptions")
+    resident_prescriptions = generate(
+        "prescriptions",
+        generate_prescriptions_for_resident,
+        resident_id,
+        staff_ids,
+        dates["start"],
+        dates["intermediary"],
+        effective_end_date,  # Use general effective_end_date for clinical
+        PRESCRIPTION_TEMPLATES,
+        DOSAGE_INSTRUCTIONS,
+    )
+    records["prescriptions"] = resident_prescriptions
+    seed_stream(seed, resident_id, "prescription_administration")
+    records["prescription_administration"] = (
+        generate(
+            "prescription_administration",
+            generate_prescription_administration_for_resident,
+            resident_id,
+            resident_prescriptions,
+            staff_ids,
+            effective_end_date,
+            *run["window"],
         )
-        resident_prescriptions = generate_prescriptions_for_resident(
+        if resident_prescriptions
+        else []
+    )
+    seed_stream(seed, resident_id, "observations")
+    if run["vitals_every"]:
+        # A continuous series stops at --as-of, like the financial ledger
+        records["observations"] = generate(
+            "observations",
+            generate_vital_series_for_resident,
             resident_id,
-            STAFF_IDS,
-            START_DATE,
-            INTERMEDIARY_DATE,
-            effective_end_date, # Use general effective_end_date for clinical
-            PRESCRIPTION_TEMPLATES,
-            DOSAGE_INSTRUCTIONS,
+            staff_ids,
+            dates["start"],
+            effective_financial_end_date,
+            reference["loinc_codes"],
+            run["vitals_every"],
+            *run["window"],
         )
-        all_prescriptions.extend(resident_prescriptions)
-        if resident_prescriptions:
-            all_prescription_administration.extend(
-                generate_prescription_administration_for_resident(
-                    resident_id, resident_prescriptions, STAFF_IDS, effective_end_date # Use general effective_end_date for clinical
-                )
-            )
-        all_observations.extend(
-            generate_observations_for_resident(
-                resident_id, STAFF_IDS, START_DATE, effective_end_date, loinc_codes # Use general effective_end_date for clinical
-            )
+    else:
+        records["observations"] = generate(
+            "observations",
+            generate_observations_for_resident,
+            resident_id,
+            staff_ids,
+            dates["start"],
+            effective_end_date,
+            reference["loinc_codes"],
+            *run["window"],
         )
-        all_diagnostic_history.extend(
-            generate_diagnostic_history_for_resident(
-                resident_id, STAFF_IDS, START_DATE, effective_end_date, snomed_disorders # Use general effective_end_date for clinical
+    seed_stream(seed, resident_id, "diagnostic_history")
+    records["diagnostic_history"] = generate(
+        "diagnostic_history",
+        generate_diagnostic_history_for_resident,
+        resident_id,
+        staff_ids,
+        dates["start"],
+        effective_end_date,
+        reference["snomed_disorders"],
+    )
+    seed_stream(seed, resident_id, "episodes_of_care")
+    episodes_of_care_data = generate(
+        "episodes_of_care", generate_episodes_of_care_for_resident, resident_id
+    )
+    records["episodes_of_care"] = episodes_of_care_data
+    records["goals"] = goal_data["goals"]
+    seed_stream(seed, resident_id, "care_plans")
+    care_plan_data = generate(
+        "care_plans",
+        generate_care_plans_for_resident,
+        resident_id,
+        staff_ids,
+        dates["start"],
+        effective_end_date,
+        goal_data["goal_ids"],
+    )
+    records["care_plans"] = care_plan_data["care_plans"]
+    records["care_plan_activities"] = care_plan_data["care_plan_activities"]
+    seed_stream(seed, resident_id, "addresses")
+    records["addresses"] = generate(
+        "addresses", generate_address_for_resident, resident_id
+    )
+    records["identifiers"] = generate_identifiers_for_resident(
+        resident_id, resident["data"]["resident_code"]
+    )
+    seed_stream(seed, resident_id, "financials")
+    financial_data = generate(
+        "financials",
+        generate_financial_data_for_resident,
+        resident_id,
+        resident["data"]["resident_name"],
+        # Billing starts when the resident is admitted
+        resident["data"]["created_at"],
+        effective_financial_end_date,  # Use financial effective_end_date
+    )
+    for name in [
+        "accounts",
+        "charges",
+        "claims",
+        "coverages",
+        "payments",
+        "adjustments",
+    ]:
+        records[name] = financial_data[name]
+
+    seed_stream(seed, resident_id, "tasks")
+    records["tasks"] = generate(
+        "tasks",
+        generate_tasks_for_resident,
+        resident_id,
+        staff_ids,
+        dates["start"],
+        effective_end_date,
+        *run["window"],
+    )
+    seed_stream(seed, resident_id, "procedures")
+    records["procedures"] = generate(
+        "procedures",
+        generate_procedures_for_resident,
+        resident_id,
+        resident["data"]["resident_name"],
+        staff_ids,
+        dates["start"],
+        effective_end_date,
+        *run["window"],
+    )
+    seed_stream(seed, resident_id, "encounters")
+    records["encounters"] = generate(
+        "encounters",
+        generate_encounters_for_resident,
+        resident_id,
+        resident["data"]["resident_name"],
+        staff_ids,
+        dates["start"],
+        effective_end_date,
+        choice(episodes_of_care_data)["id"],
+        *run["window"],
+    )
+    return records
+
+
+def open_resident_writers(
+    base_dir: str, files: dict, output: dict, run: dict, states=None
+) -> dict:
+    """Opens the plaintext writers plus the --encrypt payload, which --partition-by splits."""
+    states = states or {}
+    writers = open_writers(base_dir, files, output, states)
+    os.makedirs(base_dir, exist_ok=True)
+    if run["kek_file"]:
+        writers["encrypted_payload"] = PayloadWriter(
+            os.path.join(base_dir, EXTRA_OUTPUTS["encrypted_payload"]),
+            get_serialiser(output["serialiser"]),
+            state=states.get("encrypted_payload"),
+        )
+    return writers
+
+
+def open_run_writers(
+    base_dir: str, files: dict, output: dict, run: dict, states=None
+) -> dict:
+    """Opens the resident writers, whole or partitioned, plus --bigquery and --parquet.
+
+    `states` maps outputs to the checkpoint states they are reopened from,
+    when resuming.
+    """
+    states = states or {}
+    if output["partition_by"]:
+        writers = {
+            "partitions": PartitionedWriters(
+                os.path.join(base_dir, EXTRA_OUTPUTS["partitions"]),
+                partial(open_resident_writers, files=files, output=output, run=run),
+                output["partition_by"],
+                output["partitions"],
+                int(output["partition_mb"] * 2**20),
             )
+        }
+    else:
+        writers = open_resident_writers(base_dir, files, output, run, states)
+    os.makedirs(base_dir, exist_ok=True)
+    serialiser = get_serialiser(output["serialiser"])
+    if output["bigquery"]:
+        writers["bigquery"] = BigQueryExport(
+            os.path.join(base_dir, EXTRA_OUTPUTS["bigquery"]),
+            serialiser,
+            output["bigquery"],
+            state=states.get("bigquery"),
         )
-        episodes_of_care_data = generate_episodes_of_care_for_resident(resident_id)
-        all_episodes_of_care.extend(episodes_of_care_data)
-        all_goals.extend(goal_data["goals"])
-        all_goal_ids.extend(goal_data["goal_ids"])
-        care_plan_data = generate_care_plans_for_resident(
-            resident_id, STAFF_IDS, START_DATE, effective_end_date, all_goal_ids # Use general effective_end_date for clinical
+    if output["parquet"]:
+        writers["parquet"] = ClinicalParquetExport(
+            os.path.join(base_dir, EXTRA_OUTPUTS["parquet"])
         )
-        all_care_plans.extend(care_plan_data["care_plans"])
-        all_care_plan_activities.extend(care_plan_data["care_plan_activities"])
-        all_addresses.extend(generate_address_for_resident(resident_id))
-        all_identifiers.extend(
-            generate_identifiers_for_resident(
-                resident_id, resident["data"]["resident_code"]
-            )
+    return writers
+
+
+def train_output_dictionaries(
+    residents, files: dict, output: dict, run: dict, sample_size: int
+) -> dict:
+    """Trains a zstd dictionary per collection on the records of the first residents.
+
+    The sample residents are generated from copies, with the same seeded
+    streams as the run itself, so training leaves the output unchanged.
+    """
+    serialiser = get_serialiser(output["serialiser"])
+    run = run | {"reference": load_reference_data()}
+    samples = {name: [] for name in files}
+    for index, resident in enumerate(copy.deepcopy(list(residents[:sample_size]))):
+        contacts = resident.pop("emergency_contacts", [])
+        records = generate_resident_records(index, resident, run)
+        records |= {"residents": [resident], "emergency_contacts": contacts}
+        for name, sample in samples.items():
+            sample.extend(serialiser.dumps(record) for record in records[name])
+    return train_dictionaries(samples, output["compress_level"])
+
+
+def checkpoint_residents(
+    writers: dict, start: int, done: int, schemas, cache, checkpoint_dir: str
+) -> None:
+    """Flushes every output of a resident range to disk and saves how far it has got.
+
+    Each resident draws from freshly seeded streams, so the schema sampler
+    is the only random state carried from one resident to the next.
+    """
+    save_progress(
+        checkpoint_dir,
+        start,
+        {
+            "done": done,
+            "writers": {name: writer.checkpoint() for name, writer in writers.items()},
+            "schemas": schemas.checkpoint() if schemas else None,
+            "cache": cache.stats if cache else {},
+        },
+    )
+
+
+def generate_residents(
+    writers: dict, start: int, residents, run: dict, progress=None
+) -> dict:
+    """Generates a contiguous run of residents, streaming records to `writers`.
+
+    With --encrypt each resident is also encrypted as soon as it is
+    generated, so encryption runs in whichever process generated it; it
+    has no pool of its own, so under --workers 1 it runs serially. A
+    sample of financial records is checked against the BigQuery schema
+    files before anything is written. With --partition-by, each resident's
+    documents go to the writers of its partition. With --providers, payload
+    paths start at `providers/<id>/`. With --cache, generator results are
+    reused from the cache, and its hit and miss counts are returned. With
+    --checkpoint-every, progress is saved every that many residents and
+    once all are done; a saved `progress` skips the residents it covers.
+    """
+    partitions = writers.get("partitions")
+    bigquery = writers.get("bigquery")
+    parquet = writers.get("parquet")
+    checkpoint = run["checkpoint"]
+    progress = progress or {"done": 0, "schemas": None, "cache": {}}
+    keys = ResidentKeys(LocalKms(run["kek_file"])) if run["kek_file"] else None
+    cache = (
+        GeneratorCache(
+            run["cache"]["path"],
+            run["cache"]["max_bytes"],
+            [*run["reference"].values(), PRESCRIPTION_TEMPLATES, DOSAGE_INSTRUCTIONS],
         )
-        financial_data = generate_financial_data_for_resident(
-            resident_id, resident["data"]["resident_name"], START_DATE, effective_financial_end_date # Use financial effective_end_date
+        if run["cache"]
+        else None
+    )
+    if cache:
+        cache.stats = progress["cache"]
+    schemas = (
+        SchemaValidator(
+            run["schema_sample"], f"{run['seed']}:{start}", progress["schemas"]
         )
-        all_accounts.extend(financial_data["accounts"])
-        all_charges.extend(financial_data["charges"])
-        all_claims.extend(financial_data["claims"])
-        all_coverages.extend(financial_data["coverages"])
-        all_payments.extend(financial_data["payments"])
-        all_adjustments.extend(financial_data["adjustments"])
-
-        all_tasks.extend(
-            generate_tasks_for_resident(resident_id, STAFF_IDS, START_DATE, effective_end_date) # Use general effective_end_date for clinical
+        if run["schema_sample"]
+        else None
+    )
+    done = progress["done"]
+    for offset, resident in enumerate(residents[done:], done):
+        # Synthesised residents carry their emergency contacts with them
+        contacts = resident.pop("emergency_contacts", None)
+        records = generate_resident_records(start + offset, resident, run, cache)
+        if contacts is not None:
+            records = {"emergency_contacts": contacts} | records
+        if schemas:
+            for name in VALIDATED_COLLECTIONS:
+                schemas.validate(name, records[name])
+        provider_id = run["providers"].get(
+            resident["data"]["facility_id"], DEFAULT_PROVIDER_ID
         )
-        all_procedures.extend(
-            generate_procedures_for_resident(
-                resident_id,
-                resident["data"]["resident_name"],
-                STAFF_IDS,
-                START_DATE,
-                effective_end_date, # Use general effective_end_date for clinical
-            )
+        resident_writers = (
+            partitions.writers_for(start + offset, resident, provider_id)
+            if partitions
+            else writers
         )
-        all_encounters.extend(
-            generate_encounters_for_resident(
-                resident_id,
-                resident["data"]["resident_name"],
-                STAFF_IDS,
-                START_DATE,
-                effective_end_date, # Use general effective_end_date for clinical
-                choice(episodes_of_care_data)["id"],
+        payload = resident_writers.get("encrypted_payload")
+        if "residents" in resident_writers:
+            resident_writers["residents"].write([resident])
+            for name, items in records.items():
+                resident_writers[name].write(items)
+        if bigquery:
+            for name in BIGQUERY_TABLES:
+                bigquery.write(
+                    name, [resident] if name == "residents" else records[name]
+                )
+        if parquet:
+            for name in PARQUET_COLUMNS:
+                parquet.write(name, records[name])
+        if payload:
+            if contacts is None:
+                contacts = run["emergency_contacts"].get(resident["id"], [])
+                records = {"emergency_contacts": contacts} | records
+            prefix = f"providers/{provider_id}/" if run["providers"] else ""
+            payload.write_resident(
+                encrypt_resident_documents(resident, records, keys.next(), prefix),
+                {"residents": [resident]} | records,
+                prefix,
+            )
+        if checkpoint and (offset + 1) % checkpoint["every"] == 0:
+            checkpoint_residents(
+                writers, start, offset + 1, schemas, cache, checkpoint["dir"]
             )
+    if checkpoint:
+        checkpoint_residents(
+            writers, start, len(residents), schemas, cache, checkpoint["dir"]
         )
+    if cache is None:
+        return {}
+    cache.close()
+    return cache.stats
+
+
+def generate_shard(
+    shard_dir: str, files: dict, output: dict, start: int, residents, run: dict
+) -> dict:
+    """Process-pool entry point: writes one resident range to its own shard files.
+
+    With --checkpoint-every, the range resumes from its last checkpoint, if
+    it has one.
+    """
+    progress = (
+        load_progress(run["checkpoint"]["dir"], start) if run["checkpoint"] else None
+    )
+    writers = open_run_writers(
+        shard_dir, files, output, run, progress and progress["writers"]
+    )
+    cache_stats = generate_residents(
+        writers, start, residents, run | {"reference": load_reference_data()}, progress
+    )
+    close_writers(writers)
+    return {
+        "dir": shard_dir,
+        "cache": cache_stats,
+        "counts": {name: writer.count for name, writer in writers.items()},
+        "contents": {
+            name: writer.content()
+            for name, writer in writers.items()
+            if isinstance(writer, (JsonArrayWriter, JsonlWriter))
+        },
+    }
+
+
+def print_cache_stats(stats: dict) -> None:
+    hits = sum(counts["hits"] for counts in stats.values())
+    misses = sum(counts["misses"] for counts in stats.values())
+    print(f"Generator cache: {hits} hits, {misses} misses.")
+    recomputed = [
+        f"{name} ({counts['misses']})"
+        for name, counts in stats.items()
+        if counts["misses"]
+    ]
+    if recomputed:
+        print(f"Recomputed: {', '.join(recomputed)}.")
+
+
+def output_shards(writers: dict, base_dir: str) -> dict:
+    """The content manifest entries of the closed collection and payload files.
+
+    Partitioned runs list each partition's files; --bigquery and --parquet
+    outputs are not uploaded to Firestore, so they are left out.
+    """
+    shards = {}
+    if "partitions" in writers:
+        partitions_dir = os.path.relpath(writers["partitions"].path, base_dir)
+        for partition in writers["partitions"].manifest["partitions"]:
+            for name, file in partition["files"].items():
+                path = os.path.join(partitions_dir, file["path"])
+                shards[path] = {"collection": name} | file | {"path": path}
+        return shards
+    for name, writer in writers.items():
+        if isinstance(writer, (JsonArrayWriter, JsonlWriter)):
+            path = os.path.relpath(writer.path, base_dir)
+            shards[path] = {
+                "collection": name,
+                "path": path,
+                "bytes": os.path.getsize(writer.path),
+            } | writer.content()
+    return shards
 
-    # --- Write Updated Residents Data Back to File ---
-    os.makedirs(os.path.dirname(RESIDENTS_FILE), exist_ok=True)
-    with open(RESIDENTS_FILE, "w") as f:
-        residents_data=convert_times(residents_data)
-        json.dump(residents_data, f, indent=2) # Use default=str for datetime objects
 
-    print("Resident data updated with created_at and deactivated_at.")
+def instrument_run(profiler: Profiler) -> None:
+    """Wraps each stage of the run, and every generator used here, for --profile."""
+    module = sys.modules[__name__]
+    for name, value in list(vars(module).items()):
+        if name.startswith("generate_") and getattr(value, "__module__", "").startswith(
+            "generators."
+        ):
+            profiler.instrument(module, name, f"generator: {name}")
+    # Each resident is a sample, timed or traced as a whole
+    profiler.instrument(
+        module, "generate_resident_records", "stage: generate", sample=True
+    )
+    profiler.instrument(
+        residents_module, "synthesise_resident_batch", "stage: synthesise"
+    )
+    # Serialising is timed per batch a writer encodes, not per record: a
+    # section costs microseconds of its own, which per record would swamp
+    # the framing and I/O left in "stage: write"
+    for writer_class in (JsonArrayWriter, JsonlWriter):
+        profiler.instrument(writer_class, "encode", "stage: serialise")
+        profiler.instrument(writer_class, "write", "stage: write")
+    profiler.instrument(PayloadWriter, "write_resident", "stage: write")
+    profiler.instrument(module, "encrypt_resident_documents", "stage: encrypt")
+    profiler.instrument(BigQueryExport, "write", "stage: bigquery")
+    profiler.instrument(ClinicalParquetExport, "write", "stage: parquet")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generates FHIR-aligned demo data for residents and their subcollections."
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help="json writes an array with one record per line; jsonl writes one document per line.",
+    )
+    parser.add_argument(
+        "--indent",
+        action="store_true",
+        help="Pretty-print --format json with two-space indentation.",
+    )
+    parser.add_argument(
+        "--serialiser",
+        choices=["auto", *SERIALISERS],
+        default="auto",
+        help="JSON encoder; auto picks orjson or msgspec when installed, else the standard library.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Split residents across this many processes, then merge their shards.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Master seed; the same seed and --as-of reproduce the output byte for byte.",
+    )
+    parser.add_argument(
+        "--as-of",
+        type=date.fromisoformat,
+        default=date.today(),
+        help="Date treated as today (YYYY-MM-DD). Defaults to the current date.",
+    )
+    parser.add_argument(
+        "--since",
+        type=date.fromisoformat,
+        default=None,
+        help="Only emit eMAR, observations, tasks, procedures and encounters from this date (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--until",
+        type=date.fromisoformat,
+        default=None,
+        help="Only emit those events up to the end of this date (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--vitals-every",
+        type=float,
+        metavar="HOURS",
+        help="Generate a continuous series of every vital sign at this cadence, up to --as-of, instead of a few spot readings.",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=COMPRESSIONS,
+        default=None,
+        help="Compress each collection's file as it is written, adding .gz or .zst to its name.",
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        default=None,
+        help="Compression level (default: 6 for gzip, 3 for zstd).",
+    )
+    parser.add_argument(
+        "--zstd-dict",
+        type=int,
+        default=None,
+        metavar="RESIDENTS",
+        help=f"With --compress zstd, train a dictionary per collection on this many residents' records and save them to {ZSTD_DICT_DIR}/ in the output dir.",
+    )
+    parser.add_argument(
+        "--residents",
+        type=int,
+        default=None,
+        help=f"Synthesise this many residents instead of reading {RESIDENTS_FILE}, writing them to {SYNTHETIC_DIR}/ by default.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help=f"Directory the dataset is written to (default: {SUBCOLLECTIONS_DIR}, or {SYNTHETIC_DIR} with --residents).",
+    )
+    parser.add_argument(
+        "--facilities",
+        type=int,
+        default=10,
+        help="Number of facilities synthesised residents are spread across (per provider with --providers).",
+    )
+    parser.add_argument(
+        "--providers",
+        type=int,
+        default=None,
+        help="With --residents, synthesise this many providers of --facilities each, and write payload paths from providers/<id>/.",
+    )
+    parser.add_argument(
+        "--bigquery",
+        choices=BIGQUERY_FORMATS,
+        default=None,
+        help=f"Also write load files for the BigQuery *_raw tables to {BIGQUERY_DIR}/ in the output dir, one per event date.",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help=f"Also write eMAR, observations and encounters as flattened monthly Parquet files to {PARQUET_DIR}/ in the output dir.",
+    )
+    parser.add_argument(
+        "--partition-by",
+        choices=PARTITION_MODES,
+        default=None,
+        help=f"Split the per-collection files and the encrypted payload by provider, facility, resident hash bucket or size into {PARTITIONS_DIR}/ in the output dir, with a {MANIFEST_FILE}.",
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=16,
+        help="Number of hash buckets for --partition-by hash.",
+    )
+    parser.add_argument(
+        "--partition-mb",
+        type=float,
+        default=256,
+        help="Uncompressed size at which --partition-by size starts a new partition. With --workers, each worker cuts its own residents, so the partitions depend on the worker count.",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=f"Reuse generator results from {GENERATOR_CACHE_FILE} where a generator's code, config and inputs are unchanged.",
+    )
+    parser.add_argument(
+        "--cache-mb",
+        type=float,
+        default=4096,
+        help="Size beyond which the least recently used cache entries are evicted.",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=None,
+        metavar="RESIDENTS",
+        help=f"Save progress to {CHECKPOINT_DIR}/ in the output dir every this many residents, so an interrupted run can be resumed.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted --checkpoint-every run from its last checkpoint; pass the same options again.",
+    )
+    parser.add_argument(
+        "--schema-sample",
+        type=float,
+        default=0.01,
+        metavar="RATE",
+        help="Share of charges, claims, payments and adjustments checked against their BigQuery schema files (0 disables; the first of each is always checked).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Time and trace allocations per stage and generator; writes {PROFILE_PREFIX}.txt and .pstats.",
+    )
+    parser.add_argument(
+        "--encrypt",
+        action="store_true",
+        help=f"Also envelope-encrypt every document into {ENCRYPTED_PAYLOAD_FILE} in the output dir.",
+    )
+    parser.add_argument(
+        "--kek-file",
+        default=DEFAULT_KEK_FILE,
+        help="Local KEK file standing in for Cloud KMS; created on first use.",
+    )
+    parser.add_argument(
+        "--no-plaintext",
+        action="store_true",
+        help="With --encrypt, skip the plaintext data-plain files.",
+    )
+    return parser.parse_args()
+
+
+# --- Main Script ---
+if __name__ == "__main__":
+    args = parse_args()
+    if args.profile and args.workers > 1:
+        print("Error: --profile only supports --workers 1.")
+        exit(1)
+    if args.vitals_every is not None and args.vitals_every <= 0:
+        print("Error: --vitals-every must be a positive number of hours.")
+        exit(1)
+    if args.zstd_dict is not None and (args.compress != "zstd" or args.zstd_dict < 1):
+        print("Error: --zstd-dict requires --compress zstd and at least one resident.")
+        exit(1)
+    if args.providers is not None and (args.residents is None or args.providers < 1):
+        print("Error: --providers requires --residents and at least one provider.")
+        exit(1)
+    if args.cache_mb <= 0:
+        print("Error: --cache-mb must be positive.")
+        exit(1)
+    if args.partitions < 1 or args.partition_mb <= 0:
+        print("Error: --partitions and --partition-mb must be positive.")
+        exit(1)
+    if args.no_plaintext and not args.encrypt:
+        print("Error: --no-plaintext requires --encrypt.")
+        exit(1)
+    if args.output_dir is not None:
+        OUTPUT_DIR = args.output_dir
+    elif args.residents is not None:
+        OUTPUT_DIR = SYNTHETIC_DIR
+    else:
+        OUTPUT_DIR = SUBCOLLECTIONS_DIR
+    if args.residents is not None and os.path.abspath(OUTPUT_DIR) == os.path.abspath(
+        SUBCOLLECTIONS_DIR
+    ):
+        print(
+            f"Error: synthesised residents cannot be written over the hand-made data in {SUBCOLLECTIONS_DIR}."
+        )
+        exit(1)
+    CHECKPOINT_PATH = os.path.join(OUTPUT_DIR, CHECKPOINT_DIR)
+    ZSTD_DICT_PATH = os.path.join(OUTPUT_DIR, ZSTD_DICT_DIR)
+    SHARDS_PATH = os.path.join(OUTPUT_DIR, SHARDS_DIR)
+    if args.checkpoint_every is not None and args.checkpoint_every < 1:
+        print("Error: --checkpoint-every must be at least one resident.")
+        exit(1)
+    if args.resume and not args.checkpoint_every:
+        print("Error: --resume requires the --checkpoint-every of the interrupted run.")
+        exit(1)
+    if args.checkpoint_every and (args.partition_by or args.parquet):
+        print("Error: --checkpoint-every does not support --partition-by or --parquet.")
+        exit(1)
+    CHECKPOINTED_RUN = {}
+    if args.resume:
+        try:
+            CHECKPOINTED_RUN = load_run(CHECKPOINT_PATH)
+        except CheckpointError as error:
+            print(f"Error: {error}")
+            exit(1)
+    if args.seed is not None:
+        SEED = args.seed
+    elif args.resume:
+        SEED = CHECKPOINTED_RUN["seed"]
+    else:
+        SEED = SystemRandom().randrange(2**32)
+    print(f"Using seed {SEED}.")
+    # Options that shape the records or files, as the manifest's config hash
+    CONFIG = {
+        "seed": SEED,
+        "as_of": args.as_of,
+        "since": args.since,
+        "until": args.until,
+        "vitals_every": args.vitals_every,
+        "residents": args.residents,
+        "facilities": args.facilities,
+        "providers": args.providers,
+        "format": args.format,
+        "indent": args.indent,
+        "serialiser": get_serialiser(args.serialiser).name,
+        "compress": args.compress,
+        "compress_level": args.compress_level,
+        "zstd_dict": args.zstd_dict,
+        "partition_by": args.partition_by,
+        "partitions": args.partitions,
+        "partition_mb": args.partition_mb,
+        "encrypt": args.encrypt,
+        "no_plaintext": args.no_plaintext,
+    }
+    # A run can only be resumed with the code and options it was started
+    # with, including those that decide where the checkpoints fall
+    CHECKPOINT_IDENTITY = {
+        "seed": SEED,
+        "generator_version": source_digest(GENERATOR_SOURCES),
+        "config_hash": config_digest(
+            CONFIG
+            | {
+                "workers": args.workers,
+                "checkpoint_every": args.checkpoint_every,
+                "bigquery": args.bigquery,
+                "schema_sample": args.schema_sample,
+            }
+        ),
+    }
+    if args.resume and CHECKPOINTED_RUN != CHECKPOINT_IDENTITY:
+        print(
+            f"Error: the checkpoint in {CHECKPOINT_PATH} was taken with other options "
+            "or generator code; rerun with the same options, or without --resume."
+        )
+        exit(1)
+    AS_OF = pytz.utc.localize(datetime.combine(args.as_of, time()))
+    DATES = {
+        "start": pytz.utc.localize(datetime(2023, 1, 1)),
+        "intermediary": pytz.utc.localize(datetime(2024, 1, 1)),
+        # General end date can be in the future for things like prescriptions, care plans
+        "end": AS_OF + timedelta(days=365),
+        # Financial end date should only be up to the present
+        "financial_end": AS_OF,
+    }
+    # The window is inclusive of both dates, in UTC
+    WINDOW = (
+        args.since and pytz.utc.localize(datetime.combine(args.since, time())),
+        args.until and pytz.utc.localize(datetime.combine(args.until, time.max)),
+    )
+    output_files = dict(OUTPUT_FILES)
+    # Facility ID to provider ID, with --providers
+    PROVIDERS = {}
+    if args.residents is not None:
+        # Synthesised residents are generated lazily in batches, and their
+        # facilities and emergency contacts are written alongside them.
+        # Provider n owns the nth block of --facilities facilities.
+        num_facilities = args.facilities * (args.providers or 1)
+        residents_data = SyntheticResidents(SEED, args.residents, num_facilities)
+        output_files |= SYNTHESISED_FILES
+        facilities = synthesise_facilities(SEED, num_facilities)
+        if args.providers:
+            PROVIDERS = facility_providers(args.providers, args.facilities)
+            facility_files = {
+                PROVIDER_FACILITIES_FILE.format(provider_id=provider_id): [
+                    facility
+                    for facility in facilities
+                    if PROVIDERS[facility["id"]] == provider_id
+                ]
+                for provider_id in provider_ids(args.providers)
+            }
+        else:
+            facility_files = {FACILITIES_FILE: facilities}
+        for facilities_file, documents in facility_files.items():
+            facilities_path = os.path.join(OUTPUT_DIR, facilities_file)
+            os.makedirs(os.path.dirname(facilities_path), exist_ok=True)
+            with open(facilities_path, "w") as f:
+                json.dump(documents, f, indent=2)
+    else:
+        # The residents file is rewritten as the run goes, so a resumed run
+        # reads the copy taken when it started
+        residents_file = (
+            os.path.join(CHECKPOINT_PATH, CHECKPOINT_RESIDENTS_FILE)
+            if args.resume
+            else RESIDENTS_FILE
+        )
+        try:
+            with open(residents_file, "r") as f:
+                residents_data = json.load(f)
+        except FileNotFoundError:
+            print(f"Error: Residents file not found at {residents_file}.")
+            exit(1)
+    RUN = {
+        "seed": SEED,
+        "providers": PROVIDERS,
+        "dates": DATES,
+        "window": WINDOW,
+        "vitals_every": args.vitals_every,
+        "schema_sample": args.schema_sample,
+        "total_residents": len(residents_data),
+        "kek_file": args.kek_file if args.encrypt else None,
+        "cache": (
+            {"path": GENERATOR_CACHE_FILE, "max_bytes": int(args.cache_mb * 2**20)}
+            if args.cache
+            else None
+        ),
+        "checkpoint": (
+            {"dir": CHECKPOINT_PATH, "every": args.checkpoint_every}
+            if args.checkpoint_every
+            else None
+        ),
+    }
+    RUN["emergency_contacts"] = {}
+    if args.encrypt:
+        # Create the KEK file up front so workers all load the same keys
+        LocalKms(args.kek_file)
+        if args.residents is None:
+            with open(EMERGENCY_CONTACTS_FILE, "r") as f:
+                for contact in json.load(f):
+                    RUN["emergency_contacts"].setdefault(
+                        contact["data"]["resident_id"], []
+                    ).append(contact)
+    if args.no_plaintext:
+        output_files = {}
+    if args.checkpoint_every and not args.resume:
+        start_checkpoints(CHECKPOINT_PATH, CHECKPOINT_IDENTITY)
+        if args.residents is None:
+            shutil.copyfile(
+                RESIDENTS_FILE, os.path.join(CHECKPOINT_PATH, CHECKPOINT_RESIDENTS_FILE)
+            )
 
-    # --- Write Sub-Collection Files (Corrected Pathing) ---
-    for sub_dir, sub_file in SUBCOLLECTION_FILES.items():
-        # Ensure the directory exists (e.g., 'demo-data/allergies')
-        os.makedirs(
-            os.path.join(SUBCOLLECTIONS_DIR, os.path.dirname(sub_file)), exist_ok=True
+    # Records are streamed to their files as each resident is generated, so
+    # memory stays flat regardless of the number of residents. The residents
+    # file has already been read in full, so it is safe to rewrite in place.
+    OUTPUT = {
+        "format": args.format,
+        "serialiser": args.serialiser,
+        "indent": args.indent,
+        "bigquery": args.bigquery,
+        "parquet": args.parquet,
+        "partition_by": args.partition_by,
+        "partitions": args.partitions,
+        "partition_mb": args.partition_mb,
+        "compress": args.compress,
+        "compress_level": args.compress_level,
+        "dictionaries": {},
+    }
+    if args.profile:
+        PROFILER = Profiler()
+        instrument_run(PROFILER)
+        PROFILER.start()
+    # A single process resumes its outputs in place; with --workers, each
+    # worker resumes its shard and the outputs are merged afresh
+    PROGRESS = (
+        load_progress(CHECKPOINT_PATH, 0)
+        if RUN["checkpoint"] and args.workers <= 1
+        else None
+    )
+    if args.resume:
+        print(f"Resuming from the checkpoints in {CHECKPOINT_PATH}.")
+    try:
+        if args.compress == "zstd" and args.resume:
+            # The dictionaries the interrupted run was compressing with
+            for name in output_files:
+                dictionary = load_dictionary(ZSTD_DICT_PATH, name)
+                if dictionary:
+                    OUTPUT["dictionaries"][name] = dictionary
+        elif args.compress == "zstd":
+            if args.zstd_dict:
+                print(f"Training zstd dictionaries on {args.zstd_dict} residents...")
+                OUTPUT["dictionaries"] = train_output_dictionaries(
+                    residents_data, output_files, OUTPUT, RUN, args.zstd_dict
+                )
+            save_dictionaries(OUTPUT["dictionaries"], ZSTD_DICT_PATH)
+        writers = open_run_writers(
+            OUTPUT_DIR,
+            output_files,
+            OUTPUT,
+            RUN,
+            PROGRESS and PROGRESS["writers"],
         )
-        data_map = {
-            "allergies": all_allergies,
-            "prescriptions": all_prescriptions,
-            "observations": all_observations,
-            "diagnostic_history": all_diagnostic_history,
-            "prescription_administration": all_prescription_administration,
-            "episodes_of_care": all_episodes_of_care,
-            "care_plans": all_care_plans,
-            "care_plan_activities": all_care_plan_activities,
-            "identifiers": all_identifiers,
-            "accounts": all_accounts,
-            "charges": all_charges,
-            "claims": all_claims,
-            "coverages": all_coverages,
-            "payments": all_payments,
-            "adjustments": all_adjustments,
-            "tasks": all_tasks,
-            "procedures": all_procedures,
-            "encounters": all_encounters,
-            "goals": all_goals,
-            "addresses": all_addresses,
-        }
-        if sub_dir in data_map:
-            # Write to the full path (e.g., 'demo-data/allergies/data-plain.json')
-            with open(os.path.join(SUBCOLLECTIONS_DIR, sub_file), "w") as f:
-                data = convert_times(data_map[sub_dir])
-                json.dump(data, f, indent=2)
+    except (CompressionError, CheckpointError) as error:
+        print(f"Error: {error}")
+        exit(1)
+    try:
+        if args.workers <= 1:
+            cache_stats = generate_residents(
+                writers,
+                0,
+                residents_data,
+                RUN | {"reference": load_reference_data()},
+                PROGRESS,
+            )
+        else:
+            # Each worker takes a contiguous range of residents, so concatenating
+            # the shards in order reproduces the single-process record order.
+            shard_size = max(1, -(-len(residents_data) // args.workers))
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                futures = [
+                    pool.submit(
+                        generate_shard,
+                        os.path.join(SHARDS_PATH, f"worker-{n:03d}"),
+                        output_files,
+                        OUTPUT,
+                        start,
+                        residents_data[start : start + shard_size],
+                        RUN,
+                    )
+                    for n, start in enumerate(range(0, len(residents_data), shard_size))
+                ]
+                shards = [future.result() for future in futures]
+            cache_stats = {}
+            for shard in shards:
+                merge_cache_stats(cache_stats, shard["cache"])
+            print(f"Merging {len(shards)} shards...")
+            if not args.partition_by:
+                merge_shards(shards, output_files, OUTPUT, writers)
+            for name in EXTRA_OUTPUTS.keys() & writers.keys():
+                for shard in shards:
+                    writers[name].append_shard(
+                        os.path.join(shard["dir"], EXTRA_OUTPUTS[name]),
+                        shard["counts"][name],
+                    )
+                    if name in shard["contents"]:
+                        writers[name].merge_content(shard["contents"][name])
+            shutil.rmtree(SHARDS_PATH)
+    except (SchemaError, CheckpointError) as error:
+        print(f"Error: {error}")
+        exit(1)
+    close_writers(writers)
+    save_manifest(
+        os.path.join(OUTPUT_DIR, CONTENT_MANIFEST_FILE),
+        content_manifest(
+            output_shards(writers, OUTPUT_DIR),
+            source_digest(GENERATOR_SOURCES),
+            CONFIG,
+        ),
+    )
+    if RUN["checkpoint"]:
+        shutil.rmtree(CHECKPOINT_PATH)
+    if args.profile:
+        PROFILER.stop()
+        print(PROFILER.report(PROFILE_PREFIX))
 
+    if args.cache:
+        print_cache_stats(cache_stats)
+    print(f"Wrote {len(residents_data)} residents as {args.format}.")
     print("FHIR-Aligned Demo data generation complete.")
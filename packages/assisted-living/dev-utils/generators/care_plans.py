@@ -9,18 +9,22 @@ def generate_care_plans_for_resident(
     staff_ids: list,
     start_date: datetime,
     end_date: datetime,
-    all_goal_ids: list,
+    goal_ids: list,
 ) -> dict:
-    """Generates a denormalized set of care plan data for a resident."""
+    """Generates a denormalized set of care plan data for a resident.
+
+    `goal_ids` are the resident's own goals from `generate_goals`; the plan
+    references a few of them.
+    """
     care_plans = []
     care_plan_activities = []
 
     # 1. Create the main Care Plan
     care_plan_id = generate_uuid()
 
-    # 2. Select a random subset of goal IDs to reference
+    # 2. Select a random subset of the resident's goal IDs to reference
     selected_goal_ids = random.sample(
-        all_goal_ids, k=min(len(all_goal_ids), random.randint(2, 3))
+        goal_ids, k=min(len(goal_ids), random.randint(2, 3))
     )
 
     care_plan = {
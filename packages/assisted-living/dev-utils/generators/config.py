@@ -1037,3 +1037,58 @@ VITAL_RANGES = {
         },
     },
 }
+
+# Random-walk step of each vital in the time-series mode, as a fraction of its
+# range per sqrt(hour) between readings. Weight drifts far slower than pulse.
+VITAL_WALK_STEPS = {
+    "8480-6": 0.04,
+    "8462-4": 0.04,
+    "8867-4": 0.06,
+    "2708-6": 0.05,
+    "8310-5": 0.05,
+    "29463-7": 0.001,
+}
+# Correlation between the steps of two vitals taken at the same reading;
+# unlisted pairs move independently
+VITAL_CORRELATIONS = {
+    ("8480-6", "8462-4"): 0.7,
+    ("8480-6", "8867-4"): 0.2,
+    ("8462-4", "8867-4"): 0.2,
+    ("8867-4", "8310-5"): 0.3,
+    ("8867-4", "2708-6"): -0.2,
+}
+
+# --- Financial ledger ---
+# Money is simulated in kobo (1/100 naira) and written out in naira
+CURRENCY = "NGN"
+KOBO_PER_NAIRA = 100
+# Monthly rent range in naira; rent rises by RENT_ANNUAL_INCREASE every January
+MONTHLY_RENT_RANGE = (350_000, 1_200_000)
+RENT_ANNUAL_INCREASE = (0.05, 0.10)
+# Ad-hoc services: (service, naira price range, billed to the insurer if covered)
+ADHOC_SERVICES = [
+    ("Physical Therapy", (15_000, 60_000), True),
+    ("Medication Fee", (5_000, 45_000), True),
+    ("Specialist Consultation", (25_000, 150_000), True),
+    ("Laboratory Tests", (8_000, 70_000), True),
+    ("Activities Fee", (5_000, 20_000), False),
+    ("Transportation", (5_000, 35_000), False),
+    ("Hair and Personal Care", (3_000, 15_000), False),
+]
+ADHOC_SERVICES_PER_MONTH = 2.5
+PAYORS = ["HMO-A", "HMO-B", "NHIS"]
+SELF_PAY_SHARE = 0.15
+# Days from the end of a billing cycle to claim submission, from submission
+# to adjudication, and from adjudication to the insurer's payment
+CLAIM_SUBMISSION_LAG_DAYS = (1, 5)
+ADJUDICATION_LAG_DAYS = (7, 45)
+INSURER_PAYMENT_LAG_DAYS = (3, 14)
+# Share of a claim the insurer pays, and of the rest it writes off
+INSURER_SHARE = (0.70, 0.95)
+CONTRACTUAL_WRITE_OFF = (0.0, 0.5)
+# Days from a statement to the resident's payment, and how often they fall short
+RESIDENT_PAYMENT_LAG_DAYS = (5, 25)
+PARTIAL_PAYMENT_RATE = 0.10
+PARTIAL_PAYMENT_SHARE = (0.5, 0.9)
+MISSED_PAYMENT_RATE = 0.05
+RESIDENT_PAYMENT_METHODS = ["Bank Transfer", "Credit Card", "POS", "Cash"]
@@ -1,5 +1,6 @@
 import random
 from datetime import datetime
+import pytz
 from .utils import generate_uuid, get_random_datetime
 from .config import CONDITION_STATUSES
 
@@ -30,10 +31,11 @@ def generate_diagnostic_history_for_resident(
                         "recorder_id": random.choice(staff_ids),
                         "clinical_status": clinical_status,
                         "recorded_date": get_random_datetime(
-                            datetime(2020, 1, 1), end_date
+                            pytz.utc.localize(datetime(2020, 1, 1)), end_date
                         ),
                         "onset_datetime": get_random_datetime(
-                            datetime(2000, 1, 1), datetime(2023, 1, 1)
+                            pytz.utc.localize(datetime(2000, 1, 1)),
+                            pytz.utc.localize(datetime(2023, 1, 1)),
                         ),
                         "abatement_datetime": abatement_date,
                         "code": {
@@ -1,6 +1,6 @@
 import random
 from datetime import timedelta, datetime
-from .utils import generate_uuid, get_random_datetime
+from .utils import generate_uuid, seed_stream, windowed_times
 from .config import ENCOUNTER_STATUSES, ENCOUNTER_TYPES
 
 
@@ -11,14 +11,21 @@ def generate_encounters_for_resident(
     start_date: datetime,
     end_date: datetime,
     episodes_of_care_id: str,
+    since: datetime = None,
+    until: datetime = None,
 ) -> list:
-    """Generates a list of encounters for a resident."""
+    """Generates a list of encounters for a resident.
+
+    Only encounters starting inside the optional `since`/`until` window are built.
+    """
     num_encounters = random.randint(1, 5)
     encounters = []
 
-    for _ in range(num_encounters):
+    for index, encounter_start, key in windowed_times(
+        num_encounters, start_date, end_date, since, until
+    ):
+        seed_stream(key, str(index))
         encounter_type = random.choice(ENCOUNTER_TYPES)
-        encounter_start = get_random_datetime(start_date, end_date)
         encounter_end = encounter_start + timedelta(hours=random.randint(1, 4))
 
         encounter = {
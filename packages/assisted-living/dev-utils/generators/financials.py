@@ -1,192 +1,360 @@
 import random
-from .utils import generate_uuid, get_random_datetime
-from datetime import datetime
+from datetime import datetime, timedelta
+import numpy as np
+from .utils import generate_uuids
+from .config import (
+    ADHOC_SERVICES,
+    ADHOC_SERVICES_PER_MONTH,
+    ADJUDICATION_LAG_DAYS,
+    CLAIM_SUBMISSION_LAG_DAYS,
+    CONTRACTUAL_WRITE_OFF,
+    CURRENCY,
+    INSURER_PAYMENT_LAG_DAYS,
+    INSURER_SHARE,
+    KOBO_PER_NAIRA,
+    MISSED_PAYMENT_RATE,
+    MONTHLY_RENT_RANGE,
+    PARTIAL_PAYMENT_RATE,
+    PARTIAL_PAYMENT_SHARE,
+    PAYORS,
+    RENT_ANNUAL_INCREASE,
+    RESIDENT_PAYMENT_LAG_DAYS,
+    RESIDENT_PAYMENT_METHODS,
+    SELF_PAY_SHARE,
+)
+
+SECONDS_PER_DAY = 86_400
+AVERAGE_MONTH_SECONDS = 30.44 * SECONDS_PER_DAY
+# Shares are applied in integer basis points so every split stays in kobo
+BASIS_POINTS = 10_000
+
+
+def money(kobo: int) -> dict:
+    """The app's `{value, currency}` amount, in naira, for an integer kobo sum."""
+    return {"value": kobo / KOBO_PER_NAIRA, "currency": CURRENCY}
+
+
+def billing_cycles(start_date: datetime, end_date: datetime) -> list:
+    """Boundaries of the monthly billing cycles covering [start_date, end_date].
+
+    The first cycle starts at `start_date` and the last ends at `end_date`;
+    every other boundary is the first of a month.
+    """
+    boundaries = [start_date]
+    month = start_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while True:
+        month = (month + timedelta(days=32)).replace(day=1)
+        if month >= end_date:
+            break
+        boundaries.append(month)
+    boundaries.append(end_date)
+    return boundaries
+
+
+def _lags(rng: np.random.Generator, days: tuple, size: int) -> np.ndarray:
+    """Draws `size` delays, in seconds, of between `days[0]` and `days[1]` days."""
+    return rng.integers(days[0] * SECONDS_PER_DAY, days[1] * SECONDS_PER_DAY, size=size)
+
+
+def _basis_points(rng: np.random.Generator, share: tuple, size: int) -> np.ndarray:
+    low, high = (round(bound * BASIS_POINTS) for bound in share)
+    return rng.integers(low, high + 1, size=size)
 
 
 def generate_financial_data_for_resident(
     resident_id: str, resident_name: str, start_date: datetime, end_date: datetime
 ) -> dict:
-    """Generates a dictionary of related financial data for a single resident."""
-    accounts = []
-    coverages = []
-    all_charges = []
-    claims = []
-    payments = []
-    adjustments = []
+    """Simulates a resident's ledger in monthly billing cycles up to `end_date`.
 
-    # --- 1. Create the main Account for the resident ---
-    account_id = f"acc_{resident_id}"
-    accounts.append(
-        {
-            "id": account_id,
-            "data": {
-                "subject": {"id": resident_id, "name": resident_name},
-                "balance": {"value": 0, "currency": "NGN"},
-                "authored_on": get_random_datetime(start_date, end_date),
-                "billing_status": {
-                    "coding": [
-                        {
-                            "system": "http://hl7.org/fhir/account-billing-status",
-                            "code": "open",
-                            "display": "Open",
-                        }
-                    ]
-                },
-            },
-        }
+    The ledger opens at `start_date`, the resident's admission, so the first
+    cycle runs from then to the next first of a month; a resident admitted
+    after `end_date` has an empty account. Each cycle bills rent on its first day plus a Poisson number of ad-hoc
+    services. For an insured resident, the cycle's insurable charges are
+    claimed a few days after it closes; the claim is adjudicated after a
+    lag, then the insurer pays its share and writes part of the rest off as
+    a contractual adjustment. The remainder is billed to the resident with
+    their self-pay charges, in a statement at the end of every cycle that
+    they pay in full, in part or not at all.
+
+    Only events up to `end_date` are written, so late claims are still
+    `submitted` or `adjudicated`. Every amount is integer kobo until it is
+    written, so the account balance is exactly charges minus payments minus
+    adjustments. Draws are made in NumPy batches per ledger from a
+    generator seeded off the caller's `random` stream.
+    """
+    rng = np.random.default_rng(random.getrandbits(128))
+    end_date = max(end_date, start_date)
+    boundaries = billing_cycles(start_date, end_date)
+    edges = np.array(
+        [int((b - start_date).total_seconds()) for b in boundaries], dtype=np.int64
     )
+    horizon = max(int(edges[-1]), 0)
+    num_cycles = len(edges) - 1 if horizon else 0
+    insured = rng.random() >= SELF_PAY_SHARE
+    payor_org = PAYORS[rng.integers(len(PAYORS))]
 
-    # --- 2. Create Coverage for the resident ---
-    coverage_id = f"cov_{resident_id}"
-    payor_org = "HMO-A"
-    coverages.append(
-        {
-            "id": coverage_id,
-            "data": {
-                "status": "active",
-                "type": "Private Insurance",
-                "beneficiary_id": resident_id,
-                "payor": {"id": f"org_{payor_org}", "organization": payor_org},
-                "period": {
-                    "start": start_date.isoformat(),
-                    "end": end_date.isoformat(),
+    def at(offset) -> datetime:
+        return start_date + timedelta(seconds=int(offset))
+
+    account_id = f"acc_{resident_id}"
+    coverage_id = f"cov_{resident_id}" if insured else None
+    coverages = []
+    if insured:
+        coverages.append(
+            {
+                "id": coverage_id,
+                "data": {
+                    "status": "active",
+                    "type": "NHIS" if payor_org == "NHIS" else "Private Insurance",
+                    "beneficiary_id": resident_id,
+                    "payor": {"id": f"org_{payor_org}", "organization": payor_org},
+                    "period": {
+                        "start": start_date.isoformat(),
+                        "end": end_date.isoformat(),
+                    },
+                    "authored_on": start_date,
                 },
-                "authored_on": get_random_datetime(start_date, end_date),
-            },
-        }
+            }
+        )
+
+    # --- Charges: rent on the first day of each cycle, then ad-hoc services ---
+    rent = int(rng.integers(*MONTHLY_RENT_RANGE)) * KOBO_PER_NAIRA
+    increases = rng.uniform(*RENT_ANNUAL_INCREASE, size=num_cycles)
+    rents = []
+    for cycle in range(num_cycles):
+        if cycle and boundaries[cycle].month == 1:
+            rent = round(rent * (1 + increases[cycle]) / KOBO_PER_NAIRA)
+            rent *= KOBO_PER_NAIRA
+        rents.append(rent)
+
+    lengths = np.diff(edges)[:num_cycles]
+    counts = rng.poisson(ADHOC_SERVICES_PER_MONTH * lengths / AVERAGE_MONTH_SECONDS)
+    adhoc_cycles = np.repeat(np.arange(num_cycles), counts)
+    adhoc_times = edges[adhoc_cycles] + (
+        rng.random(len(adhoc_cycles)) * lengths[adhoc_cycles]
+    ).astype(np.int64)
+    services = rng.integers(len(ADHOC_SERVICES), size=len(adhoc_cycles))
+    price_ranges = np.array([prices for _, prices, _ in ADHOC_SERVICES])
+    adhoc_prices = (
+        rng.integers(price_ranges[services, 0], price_ranges[services, 1] + 1)
+        * KOBO_PER_NAIRA
     )
+    adhoc_quantities = rng.integers(1, 3, size=len(adhoc_cycles))
 
-    # --- 3. Generate All Charges ---
-    total_charges_value = 0
-    for _ in range(random.randint(5, 15)):
-        unit_price_value = round(random.uniform(5000, 150000), 2)
-        quantity = random.randint(1, 2)
-        total_charges_value += unit_price_value * quantity
+    times = np.concatenate([edges[:num_cycles], adhoc_times])
+    cycle_of = np.concatenate([np.arange(num_cycles), adhoc_cycles])
+    prices = np.concatenate([np.array(rents, dtype=np.int64), adhoc_prices])
+    quantities = np.concatenate([np.ones(num_cycles, dtype=np.int64), adhoc_quantities])
+    names = ["Monthly Rent"] * num_cycles + [
+        ADHOC_SERVICES[service][0] for service in services.tolist()
+    ]
+    insurable = np.concatenate(
+        [
+            np.zeros(num_cycles, dtype=bool),
+            np.array([ADHOC_SERVICES[s][2] for s in services.tolist()], dtype=bool),
+        ]
+    )
+    order = np.argsort(times, kind="stable")
+    times, cycle_of, prices, quantities = (
+        times[order],
+        cycle_of[order],
+        prices[order],
+        quantities[order],
+    )
+    names = [names[i] for i in order.tolist()]
+    insurable = insurable[order] & insured
+    amounts = prices * quantities
 
-        charge = {
-            "id": generate_uuid(),
+    charges = [
+        {
+            "id": charge_id,
             "data": {
                 "resident_id": resident_id,
-                "service": random.choice(
-                    [
-                        "Monthly Rent",
-                        "Physical Therapy",
-                        "Medication Fee",
-                        "Specialist Consultation",
-                        "Activities Fee",
-                        "Transportation",
-                    ]
-                ),
+                "service": name,
                 "quantity": quantity,
-                "unit_price": {"value": unit_price_value, "currency": "NGN"},
-                "occurrence_datetime": get_random_datetime(start_date, end_date),
+                "unit_price": money(price),
+                "occurrence_datetime": at(offset),
             },
         }
-        all_charges.append(charge)
+        for charge_id, name, quantity, price, offset in zip(
+            generate_uuids(rng, len(times)),
+            names,
+            quantities.tolist(),
+            prices.tolist(),
+            times.tolist(),
+        )
+    ]
 
-    # --- 4. Separate Claimed vs. Unclaimed Charges ---
-    claimed_charges = random.sample(
-        all_charges, k=min(len(all_charges), random.randint(3, 10))
+    # --- Claims: one per cycle with insurable charges, once it has closed ---
+    submitted = edges[1 : num_cycles + 1] + _lags(
+        rng, CLAIM_SUBMISSION_LAG_DAYS, num_cycles
     )
-    unclaimed_charges = [c for c in all_charges if c not in claimed_charges]
-    total_unclaimed_value = sum(
-        c["data"]["unit_price"]["value"] * c["data"]["quantity"]
-        for c in unclaimed_charges
+    adjudicated = submitted + _lags(rng, ADJUDICATION_LAG_DAYS, num_cycles)
+    insurer_paid = adjudicated + _lags(rng, INSURER_PAYMENT_LAG_DAYS, num_cycles)
+    totals = np.zeros(num_cycles, dtype=np.int64)
+    np.add.at(totals, cycle_of[insurable], amounts[insurable])
+    insurer_shares = totals * _basis_points(rng, INSURER_SHARE, num_cycles)
+    insurer_shares //= BASIS_POINTS
+    write_offs = (totals - insurer_shares) * _basis_points(
+        rng, CONTRACTUAL_WRITE_OFF, num_cycles
     )
+    write_offs //= BASIS_POINTS
+    resident_shares = totals - insurer_shares - write_offs
+    claimed_cycles = np.flatnonzero((totals > 0) & (submitted <= horizon))
 
-    # --- 5. Create a Claim for the claimed charges ---
-    claim_total_value = 0
-    if claimed_charges:
-        claim_total_value = sum(
-            c["data"]["unit_price"]["value"] * c["data"]["quantity"]
-            for c in claimed_charges
-        )
-        claim_id = f"claim_{resident_id}"
+    # Charges sent to the insurer; the resident is billed for everything else
+    insured_ids = set()
+    claimed_charges = {}
+    for charge, cycle, claimable in zip(charges, cycle_of.tolist(), insurable.tolist()):
+        if claimable:
+            insured_ids.add(charge["id"])
+            claimed_charges.setdefault(cycle, []).append(charge["id"])
+
+    claims, payments, adjustments = [], [], []
+    # (time, kobo) the resident owes from each adjudicated claim
+    resident_claim_shares = []
+    claim_ids = generate_uuids(rng, len(claimed_cycles))
+    for claim_id, cycle in zip(claim_ids, claimed_cycles.tolist()):
+        if insurer_paid[cycle] <= horizon:
+            status = "paid"
+        elif adjudicated[cycle] <= horizon:
+            status = "adjudicated"
+        else:
+            status = "submitted"
         claims.append(
             {
                 "id": claim_id,
                 "data": {
                     "resident_id": resident_id,
-                    "authored_on": get_random_datetime(start_date, end_date),
-                    "status": "adjudicated",
+                    "authored_on": at(submitted[cycle]),
+                    "status": status,
                     "coverage_id": coverage_id,
-                    "charge_ids": [c["id"] for c in claimed_charges],
-                    "total": {"value": claim_total_value, "currency": "NGN"},
+                    "charge_ids": claimed_charges[cycle],
+                    "total": money(int(totals[cycle])),
                 },
             }
         )
-
-        # --- 6. Generate Insurer Payment and Adjustment for the Claim ---
-        insurer_paid_amount = round(
-            claim_total_value * random.uniform(0.7, 0.95), 2
-        )
-        patient_responsibility_from_claim = claim_total_value - insurer_paid_amount
-
-        payments.append(
-            {
-                "id": generate_uuid(),
-                "data": {
-                    "resident_id": resident_id,
+        if status == "submitted":
+            continue
+        if write_offs[cycle]:
+            adjustments.append(
+                {
+                    "claim_id": claim_id,
+                    "reason": "Contractual Adjustment",
+                    "approved_amount": int(write_offs[cycle]),
+                    "authored_on": int(adjudicated[cycle]),
+                }
+            )
+        if resident_shares[cycle]:
+            resident_claim_shares.append(
+                (int(adjudicated[cycle]), int(resident_shares[cycle]))
+            )
+        if status == "paid" and insurer_shares[cycle]:
+            payments.append(
+                {
                     "claim_id": claim_id,
                     "coverage_id": coverage_id,
-                    "amount": {"value": insurer_paid_amount, "currency": "NGN"},
+                    "amount": int(insurer_shares[cycle]),
                     "payor": payor_org,
-                    "occurrence_datetime": get_random_datetime(start_date, end_date),
+                    "occurrence_datetime": int(insurer_paid[cycle]),
                     "method": "EFT",
-                },
-            }
-        )
-        adjustments.append(
-            {
-                "id": generate_uuid(),
-                "data": {
-                    "resident_id": resident_id,
-                    "claim_id": claim_id,
-                    "reason": "Contractual Adjustment",
-                    "approved_amount": {
-                        "value": patient_responsibility_from_claim,
-                        "currency": "NGN",
-                    },
-                    "authored_on": get_random_datetime(start_date, end_date),
-                },
-            }
-        )
+                }
+            )
 
-    # --- 7. Generate Out-of-Pocket Payment ---
-    # Resident pays for unclaimed charges + their responsibility from the claim
-    total_oop_payment = total_unclaimed_value + (
-        patient_responsibility_from_claim if claimed_charges else 0
+    # --- Statements: at each cycle's end the resident owes what has accrued ---
+    owed = [
+        (offset, amount)
+        for charge, offset, amount in zip(charges, times.tolist(), amounts.tolist())
+        if charge["id"] not in insured_ids
+    ] + resident_claim_shares
+    owed.sort()
+    owed_times = np.array([offset for offset, _ in owed], dtype=np.int64)
+    accrued = np.concatenate(
+        [[0], np.cumsum(np.array([amount for _, amount in owed], dtype=np.int64))]
     )
-    if total_oop_payment > 0:
+    statements = edges[1 : num_cycles + 1]
+    accrued_by_statement = accrued[np.searchsorted(owed_times, statements)]
+    outcomes = rng.random(num_cycles)
+    partial_shares = _basis_points(rng, PARTIAL_PAYMENT_SHARE, num_cycles)
+    paid_on = statements + _lags(rng, RESIDENT_PAYMENT_LAG_DAYS, num_cycles)
+    methods = rng.integers(len(RESIDENT_PAYMENT_METHODS), size=num_cycles)
+    billed = 0
+    for cycle in range(num_cycles):
+        due = int(accrued_by_statement[cycle]) - billed
+        if due <= 0 or outcomes[cycle] < MISSED_PAYMENT_RATE:
+            continue
+        if outcomes[cycle] < MISSED_PAYMENT_RATE + PARTIAL_PAYMENT_RATE:
+            due = due * int(partial_shares[cycle]) // BASIS_POINTS
+        if paid_on[cycle] > horizon or not due:
+            continue
+        billed += due
         payments.append(
             {
-                "id": generate_uuid(),
-                "data": {
-                    "resident_id": resident_id,
-                    "claim_id": None,  # No claim for OOP
-                    "coverage_id": None,
-                    "amount": {"value": total_oop_payment, "currency": "NGN"},
-                    "payor": resident_name,  # Payor is the resident
-                    "occurrence_datetime": get_random_datetime(start_date, end_date),
-                    "method": "Credit Card",
-                },
+                "claim_id": None,
+                "coverage_id": None,
+                "amount": due,
+                "payor": resident_name,
+                "occurrence_datetime": int(paid_on[cycle]),
+                "method": RESIDENT_PAYMENT_METHODS[methods[cycle]],
             }
         )
 
-    # --- 8. Update final Account Balance ---
-    final_balance = (
-        total_charges_value
-        - sum(p["data"]["amount"]["value"] for p in payments)
-        - sum(a["data"]["approved_amount"]["value"] for a in adjustments)
+    payments.sort(key=lambda payment: payment["occurrence_datetime"])
+    adjustments.sort(key=lambda adjustment: adjustment["authored_on"])
+    balance = (
+        int(amounts.sum())
+        - sum(payment["amount"] for payment in payments)
+        - sum(adjustment["approved_amount"] for adjustment in adjustments)
     )
-    if accounts:
-        accounts[0]["data"]["balance"]["value"] = round(final_balance, 2)
 
+    accounts = [
+        {
+            "id": account_id,
+            "data": {
+                "subject": {"id": resident_id, "name": resident_name},
+                "balance": money(balance),
+                "authored_on": start_date,
+                "billing_status": {
+                    "coding": [
+                        {
+                            "system": "http://hl7.org/fhir/account-billing-status",
+                            "code": "open",
+                            "display": "Open",
+                        }
+                    ]
+                },
+            },
+        }
+    ]
     return {
         "accounts": accounts,
         "coverages": coverages,
-        "charges": all_charges,
+        "charges": charges,
         "claims": claims,
-        "payments": payments,
-        "adjustments": adjustments,
-    }
\ No newline at end of file
+        "payments": [
+            {
+                "id": payment_id,
+                "data": {
+                    "resident_id": resident_id,
+                    **payment,
+                    "amount": money(payment["amount"]),
+                    "occurrence_datetime": at(payment["occurrence_datetime"]),
+                },
+            }
+            for payment_id, payment in zip(generate_uuids(rng, len(payments)), payments)
+        ],
+        "adjustments": [
+            {
+                "id": adjustment_id,
+                "data": {
+                    "resident_id": resident_id,
+                    **adjustment,
+                    "approved_amount": money(adjustment["approved_amount"]),
+                    "authored_on": at(adjustment["authored_on"]),
+                },
+            }
+            for adjustment_id, adjustment in zip(
+                generate_uuids(rng, len(adjustments)), adjustments
+            )
+        ],
+    }
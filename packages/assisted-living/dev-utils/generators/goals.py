@@ -3,7 +3,11 @@ from .config import CARE_PLAN_GOALS
 
 
 def generate_goals(resident_id: str) -> dict:
-    """Generates a list of standalone goal documents and returns them along with their IDs."""
+    """Generates a list of standalone goal documents and returns them along with their IDs.
+
+    The IDs are the resident's goal registry: care plans pick their goals
+    from it, so they never reference another resident's goals.
+    """
     goals = []
     goal_ids = []
     for goal_template in CARE_PLAN_GOALS:
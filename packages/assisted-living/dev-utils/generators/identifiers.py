@@ -1,3 +1,18 @@
+# Existing datasets use five-digit codes; larger ones widen every code equally
+MIN_RESIDENT_CODE_WIDTH = 5
+
+
+def allocate_resident_code(index: int, total_residents: int) -> str:
+    """Allocates the MRN for the resident at `index` of `total_residents`.
+
+    Codes are a pure function of position, so workers allocate them without
+    coordination, and zero-padding to the widest code keeps them unique and
+    sortable at any scale.
+    """
+    width = max(MIN_RESIDENT_CODE_WIDTH, len(str(total_residents)))
+    return f"{index + 1:0{width}d}"
+
+
 def generate_identifiers_for_resident(resident_id: str, resident_code: str) -> list:
     """Generates a list of identifiers for a resident, including an MRN."""
 
@@ -1,7 +1,34 @@
 import random
 from datetime import datetime
-from .utils import generate_uuid, get_random_datetime
-from .config import OBSERVATION_STATUSES, VITAL_RANGES
+import numpy as np
+from .utils import (
+    format_uuids,
+    generate_uuid,
+    get_random_datetime,
+    random_uuid_bytes,
+    seed_stream,
+    windowed_times,
+)
+from .config import (
+    OBSERVATION_STATUSES,
+    VITAL_CORRELATIONS,
+    VITAL_RANGES,
+    VITAL_WALK_STEPS,
+)
+
+VITAL_SIGNS_CATEGORY = [
+    {
+        "coding": [
+            {
+                "system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                "code": "vital-signs",
+                "display": "Vital Signs",
+            }
+        ]
+    }
+]
+# Readings of a series are taken up to this many minutes after their slot
+READING_DELAY_MINUTES = 30
 
 
 def make_observation(
@@ -10,8 +37,13 @@ def make_observation(
     staff_ids: list,
     start_date: datetime,
     end_date: datetime,
+    effective_datetime: datetime = None,
 ) -> dict:
-    """Generate a FHIR Observation resource for a given vital sign code."""
+    """Generate a FHIR Observation resource for a given vital sign code.
+
+    The reading is taken at a random time in the range unless
+    `effective_datetime` is given.
+    """
     vital = VITAL_RANGES.get(code)
     if not vital:
         raise ValueError(f"Unknown vital code: {code}")
@@ -29,19 +61,10 @@ def make_observation(
             "resident_id": resident_id,
             "recorder_id": random.choice(staff_ids),
             "status": random.choice(OBSERVATION_STATUSES),
-            "category": [
-                {
-                    "coding": [
-                        {
-                            "system": "http://terminology.hl7.org/CodeSystem/observation-category",
-                            "code": "vital-signs",
-                            "display": "Vital Signs",
-                        }
-                    ]
-                }
-            ],
+            "category": VITAL_SIGNS_CATEGORY,
             "code": {"coding": vital["coding"], "text": vital["coding"][0]["display"]},
-            "effective_datetime": get_random_datetime(start_date, end_date),
+            "effective_datetime": effective_datetime
+            or get_random_datetime(start_date, end_date),
             "value_quantity": {
                 "value": value,
                 "unit": vital["unit"]["display"],
@@ -63,18 +86,157 @@ def generate_observations_for_resident(
     start_date: datetime,
     end_date: datetime,
     loinc_codes: list,
+    since: datetime = None,
+    until: datetime = None,
 ) -> list:
+    """Spot readings of random vitals; only those inside the optional
+    `since`/`until` window are built."""
     num_observations = random.randint(3, 8)
+    if not loinc_codes:
+        return []
     observations = []
-    for _ in range(num_observations):
-        if loinc_codes:
-            observations.append(
-                make_observation(
-                    random.choice(loinc_codes),
-                    resident_id=resident_id,
-                    staff_ids=staff_ids,
-                    start_date=start_date,
-                    end_date=end_date,
-                )
+    for index, effective_datetime, key in windowed_times(
+        num_observations, start_date, end_date, since, until
+    ):
+        seed_stream(key, str(index))
+        observations.append(
+            make_observation(
+                random.choice(loinc_codes),
+                resident_id=resident_id,
+                staff_ids=staff_ids,
+                start_date=start_date,
+                end_date=end_date,
+                effective_datetime=effective_datetime,
             )
+        )
     return observations
+
+
+def correlated_walks(
+    rng: np.random.Generator, loinc_codes: list, steps: int, every_hours: float
+) -> np.ndarray:
+    """Draws a `(steps, len(loinc_codes))` array of bounded, correlated random walks.
+
+    Steps are Gaussian, correlated across codes through the Cholesky factor
+    of `VITAL_CORRELATIONS` and scaled by `VITAL_WALK_STEPS`. Each walk starts
+    anywhere in its `VITAL_RANGES` range and is reflected off the range's
+    bounds, so every value stays inside it without piling up at the edges.
+    """
+    correlation = np.eye(len(loinc_codes))
+    for i, a in enumerate(loinc_codes):
+        for j, b in enumerate(loinc_codes):
+            correlation[i, j] = VITAL_CORRELATIONS.get(
+                (a, b), VITAL_CORRELATIONS.get((b, a), correlation[i, j])
+            )
+    low = np.array([VITAL_RANGES[code]["min"] for code in loinc_codes], dtype=float)
+    width = np.array([VITAL_RANGES[code]["max"] for code in loinc_codes]) - low
+    scale = width * np.array([VITAL_WALK_STEPS[code] for code in loinc_codes])
+    scale *= np.sqrt(every_hours)
+
+    steps_drawn = rng.standard_normal((steps, len(loinc_codes)))
+    walks = np.cumsum(steps_drawn @ np.linalg.cholesky(correlation).T * scale, axis=0)
+    walks += rng.uniform(0, width)
+    # Fold onto [0, 2 * width), then mirror the upper half back into range
+    walks = np.mod(walks, 2 * width)
+    return low + np.where(walks > width, 2 * width - walks, walks)
+
+
+def generate_vital_series_for_resident(
+    resident_id: str,
+    staff_ids: list,
+    start_date: datetime,
+    end_date: datetime,
+    loinc_codes: list,
+    every_hours: float,
+    since: datetime = None,
+    until: datetime = None,
+) -> list:
+    """Continuous vitals: every code in `loinc_codes` read every `every_hours` hours.
+
+    Values follow `correlated_walks`, drawn for the whole span at once from a
+    generator seeded off the caller's `random` stream. Records of one code
+    share its `code`, `body_site`, `method` and `device` sub-objects; treat them
+    as read-only. Timestamps are ISO strings, as in eMAR. As there, a
+    `since`/`until` window only drops records after every draw, so a windowed
+    run emits exactly the records a full run has inside the window.
+    """
+    rng = np.random.default_rng(random.getrandbits(128))
+    step_seconds = int(every_hours * 3600)
+    span_seconds = int((end_date - start_date).total_seconds())
+    if not loinc_codes or step_seconds <= 0 or span_seconds < 0:
+        return []
+    steps = span_seconds // step_seconds + 1
+
+    values = correlated_walks(rng, loinc_codes, steps, every_hours)
+    delays = rng.integers(READING_DELAY_MINUTES + 1, size=steps)
+    times = np.datetime64(int(start_date.timestamp()), "s") + (
+        np.arange(steps, dtype=np.int64) * step_seconds + delays * 60
+    ).astype("timedelta64[s]")
+    recorder_indices = rng.integers(len(staff_ids), size=steps)
+    status_indices = rng.integers(
+        len(OBSERVATION_STATUSES), size=(steps, len(loinc_codes))
+    )
+    uuid_bytes = random_uuid_bytes(rng, steps * len(loinc_codes)).reshape(
+        steps, len(loinc_codes), 16
+    )
+
+    selected = times <= np.datetime64(int(end_date.timestamp()), "s")
+    if since is not None:
+        selected &= times >= np.datetime64(int(since.timestamp()), "s")
+    if until is not None:
+        selected &= times <= np.datetime64(int(until.timestamp()), "s")
+    if not selected.all():
+        times, values = times[selected], values[selected]
+        recorder_indices = recorder_indices[selected]
+        status_indices = status_indices[selected]
+        uuid_bytes = uuid_bytes[selected]
+    if not len(times):
+        return []
+
+    timestamps = np.char.add(np.datetime_as_string(times, unit="s"), "Z").tolist()
+    recorders = [staff_ids[i] for i in recorder_indices.tolist()]
+    ids = np.array(format_uuids(uuid_bytes.reshape(-1, 16))).reshape(
+        len(times), len(loinc_codes)
+    )
+    observations = []
+    for column, code in enumerate(loinc_codes):
+        vital = VITAL_RANGES[code]
+        code_block = {"coding": vital["coding"], "text": vital["coding"][0]["display"]}
+        unit = vital["unit"]
+        if vital["type"] == "int":
+            code_values = np.rint(values[:, column]).astype(np.int64).tolist()
+        else:
+            code_values = np.round(values[:, column], 1).tolist()
+        observations.append(
+            [
+                {
+                    "id": record_id,
+                    "data": {
+                        "resident_id": resident_id,
+                        "recorder_id": recorder,
+                        "status": OBSERVATION_STATUSES[status_index],
+                        "category": VITAL_SIGNS_CATEGORY,
+                        "code": code_block,
+                        "effective_datetime": timestamp,
+                        "value_quantity": {
+                            "value": value,
+                            "unit": unit["display"],
+                            "system": unit["system"],
+                            "code": unit["code"],
+                        },
+                        "body_site": vital["body_site"],
+                        "method": vital["method"],
+                        "device": vital["device"],
+                    },
+                }
+                for record_id, recorder, status_index, timestamp, value in zip(
+                    ids[:, column].tolist(),
+                    recorders,
+                    status_indices[:, column].tolist(),
+                    timestamps,
+                    code_values,
+                )
+            ]
+        )
+    # Reading order: every vital of one reading before the next reading
+    return [record for reading in zip(*observations) for record in reading]
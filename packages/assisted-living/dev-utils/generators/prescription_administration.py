@@ -1,68 +1,212 @@
+import hashlib
 import random
-from datetime import datetime, timedelta, time
-import pytz
-from .utils import generate_uuid
+from datetime import datetime, time
+import numpy as np
+from .utils import format_uuids
 from .config import ADMINISTRATION_STATUSES
 
+SECONDS_PER_DAY = 86_400
+# Furthest a dose is jittered from its scheduled time of day
+MAX_JITTER_SECONDS = 2 * 3600 + 30 * 60
+# Random 64-bit words drawn per dose: the jitter, the recorder and status,
+# and the two halves of the record's UUID. Philox yields four words per
+# counter step, so each dose is exactly one step and day `d` of a
+# prescription starts `d * doses_per_day` steps into its stream.
+WORDS_PER_DOSE = 4
+
+
+def seek_prescription_stream(
+    stream: np.random.Philox, resident_key: int, prescription_id: str, step: int
+) -> None:
+    """Points `stream` at counter `step` of one prescription's doses.
+
+    The key comes from the resident's eMAR key and the prescription ID, so a
+    prescription's doses do not depend on the other prescriptions or on
+    where generation starts. Resetting one `Philox` costs a fraction of
+    building a new one per prescription.
+    """
+    digest = hashlib.blake2b(
+        f"{resident_key}:{prescription_id}".encode(), digest_size=16
+    ).digest()
+    state = stream.state
+    state["state"]["key"] = np.frombuffer(digest, dtype="<u8").astype(np.uint64)
+    state["state"]["counter"] = np.array([step, 0, 0, 0], dtype=np.uint64)
+    # An empty buffer, so the next word comes from `step` itself
+    state["buffer_pos"] = 4
+    stream.state = state
+
+
+def dose_window(
+    start: datetime, end_date: datetime, since: datetime = None, until: datetime = None
+) -> tuple:
+    """The `[first, last)` days of a prescription that can hold doses inside the window.
+
+    Days count from `start`'s date. A dose lands up to a day plus the jitter
+    after its day begins, so the range is widened by that much and the exact
+    bounds are applied to the dose times.
+    """
+    first_day = datetime(start.year, start.month, start.day, tzinfo=start.tzinfo)
+    last = int((end_date - start).total_seconds() // SECONDS_PER_DAY) + 1
+    first = 0
+    if since is not None:
+        reach = (since - first_day).total_seconds() - SECONDS_PER_DAY
+        first = max(first, int((reach - MAX_JITTER_SECONDS) // SECONDS_PER_DAY))
+    if until is not None:
+        reach = (until - first_day).total_seconds() + MAX_JITTER_SECONDS
+        last = min(last, int(reach // SECONDS_PER_DAY) + 1)
+    return first, last
+
+
+def dose_draws(
+    stream: np.random.Philox,
+    resident_key: int,
+    prescription_id: str,
+    first: int,
+    last: int,
+    time_of_day: list,
+    doses_per_day: int,
+    start: datetime,
+) -> tuple:
+    """Draws the doses of days `[first, last)` of a prescription.
+
+    One slot per day for each scheduled time of day, each jittered by -2..2
+    hours and -30..30 minutes. The prescription's stream is sought straight
+    to day `first`, so the doses of a day are the same whichever day
+    generation starts at. Returns the timestamps as a `datetime64[s]` array in
+    day-then-dose order, their 1-based dose numbers, and the raw words the
+    recorder, status and UUID of each dose are taken from. Raises ValueError
+    unless `time_of_day` lists one time per dose.
+    """
+    if len(time_of_day) != doses_per_day:
+        raise ValueError(
+            f"A prescription taken {doses_per_day} times a day lists "
+            f"{len(time_of_day)} times of day."
+        )
+    num_days = last - first
+    if num_days <= 0:
+        return (
+            np.empty(0, dtype="datetime64[s]"),
+            np.empty(0, dtype=np.int64),
+            np.empty((0, WORDS_PER_DOSE), dtype=np.uint64),
+        )
+
+    seek_prescription_stream(
+        stream, resident_key, prescription_id, first * doses_per_day
+    )
+    shape = (num_days, doses_per_day)
+    words = stream.random_raw(num_days * doses_per_day * WORDS_PER_DOSE).reshape(
+        *shape, WORDS_PER_DOSE
+    )
+    jitter = (words[..., 0] % 5).astype(np.int64) * 3600 - 2 * 3600
+    jitter += ((words[..., 0] >> 32) % 61).astype(np.int64) * 60 - 30 * 60
+
+    offsets = np.array([t.hour * 3600 + t.minute * 60 for t in time_of_day])
+    days = np.arange(first, last, dtype=np.int64) * SECONDS_PER_DAY
+    times = np.datetime64(start.date(), "s") + (
+        days[:, None] + offsets[None, :] + jitter
+    ).astype("timedelta64[s]")
+    dose_numbers = np.broadcast_to(np.arange(1, doses_per_day + 1), shape)
+    return times.ravel(), dose_numbers.ravel(), words.reshape(-1, WORDS_PER_DOSE)
+
 
 def generate_prescription_administration_for_resident(
-    resident_id: str, resident_prescriptions: list, staff_ids: list, end_date: datetime
+    resident_id: str,
+    resident_prescriptions: list,
+    staff_ids: list,
+    end_date: datetime,
+    since: datetime = None,
+    until: datetime = None,
 ) -> list:
+    """Expands each prescription into one eMAR record per scheduled dose.
+
+    Every prescription draws from its own counter-based stream, keyed off
+    the caller's `random` stream and the prescription ID, in NumPy batches.
+    Records of one prescription share its `medication` and dosage
+    sub-objects rather than rebuilding them; treat them as read-only.
+
+    With a `since`/`until` window only the days that can hold doses inside
+    it are drawn, starting straight at the window's first day, and the
+    records are exactly the ones a full run has inside the window, including
+    doses of prescriptions that started before it.
+    """
+    resident_key = random.getrandbits(128)
+    stream = np.random.Philox()
+    window_start = None if since is None else np.datetime64(int(since.timestamp()), "s")
+    window_end = np.datetime64(int(end_date.timestamp()), "s")
+    if until is not None:
+        window_end = min(window_end, np.datetime64(int(until.timestamp()), "s"))
     prescription_administration = []
     for rx_record in resident_prescriptions:
-        timing = rx_record["data"]["dosage_instruction"][0]["timing"]
+        dosage_instruction = rx_record["data"]["dosage_instruction"][0]
+        timing = dosage_instruction["timing"]
         doses_per_day = timing["repeat"]["frequency"]
         if doses_per_day == 0:
             continue
 
-        start_date_str = rx_record["data"]["period"]["start"]
-        current_date = start_date_str
-        time_of_day = timing["repeat"].get("time_of_day", [time(9, 0)])
-        while current_date <= end_date:
-            for i, dose_num in enumerate(range(doses_per_day)):
-                hour = time_of_day[i].hour
-                minute = time_of_day[i].minute
-                hour_offset = random.randint(-2, 2)
-                minute_offset = random.randint(-30, 30)
-                admin_time = pytz.utc.localize(
-                    datetime(
-                        current_date.year,
-                        current_date.month,
-                        current_date.day,
-                        hour,
-                        minute,
-                        0,
-                    )
-                    + timedelta(hours=hour_offset, minutes=minute_offset)
-                )
-
-                if admin_time > end_date:
-                    continue
-
-                administered_dosage = rx_record["data"]["dosage_instruction"][0][
-                    "dose_and_rate"
-                ][0]["dose_quantity"]
-
-                prescription_administration.append(
-                    {
-                        "id": generate_uuid(),
-                        "data": {
-                            "resident_id": resident_id,
-                            "prescription_id": rx_record["id"],
-                            "medication": rx_record["data"]["medication"],
-                            "recorder_id": random.choice(staff_ids),
-                            "status": random.choice(ADMINISTRATION_STATUSES),
-                            "effective_datetime": admin_time,
-                            "dosage": {
-                                "route": rx_record["data"]["dosage_instruction"][0][
-                                    "route"
-                                ],
-                                "administered_dose": administered_dosage,
-                                "dose_number": dose_num
-                                + 1,  # Add the dose number (1-based)
-                            },
-                        },
-                    }
-                )
-            current_date += timedelta(days=1)
+        prescription_id = rx_record["id"]
+        start = rx_record["data"]["period"]["start"]
+        first, last = dose_window(start, end_date, since, until)
+        times, dose_numbers, words = dose_draws(
+            stream,
+            resident_key,
+            prescription_id,
+            first,
+            last,
+            timing["repeat"].get("time_of_day", [time(9, 0)]),
+            doses_per_day,
+            start,
+        )
+        selected = times <= window_end
+        if window_start is not None:
+            selected &= times >= window_start
+        if not selected.any():
+            continue
+        if not selected.all():
+            times, dose_numbers, words = (
+                times[selected],
+                dose_numbers[selected],
+                words[selected],
+            )
+        recorder_indices = words[:, 1] % len(staff_ids)
+        status_indices = (words[:, 1] >> 32) % len(ADMINISTRATION_STATUSES)
+        # Little-endian bytes, so IDs are the same on every platform
+        uuid_bytes = words[:, 2:].astype("<u8").view(np.uint8).reshape(-1, 16)
+
+        medication = rx_record["data"]["medication"]
+        # The dosage block only varies by dose number, so one dict per dose
+        # number is shared by every record of the prescription
+        dosages = [
+            {
+                "route": dosage_instruction["route"],
+                "administered_dose": dosage_instruction["dose_and_rate"][0][
+                    "dose_quantity"
+                ],
+                "dose_number": dose_number,  # 1-based dose number
+            }
+            for dose_number in range(1, doses_per_day + 1)
+        ]
+        # ISO strings in the same "...Z" form the serialiser emits for datetimes
+        timestamps = np.char.add(np.datetime_as_string(times, unit="s"), "Z").tolist()
+
+        prescription_administration.extend(
+            {
+                "id": record_id,
+                "data": {
+                    "resident_id": resident_id,
+                    "prescription_id": prescription_id,
+                    "medication": medication,
+                    "recorder_id": staff_ids[recorder_index],
+                    "status": ADMINISTRATION_STATUSES[status_index],
+                    "effective_datetime": timestamp,
+                    "dosage": dosages[dose_number - 1],
+                },
+            }
+            for record_id, recorder_index, status_index, timestamp, dose_number in zip(
+                format_uuids(uuid_bytes),
+                recorder_indices.tolist(),
+                status_indices.tolist(),
+                timestamps,
+                dose_numbers.tolist(),
+            )
+        )
     return prescription_administration
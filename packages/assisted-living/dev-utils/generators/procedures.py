@@ -1,6 +1,6 @@
 import random
 from datetime import timedelta, datetime
-from .utils import generate_uuid, get_random_datetime
+from .utils import generate_uuid, seed_stream, windowed_times
 from .config import PROCEDURE_STATUSES, SNOMED_PROCEDURES
 
 
@@ -10,14 +10,21 @@ def generate_procedures_for_resident(
     staff_ids: list,
     start_date: datetime,
     end_date: datetime,
+    since: datetime = None,
+    until: datetime = None,
 ) -> list:
-    """Generates a list of procedures for a resident that conforms to the ProcedureSchema."""
+    """Generates a list of procedures for a resident that conforms to the ProcedureSchema.
+
+    Only procedures performed inside the optional `since`/`until` window are built.
+    """
     num_procedures = random.randint(0, 3)
     procedures = []
 
-    for _ in range(num_procedures):
+    for index, performed_time, key in windowed_times(
+        num_procedures, start_date, end_date, since, until
+    ):
+        seed_stream(key, str(index))
         procedure_code = random.choice(SNOMED_PROCEDURES)
-        performed_time = get_random_datetime(start_date, end_date)
         performer_id = random.choice(staff_ids)
 
         procedure = {
@@ -45,11 +52,13 @@ def generate_procedures_for_resident(
                     "name": f"Staff Member {staff_ids.index(performer_id) + 1}",
                     "period": {
                         "start": performed_time,
-                        "end": performed_time + timedelta(minutes=random.randint(10, 60)),
+                        "end": performed_time
+                        + timedelta(minutes=random.randint(10, 60)),
                     },
                 },
                 "outcome": "successful",
-                "recorded_at": performed_time + timedelta(minutes=random.randint(5, 30)),
+                "recorded_at": performed_time
+                + timedelta(minutes=random.randint(5, 30)),
             },
         }
         procedures.append(procedure)
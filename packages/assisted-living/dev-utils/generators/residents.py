@@ -0,0 +1,296 @@
+import numpy as np
+from .addresses import STREET_NAMES
+from .utils import generate_uuids, numpy_stream
+
+# Residents are synthesised in fixed-size batches keyed by batch number, so
+# any slice of the population is reproducible without generating the rest.
+BATCH_SIZE = 10_000
+
+FIRST_NAMES = {
+    "male": [
+        "James",
+        "Robert",
+        "John",
+        "Michael",
+        "David",
+        "William",
+        "Richard",
+        "Joseph",
+        "Thomas",
+        "Charles",
+        "Chinedu",
+        "Emeka",
+        "Tunde",
+        "Segun",
+        "Ibrahim",
+        "Musa",
+        "Olumide",
+        "Kelechi",
+        "Babatunde",
+        "Yusuf",
+    ],
+    "female": [
+        "Mary",
+        "Patricia",
+        "Jennifer",
+        "Linda",
+        "Elizabeth",
+        "Barbara",
+        "Susan",
+        "Jessica",
+        "Sarah",
+        "Karen",
+        "Ngozi",
+        "Funmilayo",
+        "Aisha",
+        "Chiamaka",
+        "Folake",
+        "Zainab",
+        "Adaeze",
+        "Bisola",
+        "Halima",
+        "Yetunde",
+    ],
+}
+# Residents with gender "other" draw from both pools
+FIRST_NAMES["other"] = FIRST_NAMES["male"] + FIRST_NAMES["female"]
+LAST_NAMES = [
+    "Smith",
+    "Johnson",
+    "Williams",
+    "Brown",
+    "Jones",
+    "Garcia",
+    "Miller",
+    "Davis",
+    "Moore",
+    "White",
+    "Okafor",
+    "Adeyemi",
+    "Balogun",
+    "Eze",
+    "Okonkwo",
+    "Bello",
+    "Adebayo",
+    "Nwosu",
+    "Abubakar",
+    "Ogunleye",
+]
+GENDERS = ["male", "female", "other"]
+# Matches the mix of the hand-made residents in data-plain.json
+GENDER_WEIGHTS = [0.41, 0.35, 0.24]
+PCPS = [
+    "Dr. Jennifer Garcia",
+    "Dr. Barbara Moore",
+    "Dr. James Smith",
+    "Dr. Robert Jones",
+    "Dr. Ngozi Okafor",
+    "Dr. Ibrahim Bello",
+]
+EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "hotmail.com", "outlook.com"]
+ROOM_LETTERS = list("ABCD")
+
+# Same relationship vocabulary as update_relationships.py
+LEGAL_RELATIONSHIPS = [
+    "HCP_AGENT_DURABLE",
+    "POA_FINANCIAL",
+    "GUARDIAN_OF_PERSON",
+    "GUARDIAN_OF_ESTATE",
+    "TRUSTEE",
+]
+OTHER_RELATIONSHIPS = [
+    "SPOUSE",
+    "DOMESTIC_PARTNER",
+    "PARENT",
+    "CHILD",
+    "SIBLING",
+    "EMERGENCY_CONTACT",
+    "CARETAKER",
+    "FRIEND",
+    "OTHER_RELATIVE",
+]
+MAX_EMERGENCY_CONTACTS = 4
+# The provider the app reads, which hand-made residents belong to
+DEFAULT_PROVIDER_ID = "GYRHOME"
+STAFF_PER_FACILITY = 6
+
+
+def facility_ids(num_facilities: int) -> list:
+    """Returns stable facility IDs in the `GYRH<number>` style of facilities/data.json."""
+    return [f"GYRH{1000 + i}" for i in range(num_facilities)]
+
+
+def provider_ids(num_providers: int) -> list:
+    """Returns stable provider IDs, starting with the app's own `GYRHOME`."""
+    return [DEFAULT_PROVIDER_ID] + [f"PROV{i:05d}" for i in range(1, num_providers)]
+
+
+def facility_providers(num_providers: int, facilities_per_provider: int) -> dict:
+    """Maps each facility ID to its provider; provider n owns the nth block of `facility_ids`."""
+    providers = provider_ids(num_providers)
+    return {
+        facility_id: providers[i // facilities_per_provider]
+        for i, facility_id in enumerate(
+            facility_ids(num_providers * facilities_per_provider)
+        )
+    }
+
+
+def facility_staff_ids(seed: int, facility_id: str) -> list:
+    """Returns a facility's staff roster, drawn from a stream seeded by the facility."""
+    return generate_uuids(numpy_stream(seed, "staff", facility_id), STAFF_PER_FACILITY)
+
+
+def synthesise_facilities(seed: int, num_facilities: int) -> list:
+    """Builds one facility document per ID returned by `facility_ids`."""
+    rng = numpy_stream(seed, "facilities")
+    numbers = rng.integers(1, 99999, size=num_facilities).tolist()
+    streets = rng.integers(0, len(STREET_NAMES), size=num_facilities).tolist()
+    return [
+        {"id": facility_id, "data": {"address": f"{number} {STREET_NAMES[street]}"}}
+        for facility_id, number, street in zip(
+            facility_ids(num_facilities), numbers, streets
+        )
+    ]
+
+
+def _phones(rng: np.random.Generator, count: int) -> list:
+    area = rng.integers(200, 1000, size=count).tolist()
+    exchange = rng.integers(200, 1000, size=count).tolist()
+    line = rng.integers(0, 10000, size=count).tolist()
+    return [f"({a}) {e}-{n:04d}" for a, e, n in zip(area, exchange, line)]
+
+
+def _optional(rng: np.random.Generator, values: list, probability: float) -> list:
+    """Keeps each value with `probability`, replacing the rest with None."""
+    keep = (rng.random(len(values)) < probability).tolist()
+    return [value if k else None for value, k in zip(values, keep)]
+
+
+def synthesise_resident_batch(seed: int, batch: int, num_facilities: int) -> list:
+    """Synthesises residents `batch * BATCH_SIZE` onwards with their emergency contacts.
+
+    Each resident carries its contacts under a top-level `emergency_contacts`
+    key, which the caller pops and writes to its own collection.
+    """
+    rng = numpy_stream(seed, "residents", str(batch))
+    n = BATCH_SIZE
+    ids = generate_uuids(rng, n)
+    genders = rng.choice(len(GENDERS), size=n, p=GENDER_WEIGHTS).tolist()
+    first = rng.integers(0, len(FIRST_NAMES["other"]), size=n).tolist()
+    last = rng.integers(0, len(LAST_NAMES), size=n).tolist()
+    facilities = rng.integers(0, num_facilities, size=n).tolist()
+    floors = rng.integers(1, 8, size=n).tolist()
+    rooms = rng.integers(1, 21, size=n).tolist()
+    lettered = (rng.random(n) < 0.3).tolist()
+    letters = rng.integers(0, len(ROOM_LETTERS), size=n).tolist()
+    birth_years = rng.integers(1930, 1961, size=n).tolist()
+    birth_months = rng.integers(1, 13, size=n).tolist()
+    birth_days = rng.integers(1, 29, size=n).tolist()
+    pcps = rng.integers(0, len(PCPS), size=n).tolist()
+    email_numbers = rng.integers(1, 1000, size=n).tolist()
+    domains = rng.integers(0, len(EMAIL_DOMAINS), size=n).tolist()
+    cell_phones = _phones(rng, n)
+    work_phones = _optional(rng, _phones(rng, n), 0.8)
+    home_phones = _optional(rng, _phones(rng, n), 0.8)
+
+    # Emergency contacts are drawn for the whole batch at once, then split
+    contact_counts = rng.integers(1, MAX_EMERGENCY_CONTACTS + 1, size=n)
+    total_contacts = int(contact_counts.sum())
+    contact_ids = generate_uuids(rng, total_contacts)
+    contact_first = rng.integers(
+        0, len(FIRST_NAMES["other"]), size=total_contacts
+    ).tolist()
+    contact_last = rng.integers(0, len(LAST_NAMES), size=total_contacts).tolist()
+    contact_cells = _phones(rng, total_contacts)
+    contact_homes = _optional(rng, _phones(rng, total_contacts), 0.1)
+    contact_works = _optional(rng, _phones(rng, total_contacts), 0.1)
+    relationships = rng.integers(
+        0, len(OTHER_RELATIONSHIPS), size=total_contacts
+    ).tolist()
+    has_legal = (rng.random(total_contacts) < 0.5).tolist()
+    legal = rng.integers(0, len(LEGAL_RELATIONSHIPS), size=total_contacts).tolist()
+    contact_offsets = np.concatenate(([0], np.cumsum(contact_counts))).tolist()
+
+    all_facility_ids = facility_ids(num_facilities)
+    residents = []
+    for i in range(n):
+        gender = GENDERS[genders[i]]
+        first_pool = FIRST_NAMES[gender]
+        first_name = first_pool[first[i] % len(first_pool)]
+        last_name = LAST_NAMES[last[i]]
+        room_no = (
+            f"{floors[i]}{ROOM_LETTERS[letters[i]]}"
+            if lettered[i]
+            else f"{floors[i]}{rooms[i]:02d}"
+        )
+        contacts = []
+        for j in range(contact_offsets[i], contact_offsets[i + 1]):
+            relationship = [OTHER_RELATIONSHIPS[relationships[j]]]
+            if has_legal[j]:
+                relationship.append(LEGAL_RELATIONSHIPS[legal[j]])
+            contacts.append(
+                {
+                    "id": contact_ids[j],
+                    "data": {
+                        "contact_name": f"{FIRST_NAMES['other'][contact_first[j]]} {LAST_NAMES[contact_last[j]]}",
+                        "cell_phone": contact_cells[j],
+                        "home_phone": contact_homes[j],
+                        "work_phone": contact_works[j],
+                        "relationship": relationship,
+                        "resident_id": ids[i],
+                    },
+                }
+            )
+        residents.append(
+            {
+                "id": ids[i],
+                "data": {
+                    "resident_name": f"{first_name} {last_name}",
+                    "gender": gender,
+                    "facility_id": all_facility_ids[facilities[i]],
+                    "room_no": room_no,
+                    "avatar_url": None,
+                    "dob": f"{birth_months[i]:02d}/{birth_days[i]:02d}/{birth_years[i]}",
+                    "pcp": PCPS[pcps[i]],
+                    "resident_email": f"{first_name}{last_name}{email_numbers[i]}@{EMAIL_DOMAINS[domains[i]]}",
+                    "cell_phone": cell_phones[i],
+                    "work_phone": work_phones[i],
+                    "home_phone": home_phones[i],
+                },
+                "emergency_contacts": contacts,
+            }
+        )
+    return residents
+
+
+class SyntheticResidents:
+    """A lazily synthesised, sliceable stand-in for the residents list.
+
+    Slices are cheap to pickle, so process-pool workers synthesise their own
+    range instead of receiving it from the parent.
+    """
+
+    def __init__(self, seed: int, count: int, num_facilities: int, start: int = 0):
+        self.seed = seed
+        self.count = count
+        self.num_facilities = num_facilities
+        self.start = start
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: slice) -> "SyntheticResidents":
+        start, stop, _ = index.indices(self.count)
+        return SyntheticResidents(
+            self.seed, max(0, stop - start), self.num_facilities, self.start + start
+        )
+
+    def __iter__(self):
+        position, stop = self.start, self.start + self.count
+        while position < stop:
+            batch = position // BATCH_SIZE
+            offset = position - batch * BATCH_SIZE
+            residents = synthesise_resident_batch(self.seed, batch, self.num_facilities)
+            yield from residents[offset : offset + stop - position]
+            position = (batch + 1) * BATCH_SIZE
@@ -1,13 +1,21 @@
 import random
 from datetime import timedelta, datetime
-from .utils import generate_uuid, get_random_datetime
+from .utils import generate_uuid, seed_stream, windowed_times
 from .config import TASK_STATUSES, TASK_PRIORITIES
 
 
 def generate_tasks_for_resident(
-    resident_id: str, staff_ids: list, start_date: datetime, end_date: datetime
+    resident_id: str,
+    staff_ids: list,
+    start_date: datetime,
+    end_date: datetime,
+    since: datetime = None,
+    until: datetime = None,
 ) -> list:
-    """Generates a list of tasks for a resident that conforms to the TaskSchema."""
+    """Generates a list of tasks for a resident that conforms to the TaskSchema.
+
+    Only tasks authored inside the optional `since`/`until` window are built.
+    """
     num_tasks = random.randint(1, 4)
     tasks = []
 
@@ -18,10 +26,12 @@ def generate_tasks_for_resident(
         "default": "General follow-up required",
     }
 
-    for _ in range(num_tasks):
+    for index, created_time, key in windowed_times(
+        num_tasks, start_date, end_date, since, until
+    ):
+        seed_stream(key, str(index))
         activity_code = random.choice(list(sample_activities.keys()))
         description = sample_activities.get(activity_code, sample_activities["default"])
-        created_time = get_random_datetime(start_date, end_date)
         performer_id = random.choice(staff_ids)
 
         task = {
@@ -2,33 +2,95 @@ import uuid
 import random
 import os
 import re
-from datetime import timedelta, time, datetime
+import hashlib
+import numpy as np
+from datetime import timedelta, datetime
 
 
-def convert_times(obj):
-    if isinstance(obj, dict):
-        return {k: convert_times(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_times(v) for v in obj]
-    elif isinstance(obj, datetime):
-        return obj.isoformat().replace("+00:00", "Z")
-    elif isinstance(obj, time):
-        return obj.isoformat()
-    else:
-        return obj
+def seed_stream(seed: int, *keys: str) -> None:
+    """Reseeds the shared `random` module with the stream named by `seed` and `keys`.
+
+    String seeds are hashed with SHA-512, so streams are stable across runs,
+    processes and platforms.
+    """
+    random.seed(":".join([str(seed), *keys]))
+
+
+def numpy_stream(seed: int, *keys: str) -> np.random.Generator:
+    """NumPy counterpart of `seed_stream` for vectorised generators."""
+    digest = hashlib.sha256(":".join([str(seed), *keys]).encode()).digest()
+    return np.random.default_rng(int.from_bytes(digest, "big"))
 
 
 def generate_uuid():
-    return str(uuid.uuid4())
+    # Drawn from the seeded stream rather than os.urandom so IDs are reproducible
+    return str(uuid.UUID(int=random.getrandbits(128), version=4))
+
+
+# Character positions of the 32 hex digits in a 36-character UUID string
+_UUID_HEX_POSITIONS = [i for i in range(36) if i not in (8, 13, 18, 23)]
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+
+def random_uuid_bytes(rng: np.random.Generator, count: int) -> np.ndarray:
+    """Draws the raw 16 bytes of `count` UUIDs as a `(count, 16)` array."""
+    return np.frombuffer(rng.bytes(16 * count), dtype=np.uint8).reshape(count, 16)
+
+
+def format_uuids(raw: np.ndarray) -> list:
+    """Formats a `(count, 16)` byte array as version-4 UUID strings.
+
+    The strings are built in NumPy; constructing a `uuid.UUID` per record
+    costs more than the rest of a record put together.
+    """
+    raw = raw.copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    nibbles = np.empty((len(raw), 32), dtype=np.uint8)
+    nibbles[:, 0::2] = raw >> 4
+    nibbles[:, 1::2] = raw & 0x0F
+    chars = np.full((len(raw), 36), ord("-"), dtype=np.uint8)
+    chars[:, _UUID_HEX_POSITIONS] = _HEX_DIGITS[nibbles]
+    return chars.view("S36").ravel().astype("U36").tolist()
+
+
+def generate_uuids(rng: np.random.Generator, count: int) -> list:
+    """Vectorised `generate_uuid`: draws `count` version-4 UUIDs from `rng` at once."""
+    return format_uuids(random_uuid_bytes(rng, count))
+
+
+def in_window(value: datetime, since: datetime, until: datetime) -> bool:
+    """Whether `value` falls inside the optional [since, until] window."""
+    return (since is None or value >= since) and (until is None or value <= until)
+
+
+def windowed_times(
+    count: int, start_date: datetime, end_date: datetime, since=None, until=None
+) -> list:
+    """Draws `count` record times and keys a stream for each record's other fields.
+
+    Returns `(index, time, key)` for the times inside the optional
+    [since, until] window. Every time is drawn first, then each record draws
+    the rest of its fields after `seed_stream(key, str(index))`, so a
+    windowed run builds only the records inside the window and they are
+    identical to the same records in a full run.
+    """
+    times = [get_random_datetime(start_date, end_date) for _ in range(count)]
+    key = random.getrandbits(64)
+    return [
+        (index, value, key)
+        for index, value in enumerate(times)
+        if in_window(value, since, until)
+    ]
 
 
 def get_random_datetime(start_date, end_date):
     time_between_dates = end_date - start_date
     seconds_between_dates = int(time_between_dates.total_seconds())
-    
+
     if seconds_between_dates <= 0:
         return start_date
-        
+
     random_number_of_seconds = random.randrange(seconds_between_dates)
     return start_date + timedelta(seconds=random_number_of_seconds)
 
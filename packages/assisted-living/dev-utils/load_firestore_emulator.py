@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from generate_demo_subcollection_data import (
+    ENCRYPTED_PAYLOAD_FILE,
+    EXTRA_OUTPUTS,
+    SUBCOLLECTIONS_DIR,
+    SYNTHETIC_DIR,
+)
+from pipeline.firestore import MAX_BATCH_WRITES, EmulatorLoader, FirestoreLoadError
+from pipeline.partitions import MANIFEST_FILE
+from pipeline.readers import RecordFormatError, iter_records
+
+# Emulator port from firebase.json, project from .firebaserc
+DEFAULT_HOST = os.environ.get("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+DEFAULT_PROJECT = "lean-ehr"
+DEFAULT_DATABASE = "staging-beta"
+# Payload paths are relative to the provider, as for `firestore-cli set`
+DEFAULT_ROOT = "providers/GYRHOME"
+PROGRESS_SECONDS = 5
+
+
+def payload_files(paths: list, manifest: str) -> list:
+    """The payload files given, plus every partition's payload in `manifest`."""
+    files = list(paths)
+    if manifest:
+        with open(manifest, "r") as f:
+            partitions = json.load(f)["partitions"]
+        for partition in partitions:
+            payload = partition["files"].get("encrypted_payload")
+            if payload:
+                files.append(os.path.join(os.path.dirname(manifest), payload["path"]))
+    return files
+
+
+def payload_documents(files: list, root: str, collections=None):
+    """Yields `(path, data)` for each `{path, data}` line, under `root`.
+
+    With `collections`, only documents of those collections are yielded;
+    `residents` selects the resident documents themselves.
+    """
+    prefix = f"{root.strip('/')}/" if root.strip("/") else ""
+    for path in files:
+        for record in iter_records(path):
+            if collections and record["path"].split("/")[-2] not in collections:
+                continue
+            yield prefix + record["path"], record["data"]
+
+
+class Progress:
+    """Prints throughput every `PROGRESS_SECONDS`."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._printed = self.started
+
+    def __call__(self, stats: dict, limit: int) -> None:
+        now = time.monotonic()
+        if now - self._printed >= PROGRESS_SECONDS:
+            self._printed = now
+            print(
+                f"{stats['documents']} documents, "
+                f"{stats['documents'] / (now - self.started):.0f}/s, "
+                f"concurrency {limit}"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Seeds the Firestore emulator from encrypted payload JSONL with concurrent batchWrite requests."
+    )
+    parser.add_argument(
+        "payloads",
+        nargs="*",
+        help=f"{{path, data}} JSONL files (default: {ENCRYPTED_PAYLOAD_FILE} in the data dir).",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=SUBCOLLECTIONS_DIR,
+        help=f"Directory the generator wrote to, e.g. {SYNTHETIC_DIR} after a --residents run.",
+    )
+    parser.add_argument(
+        "--manifest",
+        help=f"Also load the payload of every partition in this {MANIFEST_FILE}, e.g. {SYNTHETIC_DIR}/{EXTRA_OUTPUTS['partitions']}/{MANIFEST_FILE}.",
+    )
+    parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help="Emulator host:port (default: $FIRESTORE_EMULATOR_HOST or localhost:8080).",
+    )
+    parser.add_argument(
+        "--collections",
+        type=lambda value: set(value.split(",")),
+        default=None,
+        help="Only load these comma-separated collections, as listed by `reseed.py plan`.",
+    )
+    parser.add_argument("--project", default=DEFAULT_PROJECT)
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument(
+        "--root",
+        default=DEFAULT_ROOT,
+        help="Document path the payload paths are relative to; pass '' for payloads written with --providers.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=MAX_BATCH_WRITES,
+        help="Writes per batchWrite request (at most 500).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Requests in flight to start with; adjusted from latency and errors.",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=64,
+        help="Most requests in flight, and the size of the connection pool.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not 1 <= args.batch_size <= MAX_BATCH_WRITES:
+        print(f"Error: --batch-size must be between 1 and {MAX_BATCH_WRITES}.")
+        exit(1)
+    if not 1 <= args.concurrency <= args.max_concurrency:
+        print("Error: --concurrency must be between 1 and --max-concurrency.")
+        exit(1)
+    files = payload_files(args.payloads, args.manifest) or [
+        os.path.join(args.data_dir, ENCRYPTED_PAYLOAD_FILE)
+    ]
+    missing = [path for path in files if not os.path.exists(path)]
+    if missing:
+        print(f"Error: payload file not found at {missing[0]}.")
+        exit(1)
+    loader = EmulatorLoader(
+        args.host,
+        args.project,
+        args.database,
+        (args.concurrency, 1, args.max_concurrency),
+        args.batch_size,
+    )
+    try:
+        stats = asyncio.run(
+            loader.load(
+                payload_documents(files, args.root, args.collections), Progress()
+            )
+        )
+    except (FirestoreLoadError, RecordFormatError, OSError) as error:
+        print(f"Error: {error}")
+        exit(1)
+    print(
+        f"Wrote {stats['documents']} documents in {stats['seconds']:.1f}s "
+        f"({stats['documents'] / max(stats['seconds'], 1e-9):.0f}/s) "
+        f"with {stats['requests']} requests; {stats['retried_writes']} writes retried, "
+        f"concurrency peaked at {stats['peak_concurrency']}."
+    )
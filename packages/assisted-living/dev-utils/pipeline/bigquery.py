@@ -0,0 +1,250 @@
+import json
+import os
+import shutil
+from decimal import Decimal
+from .checkpoint import truncate_output
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# The BigQuery schema files live at the root of the assisted-living package
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+# Tables filled by functions/src/backfill-bigquery.ts, keyed by collection
+BIGQUERY_TABLES = {
+    "residents": {
+        "table": "resident_timestamps_raw",
+        "schema": "resident_timestamps_schema.json",
+        "partition_field": "created_at",
+    },
+    "charges": {
+        "table": "charges_raw",
+        "schema": "charges_schema.json",
+        "partition_field": "occurrence_datetime",
+    },
+    "claims": {
+        "table": "claims_raw",
+        "schema": "claims_schema.json",
+        "partition_field": "authored_on",
+    },
+    "payments": {
+        "table": "payments_raw",
+        "schema": "payments_schema.json",
+        "partition_field": "occurrence_datetime",
+    },
+    "adjustments": {
+        "table": "adjustments_raw",
+        "schema": "adjustments_schema.json",
+        "partition_field": "authored_on",
+    },
+}
+BIGQUERY_FORMATS = ["ndjson", "parquet"]
+# BigQuery NUMERIC holds 9 decimal places
+NUMERIC_SCALE = 9
+NUMERIC_QUANTUM = Decimal(1).scaleb(-NUMERIC_SCALE)
+# Partition name for rows whose partition field is null, as BigQuery names it
+NULL_PARTITION = "__NULL__"
+
+
+def load_schema(collection: str) -> list:
+    with open(os.path.join(SCHEMA_DIR, BIGQUERY_TABLES[collection]["schema"])) as f:
+        return json.load(f)
+
+
+def numeric_float(value) -> float:
+    return round(value, NUMERIC_SCALE)
+
+
+def numeric_decimal(value) -> Decimal:
+    return Decimal(value).quantize(NUMERIC_QUANTUM)
+
+
+def to_row(data: dict, fields: list, numeric=numeric_float) -> dict:
+    """Projects a document onto a BigQuery schema.
+
+    Fields missing from the document become null (or [] when REPEATED), and
+    fields the schema does not know are dropped. NUMERIC values go through
+    `numeric`, which rounds them to BigQuery's scale.
+    """
+    row = {}
+    for field in fields:
+        name, repeated = field["name"], field.get("mode") == "REPEATED"
+        value = data.get(name)
+        if value is None:
+            row[name] = [] if repeated else None
+            continue
+        values = value if repeated else [value]
+        if field["type"] == "RECORD":
+            values = [to_row(v, field["fields"], numeric) for v in values]
+        elif field["type"] == "NUMERIC":
+            values = [numeric(v) for v in values]
+        row[name] = values if repeated else values[0]
+    return row
+
+
+def arrow_schema(fields: list):
+    """Maps a BigQuery JSON schema onto the equivalent Arrow schema."""
+    types = {
+        "STRING": pa.string(),
+        "INTEGER": pa.int64(),
+        "FLOAT": pa.float64(),
+        "NUMERIC": pa.decimal128(38, NUMERIC_SCALE),
+        "BOOLEAN": pa.bool_(),
+        "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    }
+
+    def arrow_type(field):
+        if field["type"] == "RECORD":
+            data_type = pa.struct(
+                [pa.field(f["name"], arrow_type(f)) for f in field["fields"]]
+            )
+        else:
+            data_type = types[field["type"]]
+        return pa.list_(data_type) if field.get("mode") == "REPEATED" else data_type
+
+    return pa.schema([pa.field(f["name"], arrow_type(f)) for f in fields])
+
+
+class BigQueryExport:
+    """Writes load files for the BigQuery `*_raw` tables, one file per event date.
+
+    NDJSON partitions are `<table>/<YYYY-MM-DD>.ndjson`; Parquet partitions are
+    `<table>/<YYYY-MM-DD>/part-<n>.parquet`, since Parquet files cannot be
+    appended to. Rows are buffered and flushed every `flush_rows` rows, so a
+    single file handle is open at a time. A `state` from `checkpoint` picks
+    the export up where the checkpoint left it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        serialiser,
+        fmt: str,
+        flush_rows: int = 50_000,
+        state=None,
+    ):
+        if fmt == "parquet" and pa is None:
+            raise ValueError("Parquet output needs pyarrow: uv sync --extra parquet")
+        self.path = path
+        self.count = 0
+        self.fmt = fmt
+        if state is None:
+            # Partitions are appended to, so start from an empty directory
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            self._restore(state)
+        self.flush_rows = flush_rows
+        self._serialiser = serialiser
+        self._schemas = {name: load_schema(name) for name in BIGQUERY_TABLES}
+        self._arrow_schemas = (
+            {name: arrow_schema(fields) for name, fields in self._schemas.items()}
+            if fmt == "parquet"
+            else {}
+        )
+        self._buffers = {}
+        self._buffered = 0
+
+    def write(self, collection: str, records) -> None:
+        fields = self._schemas[collection]
+        partition_field = BIGQUERY_TABLES[collection]["partition_field"]
+        numeric = numeric_decimal if self.fmt == "parquet" else numeric_float
+        for record in records:
+            row = to_row({"id": record["id"], **record["data"]}, fields, numeric)
+            event_time = row[partition_field]
+            partition = event_time.date().isoformat() if event_time else NULL_PARTITION
+            if self.fmt == "ndjson":
+                row = self._serialiser.dumps(row)
+            self._buffers.setdefault((collection, partition), []).append(row)
+            self._buffered += 1
+            self.count += 1
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def partition_path(self, collection: str, partition: str) -> str:
+        table_dir = os.path.join(self.path, BIGQUERY_TABLES[collection]["table"])
+        if self.fmt == "ndjson":
+            return os.path.join(table_dir, f"{partition}.ndjson")
+        return os.path.join(table_dir, partition)
+
+    def flush(self) -> None:
+        for (collection, partition), rows in sorted(self._buffers.items()):
+            path = self.partition_path(collection, partition)
+            if self.fmt == "ndjson":
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "ab") as f:
+                    f.write(b"\n".join(rows) + b"\n")
+            else:
+                table = pa.Table.from_pylist(
+                    rows, schema=self._arrow_schemas[collection]
+                )
+                self._write_part(path, lambda part: pq.write_table(table, part))
+        self._buffers = {}
+        self._buffered = 0
+
+    def _write_part(self, partition_dir: str, write) -> None:
+        os.makedirs(partition_dir, exist_ok=True)
+        write(
+            os.path.join(
+                partition_dir, f"part-{len(os.listdir(partition_dir)):05d}.parquet"
+            )
+        )
+
+    def append_shard(self, path: str, count: int) -> None:
+        """Moves another export's partitions into this one, appending NDJSON in order."""
+        self.flush()
+        for collection in BIGQUERY_TABLES:
+            table = BIGQUERY_TABLES[collection]["table"]
+            shard_table_dir = os.path.join(path, table)
+            if not os.path.isdir(shard_table_dir):
+                continue
+            for name in sorted(os.listdir(shard_table_dir)):
+                source = os.path.join(shard_table_dir, name)
+                if self.fmt == "ndjson":
+                    target = os.path.join(self.path, table, name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with open(source, "rb") as shard, open(target, "ab") as f:
+                        while chunk := shard.read(1 << 20):
+                            f.write(chunk)
+                else:
+                    for part in sorted(os.listdir(source)):
+                        self._write_part(
+                            os.path.join(self.path, table, name),
+                            lambda target: os.replace(
+                                os.path.join(source, part), target
+                            ),
+                        )
+        self.count += count
+
+    def _files(self) -> list:
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self.path)
+            for name in names
+        ]
+
+    def checkpoint(self) -> dict:
+        """Flushes the buffered rows to disk and returns the state to resume from.
+
+        The state lists every file with its size, so resuming can cut
+        NDJSON files back and drop Parquet parts written after it.
+        """
+        self.flush()
+        files = {}
+        for path in self._files():
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+            files[os.path.relpath(path, self.path)] = os.path.getsize(path)
+        return {"records": self.count, "files": files}
+
+    def _restore(self, state: dict) -> None:
+        for path in self._files():
+            if os.path.relpath(path, self.path) not in state["files"]:
+                os.remove(path)
+        for name, size in state["files"].items():
+            truncate_output(os.path.join(self.path, name), size)
+        self.count = state["records"]
+
+    def close(self) -> None:
+        self.flush()
@@ -0,0 +1,186 @@
+import hashlib
+import inspect
+import os
+import pickle
+import random
+import sqlite3
+import sys
+import time
+import zlib
+
+# Cache writes and access-time updates are committed in batches of this many
+BATCH_OPERATIONS = 512
+# Eviction frees space down to this share of the size limit, so it does not
+# run again on the next insert
+EVICT_TO = 0.9
+# Seconds a process waits for another's write lock
+LOCK_TIMEOUT = 60
+# Shared helpers every generator may call, hashed into each generator's version
+SHARED_MODULES = ["generators.utils"]
+CONFIG_MODULE = "generators.config"
+
+
+def _digest(*parts: bytes) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.digest()
+
+
+def _source(module_name: str) -> bytes:
+    with open(inspect.getsourcefile(sys.modules[module_name]), "rb") as f:
+        return f.read()
+
+
+def generator_version(generator) -> bytes:
+    """Hashes a generator's name and module, the shared helpers and the config it reads.
+
+    The config sections are the `generators.config` values the module
+    imports, so editing one template only changes the versions of the
+    generators that use it.
+    """
+    function = inspect.unwrap(generator)
+    module_name = function.__module__
+    config = sys.modules[CONFIG_MODULE]
+    module = sys.modules[module_name]
+    sections = {
+        name: value
+        for name, value in vars(module).items()
+        if name.isupper() and getattr(config, name, None) is value
+    }
+    return _digest(
+        function.__qualname__.encode(),
+        _source(module_name),
+        *(_source(name) for name in SHARED_MODULES),
+        pickle.dumps(sorted(sections.items()), protocol=4),
+    )
+
+
+class GeneratorCache:
+    """On-disk cache of generator results, per resident and generator.
+
+    Entries live in one SQLite file shared by every worker. An entry is
+    keyed by the seed, the resident ID, the generator's name and version,
+    its arguments and the state of the `random` stream it is called with,
+    so a hit returns exactly what the call would have. Run-wide lookups in
+    `constants`, such as the SNOMED lists, are hashed once and stand in for
+    themselves when they are passed as arguments.
+
+    Values are zlib-compressed pickles. Once the file holds more than
+    `max_bytes` of values, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int, constants: list = ()):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key BLOB PRIMARY KEY, value BLOB, bytes INTEGER, used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        # The total size of the values, kept in step with every insert and
+        # eviction so no process has to add it up
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (bytes INTEGER)")
+        with self._db:
+            if self._db.execute("SELECT COUNT(*) FROM meta").fetchone()[0] == 0:
+                self._db.execute("INSERT INTO meta VALUES (0)")
+        # Keeps the constants alive, so their ids are not reused
+        self._constants = list(constants)
+        self._constant_digests = {
+            id(value): _digest(pickle.dumps(value, protocol=4)) for value in constants
+        }
+        self._versions = {}
+        self._inserts = []
+        self._touched = []
+        self.stats = {}
+
+    def _key(self, seed: int, resident_id: str, name: str, generator, args) -> bytes:
+        if name not in self._versions:
+            self._versions[name] = generator_version(generator)
+        return _digest(
+            f"{seed}:{resident_id}:{name}".encode(),
+            self._versions[name],
+            *(
+                self._constant_digests.get(id(arg)) or pickle.dumps(arg, protocol=4)
+                for arg in args
+            ),
+            pickle.dumps(random.getstate(), protocol=4),
+        )
+
+    def call(self, seed: int, resident_id: str, name: str, generator, *args):
+        """Returns `generator(*args)`, from the cache if it has been called alike before."""
+        key = self._key(seed, resident_id, name, generator, args)
+        stats = self.stats.setdefault(name, {"hits": 0, "misses": 0})
+        row = self._db.execute(
+            "SELECT value FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            stats["hits"] += 1
+            self._touched.append((time.time(), key))
+            self._flush_if_full()
+            return pickle.loads(zlib.decompress(row[0]))
+        stats["misses"] += 1
+        result = generator(*args)
+        # Pickled straight away, before later stages can modify the records
+        value = zlib.compress(pickle.dumps(result, protocol=4), 1)
+        self._inserts.append((key, value, len(value), time.time()))
+        self._flush_if_full()
+        return result
+
+    def _flush_if_full(self) -> None:
+        if len(self._inserts) + len(self._touched) >= BATCH_OPERATIONS:
+            self.flush()
+
+    def flush(self) -> None:
+        """Commits pending entries and access times, then evicts if over the limit."""
+        with self._db:
+            added = 0
+            for entry in self._inserts:
+                # Another worker may have just stored the same entry
+                if self._db.execute(
+                    "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?)", entry
+                ).rowcount:
+                    added += entry[2]
+            self._db.executemany(
+                "UPDATE entries SET used = ? WHERE key = ?", self._touched
+            )
+            self._db.execute("UPDATE meta SET bytes = bytes + ?", (added,))
+            (total,) = self._db.execute("SELECT bytes FROM meta").fetchone()
+        self._inserts, self._touched = [], []
+        if total > self.max_bytes:
+            self._evict(total - self.max_bytes * EVICT_TO)
+
+    def _evict(self, excess: float) -> None:
+        """Deletes the least recently used entries until `excess` bytes are freed."""
+        with self._db:
+            freed = 0
+            while freed < excess and (
+                rows := self._db.execute(
+                    "SELECT key, bytes FROM entries ORDER BY used LIMIT ?",
+                    (BATCH_OPERATIONS,),
+                ).fetchall()
+            ):
+                for key, size in rows:
+                    if freed >= excess:
+                        break
+                    if self._db.execute(
+                        "DELETE FROM entries WHERE key = ?", (key,)
+                    ).rowcount:
+                        freed += size
+            self._db.execute("UPDATE meta SET bytes = bytes - ?", (freed,))
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+
+def merge_cache_stats(total: dict, stats: dict) -> dict:
+    """Adds one process's per-generator hit and miss counts to `total`."""
+    for name, counts in stats.items():
+        entry = total.setdefault(name, {"hits": 0, "misses": 0})
+        entry["hits"] += counts["hits"]
+        entry["misses"] += counts["misses"]
+    return total
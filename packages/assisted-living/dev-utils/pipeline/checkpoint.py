@@ -0,0 +1,90 @@
+import json
+import os
+import random
+import shutil
+
+# What a checkpointed run was started with, checked before resuming it
+RUN_FILE = "run.json"
+# A copy of the hand-made residents, which the run rewrites in place
+RESIDENTS_FILE = "residents.json"
+
+
+class CheckpointError(ValueError):
+    pass
+
+
+def _save_json(path: str, data) -> None:
+    """Writes `data` to a temporary file and renames it over `path`, so a
+    checkpoint is either the previous one or the new one, never half of each."""
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def _load_json(path: str):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def start_checkpoints(checkpoint_dir: str, identity: dict) -> None:
+    """Clears any earlier run's checkpoints and records the identity of this one."""
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    os.makedirs(checkpoint_dir)
+    _save_json(os.path.join(checkpoint_dir, RUN_FILE), identity)
+
+
+def load_run(checkpoint_dir: str) -> dict:
+    """The identity `start_checkpoints` recorded for the run being resumed."""
+    try:
+        return _load_json(os.path.join(checkpoint_dir, RUN_FILE))
+    except FileNotFoundError:
+        raise CheckpointError(f"no checkpoint to resume in {checkpoint_dir}.") from None
+
+
+def progress_path(checkpoint_dir: str, start: int) -> str:
+    return os.path.join(checkpoint_dir, f"residents-{start:07d}.json")
+
+
+def save_progress(checkpoint_dir: str, start: int, progress: dict) -> None:
+    """Records how far the residents from index `start` have got.
+
+    The outputs must already be flushed to disk, so that every offset in
+    `progress` is backed by the bytes before it.
+    """
+    _save_json(progress_path(checkpoint_dir, start), progress)
+
+
+def load_progress(checkpoint_dir: str, start: int):
+    """The last progress saved for the residents from `start`, or None if there is none."""
+    try:
+        return _load_json(progress_path(checkpoint_dir, start))
+    except FileNotFoundError:
+        return None
+
+
+def truncate_output(path: str, size: int) -> None:
+    """Cuts a file back to the `size` it had at a checkpoint.
+
+    Whatever was written after the checkpoint, including a partial trailing
+    record, is dropped. A file shorter than at the checkpoint lost data the
+    checkpoint relies on, so the run cannot be resumed.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < size:
+        raise CheckpointError(
+            f"{path} is shorter than at the last checkpoint; rerun without --resume."
+        )
+    os.truncate(path, size)
+
+
+def random_state(generator: random.Random) -> list:
+    """A `random.Random` state in a form JSON can hold."""
+    version, internal, gauss = generator.getstate()
+    return [version, list(internal), gauss]
+
+
+def set_random_state(generator: random.Random, state: list) -> None:
+    version, internal, gauss = state
+    generator.setstate((version, tuple(internal), gauss))
@@ -0,0 +1,233 @@
+import gzip
+import io
+import os
+import shutil
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# --compress choices, by the suffix they add to each output file
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+# Uncompressed bytes per zstd frame. Frames are independent, so shard files
+# are concatenated without recompressing and a trained dictionary applies
+# afresh at the start of every frame.
+FRAME_BYTES = 1 << 20
+# Largest dictionary trained per collection, and the share of the sample it
+# may be; zstd suggests samples of about 100 times the dictionary size
+DICTIONARY_BYTES = 112_640
+DICTIONARY_SAMPLE_RATIO = 10
+# One in this many sample records is held out to check a dictionary helps
+HELD_OUT_SHARE = 4
+
+
+class CompressionError(ValueError):
+    pass
+
+
+def require_zstandard() -> None:
+    if zstandard is None:
+        raise CompressionError(
+            "zstd compression requires zstandard; install the compress extra."
+        )
+
+
+def compressed_path(path: str, compression) -> str:
+    return path + COMPRESSIONS[compression] if compression else path
+
+
+def copy_file(path: str, out) -> None:
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            out.write(chunk)
+
+
+class GzipStream:
+    """A writable file compressing into gzip members.
+
+    A member is opened on the first write. `append_compressed` ends the
+    current member and copies another gzip file's members in verbatim, which
+    gzip readers treat as one continuous stream.
+    """
+
+    def __init__(self, path: str, level: int, mode: str = "wb"):
+        self._raw = open(path, mode)
+        self._level = level
+        self._member = None
+        # Appending to members already in the file
+        self._written = self._raw.tell() > 0
+
+    def write(self, data: bytes) -> None:
+        if self._member is None:
+            self._member = gzip.GzipFile(
+                fileobj=self._raw, mode="wb", compresslevel=self._level, mtime=0
+            )
+        self._member.write(data)
+        self._written = True
+
+    def _end_member(self) -> None:
+        if self._member is not None:
+            self._member.close()
+            self._member = None
+
+    def flush(self) -> None:
+        """Ends the current member, so the file holds only complete members."""
+        self._end_member()
+        self._raw.flush()
+
+    def fileno(self) -> int:
+        return self._raw.fileno()
+
+    def append_compressed(self, path: str) -> None:
+        self._end_member()
+        copy_file(path, self._raw)
+        self._written = True
+
+    def close(self) -> None:
+        if not self._written:
+            # An empty member keeps the file readable as gzip
+            self.write(b"")
+        self._end_member()
+        self._raw.close()
+
+
+class ZstdStream:
+    """A writable file compressing into independent zstd frames.
+
+    Input is buffered and compressed `FRAME_BYTES` at a time, optionally
+    with a trained dictionary. `append_compressed` flushes the pending frame
+    and copies another file's frames in verbatim.
+    """
+
+    def __init__(self, path: str, level: int, dictionary=None, mode: str = "wb"):
+        require_zstandard()
+        self._raw = open(path, mode)
+        self._compressor = zstandard.ZstdCompressor(
+            level=level,
+            dict_data=dictionary and zstandard.ZstdCompressionDict(dictionary),
+            write_content_size=True,
+        )
+        self._pending = []
+        self._pending_bytes = 0
+        self._written = self._raw.tell() > 0
+
+    def write(self, data: bytes) -> None:
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        if self._pending_bytes >= FRAME_BYTES:
+            self._flush_frame()
+
+    def _flush_frame(self) -> None:
+        if self._pending:
+            self._raw.write(self._compressor.compress(b"".join(self._pending)))
+            self._pending = []
+            self._pending_bytes = 0
+            self._written = True
+
+    def flush(self) -> None:
+        """Compresses the pending input into a frame of its own."""
+        self._flush_frame()
+        self._raw.flush()
+
+    def fileno(self) -> int:
+        return self._raw.fileno()
+
+    def append_compressed(self, path: str) -> None:
+        self._flush_frame()
+        copy_file(path, self._raw)
+        self._written = True
+
+    def close(self) -> None:
+        self._flush_frame()
+        if not self._written:
+            # An empty frame keeps the file readable as zstd
+            self._raw.write(self._compressor.compress(b""))
+        self._raw.close()
+
+
+def open_output(
+    path: str, compression=None, level=None, dictionary=None, append: bool = False
+):
+    """Opens a binary file for writing, compressed when `compression` is set.
+
+    With `append` the file is added to, as further gzip members or zstd
+    frames when compressed.
+    """
+    mode = "ab" if append else "wb"
+    if compression is None:
+        return open(path, mode)
+    level = level if level is not None else DEFAULT_LEVELS[compression]
+    if compression == "gzip":
+        return GzipStream(path, level, mode)
+    return ZstdStream(path, level, dictionary, mode)
+
+
+def open_input(path: str, dictionary=None):
+    """Opens a file for reading, decompressing by its `.gz` or `.zst` suffix."""
+    if path.endswith(COMPRESSIONS["gzip"]):
+        return gzip.open(path, "rb")
+    if path.endswith(COMPRESSIONS["zstd"]):
+        require_zstandard()
+        decompressor = zstandard.ZstdDecompressor(
+            dict_data=dictionary and zstandard.ZstdCompressionDict(dictionary)
+        )
+        return io.BufferedReader(
+            decompressor.stream_reader(open(path, "rb"), read_across_frames=True)
+        )
+    return open(path, "rb")
+
+
+def _compressed_size(records: list, compressor) -> int:
+    data = b"".join(records)
+    return sum(
+        len(compressor.compress(data[start : start + FRAME_BYTES]))
+        for start in range(0, len(data), FRAME_BYTES)
+    )
+
+
+def train_dictionaries(samples: dict, level=None) -> dict:
+    """Trains one zstd dictionary per collection from its sample records.
+
+    `samples` maps each collection to a list of serialised records. Each
+    dictionary is trained on the first records of its sample and kept only
+    if it shrinks the rest, compressed in frames as the writers do; the
+    other collections are compressed without one.
+    """
+    require_zstandard()
+    level = level if level is not None else DEFAULT_LEVELS["zstd"]
+    plain = zstandard.ZstdCompressor(level=level)
+    dictionaries = {}
+    for name, records in samples.items():
+        split = len(records) * (HELD_OUT_SHARE - 1) // HELD_OUT_SHARE
+        training, held_out = records[:split], records[split:]
+        size = min(DICTIONARY_BYTES, sum(map(len, training)) // DICTIONARY_SAMPLE_RATIO)
+        if size < 1024 or len(training) < 8:
+            continue
+        try:
+            dictionary = zstandard.train_dictionary(size, training, level=level)
+        except zstandard.ZstdError:
+            continue
+        trained = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+        if _compressed_size(held_out, trained) < _compressed_size(held_out, plain):
+            dictionaries[name] = dictionary.as_bytes()
+    return dictionaries
+
+
+def save_dictionaries(dictionaries: dict, dictionary_dir: str) -> None:
+    """Replaces the saved dictionaries, so none is left over from an earlier run."""
+    shutil.rmtree(dictionary_dir, ignore_errors=True)
+    os.makedirs(dictionary_dir, exist_ok=True)
+    for name, dictionary in dictionaries.items():
+        with open(os.path.join(dictionary_dir, f"{name}.dict"), "wb") as f:
+            f.write(dictionary)
+
+
+def load_dictionary(dictionary_dir: str, name: str):
+    """Reads a collection's dictionary saved by `save_dictionaries`, if any."""
+    path = os.path.join(dictionary_dir, f"{name}.dict")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
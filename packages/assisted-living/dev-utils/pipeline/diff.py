@@ -0,0 +1,268 @@
+import heapq
+import os
+import re
+import shutil
+import tempfile
+from .readers import iter_records, loads
+from .references import record_resident
+from .serialisers import get_serialiser
+
+# Sorted run files merged at once; more runs are merged in several passes
+MAX_FAN_IN = 64
+# Bytes a buffered line costs beyond its length: the bytes object and its
+# list slot
+LINE_OVERHEAD = 64
+# Field path segments Firestore accepts unquoted
+SIMPLE_FIELD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# Separates a line's sort key from its value; keys and compact JSON never
+# contain it unescaped, and it sorts below every key character, so lines
+# sort by key
+SEPARATOR = b"\t"
+# Suffixes of care plan and activity keys when joining the two; a plan
+# sorts ahead of its activities
+JOIN_PLAN = b"\x000"
+JOIN_ACTIVITY = b"\x001"
+
+
+class ExternalSorter:
+    """Sorts `(key, value)` byte pairs in bounded memory.
+
+    Pairs are buffered as `key\\tvalue` lines until they reach
+    `memory_bytes`, then sorted and written to a run file in `spill_dir`.
+    `sorted()` merges the runs, at most `MAX_FAN_IN` at a time, and yields
+    the pairs in key order; pairs with equal keys come out ordered by value.
+    """
+
+    def __init__(self, name: str, memory_bytes: int, spill_dir: str):
+        self.name = name
+        self.memory_bytes = memory_bytes
+        self._spill_dir = spill_dir
+        self._lines = []
+        self._buffered = 0
+        self._runs = []
+        self.count = 0
+
+    def add(self, key: bytes, value: bytes) -> None:
+        line = key + SEPARATOR + value + b"\n"
+        self._lines.append(line)
+        self._buffered += len(line) + LINE_OVERHEAD
+        self.count += 1
+        if self._buffered >= self.memory_bytes:
+            self._spill()
+
+    def _spill(self) -> None:
+        self._lines.sort()
+        path = os.path.join(self._spill_dir, f"{self.name}.{len(self._runs):05d}.run")
+        with open(path, "wb") as f:
+            f.writelines(self._lines)
+        self._runs.append(path)
+        self._lines = []
+        self._buffered = 0
+
+    def _merge(self, runs: list, path: str) -> None:
+        files = [open(run, "rb") for run in runs]
+        try:
+            with open(path, "wb") as out:
+                out.writelines(heapq.merge(*files))
+        finally:
+            for f in files:
+                f.close()
+        for run in runs:
+            os.remove(run)
+
+    def sorted(self):
+        """Yields every `(key, value)` pair in key order, then deletes the runs."""
+        if self._runs and self._lines:
+            self._spill()
+        runs, passes = self._runs, 0
+        while len(runs) > MAX_FAN_IN:
+            merged = []
+            for start in range(0, len(runs), MAX_FAN_IN):
+                path = os.path.join(
+                    self._spill_dir, f"{self.name}.pass{passes}.{len(merged):05d}.run"
+                )
+                self._merge(runs[start : start + MAX_FAN_IN], path)
+                merged.append(path)
+            runs, passes = merged, passes + 1
+        files = [open(run, "rb") for run in runs]
+        try:
+            if not files:
+                self._lines.sort()
+            lines = heapq.merge(*files) if files else self._lines
+            for line in lines:
+                key, _, value = line.rstrip(b"\n").partition(SEPARATOR)
+                yield key, value
+        finally:
+            for f in files:
+                f.close()
+            for run in runs:
+                os.remove(run)
+            self._lines, self._runs = [], []
+
+
+def field_path(parts: tuple) -> str:
+    """Joins field names into a Firestore field path, quoting where required."""
+    return ".".join(
+        (
+            part
+            if SIMPLE_FIELD.fullmatch(part)
+            else "`" + part.replace("\\", "\\\\").replace("`", "\\`") + "`"
+        )
+        for part in parts
+    )
+
+
+def diff_fields(old: dict, new: dict, prefix: tuple = ()) -> tuple:
+    """The fields of `new` that differ from `old`, as `(data, mask)`.
+
+    `data` holds the new values of changed fields, nested as in `new`;
+    `mask` lists the field path of each change. Maps present in both are
+    compared field by field, so only their changed fields are written;
+    lists and other values are replaced whole. A field only in `old` is in
+    `mask` but not `data`, which deletes it in a masked Firestore update.
+    """
+    data, mask = {}, []
+    for key, value in new.items():
+        if key in old and old[key] == value:
+            continue
+        if isinstance(value, dict) and isinstance(old.get(key), dict) and value:
+            nested, nested_mask = diff_fields(old[key], value, prefix + (key,))
+            if nested:
+                data[key] = nested
+            mask.extend(nested_mask)
+        else:
+            data[key] = value
+            mask.append(field_path(prefix + (key,)))
+    for key in old.keys() - new.keys():
+        mask.append(field_path(prefix + (key,)))
+    return data, mask
+
+
+class DatasetSorter:
+    """Sorts a generated dataset's documents by their Firestore path.
+
+    Each record becomes `residents/<id>` or
+    `residents/<resident>/<collection>/<id>` with its `data`, relative to
+    the provider. Care plan activities only name their care plan, so they
+    are joined to it first, on a sorter of their own keyed by care plan ID;
+    activities whose care plan is missing are counted in `unresolved`. The
+    two sorters fill at the same time, so each gets half of `memory_bytes`.
+    """
+
+    def __init__(self, name: str, memory_bytes: int, spill_dir: str):
+        self.documents = ExternalSorter(name, memory_bytes // 2, spill_dir)
+        self._activities = ExternalSorter(
+            f"{name}.activities", memory_bytes // 2, spill_dir
+        )
+        self._dumps = get_serialiser("auto").dumps
+        self.unresolved = 0
+
+    def read(self, paths: dict, dictionaries: dict = None):
+        """Adds the collections in `paths` (name to file) and yields the sorted documents."""
+        dictionaries = dictionaries or {}
+        for collection, path in paths.items():
+            for record in iter_records(path, dictionaries.get(collection)):
+                self._add(collection, record)
+        self._join_activities()
+        for key, value in self.documents.sorted():
+            yield key.decode(), value
+
+    def _add(self, collection: str, record: dict) -> None:
+        record_id = record["id"]
+        data = record.get("data") or {}
+        value = self._dumps(data)
+        if collection == "care_plans":
+            self._activities.add(
+                record_id.encode() + JOIN_PLAN, data["resident_id"].encode()
+            )
+        if collection == "care_plan_activities":
+            careplan_id = str(data.get("careplan_id")).encode()
+            self._activities.add(
+                careplan_id + JOIN_ACTIVITY + record_id.encode(), value
+            )
+            return
+        if collection == "residents":
+            path = f"residents/{record_id}"
+        else:
+            resident_id = record_resident(collection, data)
+            path = f"residents/{resident_id}/{collection}/{record_id}"
+        self.documents.add(path.encode(), value)
+
+    def _join_activities(self) -> None:
+        plan, resident_id = None, None
+        for key, value in self._activities.sorted():
+            if key.endswith(JOIN_PLAN):
+                plan, resident_id = key[: -len(JOIN_PLAN)], value
+                continue
+            careplan_id, _, activity_id = key.partition(JOIN_ACTIVITY)
+            if careplan_id == plan:
+                self.documents.add(
+                    b"residents/%s/care_plan_activities/%s"
+                    % (resident_id, activity_id),
+                    value,
+                )
+            else:
+                self.unresolved += 1
+
+
+def diff_documents(old, new):
+    """Merges two path-sorted `(path, data)` streams into Firestore operations.
+
+    Yields `{"op": "set", "path", "data"}` for new documents, `{"op":
+    "update", "path", "data", "mask"}` with only the changed fields of
+    changed ones, and `{"op": "delete", "path"}` for removed ones, in path
+    order. Documents whose encoded data is identical are never decoded.
+    """
+    old_doc, new_doc = next(old, None), next(new, None)
+    while old_doc is not None or new_doc is not None:
+        if new_doc is None or (old_doc is not None and old_doc[0] < new_doc[0]):
+            yield {"op": "delete", "path": old_doc[0]}
+            old_doc = next(old, None)
+        elif old_doc is None or new_doc[0] < old_doc[0]:
+            yield {"op": "set", "path": new_doc[0], "data": loads(new_doc[1])}
+            new_doc = next(new, None)
+        else:
+            if old_doc[1] != new_doc[1]:
+                data, mask = diff_fields(loads(old_doc[1]), loads(new_doc[1]))
+                if mask:
+                    yield {
+                        "op": "update",
+                        "path": new_doc[0],
+                        "data": data,
+                        "mask": mask,
+                    }
+            old_doc, new_doc = next(old, None), next(new, None)
+
+
+class DatasetDiff:
+    """Diffs two datasets in `memory_bytes`, spilling sorted runs to `spill_dir`.
+
+    Both datasets are sorted by document path in external runs, with the
+    memory budget split between them, then merged. After `run` is read,
+    `unresolved` counts each dataset's activities without a care plan.
+    """
+
+    def __init__(self, memory_bytes: int, spill_dir: str = None):
+        self.memory_bytes = memory_bytes
+        self.spill_dir = spill_dir
+        self.unresolved = {}
+
+    def run(
+        self,
+        old_paths: dict,
+        new_paths: dict,
+        old_dictionaries: dict = None,
+        new_dictionaries: dict = None,
+    ):
+        """Yields the operations turning the `old` dataset into the `new` one."""
+        work_dir = tempfile.mkdtemp(prefix="diff-", dir=self.spill_dir)
+        try:
+            old = DatasetSorter("old", self.memory_bytes // 2, work_dir)
+            new = DatasetSorter("new", self.memory_bytes // 2, work_dir)
+            yield from diff_documents(
+                old.read(old_paths, old_dictionaries),
+                new.read(new_paths, new_dictionaries),
+            )
+            self.unresolved = {"old": old.unresolved, "new": new.unresolved}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
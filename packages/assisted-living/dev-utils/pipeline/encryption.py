@@ -0,0 +1,261 @@
+import base64
+import json
+import os
+from datetime import datetime, time
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from .serialisers import encode_time
+
+# Mirrors lib/encryption.ts: AES-256-GCM with a 16-byte IV, base64 fields
+DEK_LENGTH = 32
+IV_LENGTH = 16
+TAG_LENGTH = 16
+# Local KEKs wrap DEKs with the usual 12-byte GCM nonce
+WRAP_NONCE_LENGTH = 12
+KEK_NAMES = ["general", "contact", "clinical", "financial"]
+
+# Which KEK protects each subcollection, as in generate-encrypted-payload/main.ts
+SUBCOLLECTION_KEKS = {
+    "emergency_contacts": "contact",
+    "allergies": "clinical",
+    "prescriptions": "clinical",
+    "observations": "clinical",
+    "diagnostic_history": "clinical",
+    "accounts": "financial",
+    "charges": "financial",
+    "claims": "financial",
+    "coverages": "financial",
+    "payments": "financial",
+    "adjustments": "financial",
+    "prescription_administration": "clinical",
+    "care_plans": "clinical",
+    "care_plan_activities": "clinical",
+    "episodes_of_care": "clinical",
+    "tasks": "clinical",
+    "procedures": "clinical",
+    "encounters": "clinical",
+    "goals": "clinical",
+    "identifiers": "general",
+    "addresses": "contact",
+}
+
+# Resident fields that stay plaintext, copied only when present
+RESIDENT_PLAINTEXT_FIELDS = [
+    "facility_id",
+    "created_at",
+    "updated_at",
+    "viewed_at",
+    "deactivated_at",
+]
+# Encrypted resident fields and the KEK whose DEK encrypts them
+RESIDENT_ENCRYPTED_FIELDS = {
+    "resident_name": "general",
+    "gender": "general",
+    "avatar_url": "general",
+    "room_no": "general",
+    "dob": "contact",
+    "resident_email": "contact",
+    "cell_phone": "contact",
+    "work_phone": "contact",
+    "home_phone": "contact",
+    "pcp": "clinical",
+}
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+class LocalKms:
+    """File-backed stand-in for Cloud KMS, holding one KEK per key name.
+
+    The file is created with fresh random KEKs on first use. DEKs wrapped
+    here can only be unwrapped with the same file, so payloads built with it
+    are for local emulators, not for the deployed app's KMS keys.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                keks = {
+                    name: base64.b64decode(key) for name, key in json.load(f).items()
+                }
+        else:
+            keks = {name: AESGCM.generate_key(bit_length=256) for name in KEK_NAMES}
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                json.dump({name: _b64(key) for name, key in keks.items()}, f, indent=2)
+        self._keks = {name: AESGCM(key) for name, key in keks.items()}
+
+    def generate_data_keys(self, kek_name: str, count: int) -> list:
+        """Generates `count` DEKs in one call, returning `(plaintext, wrapped)` pairs."""
+        kek = self._keks[kek_name]
+        material = os.urandom(count * (DEK_LENGTH + WRAP_NONCE_LENGTH))
+        keys = []
+        for offset in range(0, len(material), DEK_LENGTH + WRAP_NONCE_LENGTH):
+            dek = material[offset : offset + DEK_LENGTH]
+            nonce = material[
+                offset + DEK_LENGTH : offset + DEK_LENGTH + WRAP_NONCE_LENGTH
+            ]
+            keys.append((dek, nonce + kek.encrypt(nonce, dek, None)))
+        return keys
+
+    def unwrap_data_keys(self, kek_name: str, wrapped_keys: list) -> list:
+        """Unwraps a batch of DEKs produced by `generate_data_keys`."""
+        kek = self._keks[kek_name]
+        return [
+            kek.decrypt(wrapped[:WRAP_NONCE_LENGTH], wrapped[WRAP_NONCE_LENGTH:], None)
+            for wrapped in wrapped_keys
+        ]
+
+
+class ResidentKeys:
+    """Hands out one DEK per KEK for each resident, generating them in batches."""
+
+    def __init__(self, kms: LocalKms, batch_size: int = 1000):
+        self.kms = kms
+        self.batch_size = batch_size
+        self._pending = []
+
+    def next(self) -> dict:
+        """Returns `{kek_name: (AESGCM, base64 wrapped DEK)}` for the next resident."""
+        if not self._pending:
+            batches = {
+                name: self.kms.generate_data_keys(name, self.batch_size)
+                for name in KEK_NAMES
+            }
+            self._pending = [
+                {name: batches[name][i] for name in KEK_NAMES}
+                for i in range(self.batch_size)
+            ]
+            self._pending.reverse()
+        keys = self._pending.pop()
+        return {
+            name: (AESGCM(dek), _b64(wrapped)) for name, (dek, wrapped) in keys.items()
+        }
+
+
+def encrypt_data(plaintext: str, cipher: AESGCM) -> dict:
+    """Python counterpart of `encryptData` in lib/encryption.ts."""
+    iv = os.urandom(IV_LENGTH)
+    sealed = cipher.encrypt(iv, plaintext.encode(), None)
+    return {
+        "ciphertext": _b64(sealed[:-TAG_LENGTH]),
+        "iv": _b64(iv),
+        "authTag": _b64(sealed[-TAG_LENGTH:]),
+    }
+
+
+def decrypt_data(encrypted: dict, cipher: AESGCM) -> str:
+    """Python counterpart of `decryptData` in lib/encryption.ts."""
+    sealed = base64.b64decode(encrypted["ciphertext"]) + base64.b64decode(
+        encrypted["authTag"]
+    )
+    return cipher.decrypt(base64.b64decode(encrypted["iv"]), sealed, None).decode()
+
+
+def _dumps(value) -> str:
+    return json.dumps(
+        value, separators=(",", ":"), ensure_ascii=False, default=encode_time
+    )
+
+
+def _js_numbers(value):
+    """Turns whole floats into ints throughout a dict or list, as JavaScript holds them."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {key: _js_numbers(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_js_numbers(item) for item in value]
+    return value
+
+
+def _to_text(value) -> str:
+    """Stringifies a value the way `encryptField` does in JavaScript."""
+    if isinstance(value, (dict, list)):
+        text = _dumps(value)
+        # Only whole floats need rewriting, and Python writes them with ".0"
+        return _dumps(_js_numbers(value)) if ".0" in text else text
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime, time)):
+        return encode_time(value)
+    return str(value)
+
+
+def encrypt_field(value, cipher: AESGCM):
+    if value is None:
+        return None
+    return encrypt_data(_to_text(value), cipher)
+
+
+def encrypt_resident(resident: dict, keys: dict) -> dict:
+    """Builds the encrypted `residents/<id>` document."""
+    data = resident["data"]
+    encrypted = {
+        field: data[field] for field in RESIDENT_PLAINTEXT_FIELDS if field in data
+    }
+    for name in KEK_NAMES:
+        encrypted[f"encrypted_dek_{name}"] = keys[name][1]
+    for field, kek_name in RESIDENT_ENCRYPTED_FIELDS.items():
+        if data.get(field):
+            encrypted[f"encrypted_{field}"] = encrypt_field(
+                data[field], keys[kek_name][0]
+            )
+    return {"path": f"residents/{resident['id']}", "data": encrypted}
+
+
+def encrypt_record(resident_id: str, collection: str, record: dict, keys: dict) -> dict:
+    """Builds one encrypted subcollection document.
+
+    IDs stay plaintext; `payor`, `subject` and `performer` keep their `id`
+    and encrypt the rest; every other field becomes `encrypted_<field>`.
+    """
+    cipher, encrypted_dek = keys[SUBCOLLECTION_KEKS[collection]]
+    encrypted = {"encrypted_dek": encrypted_dek}
+    for field, value in record["data"].items():
+        if field == "payor" and isinstance(value, dict):
+            encrypted[field] = {
+                "id": value.get("id"),
+                "encrypted_organization": encrypt_field(
+                    value.get("organization"), cipher
+                ),
+            }
+        elif field == "subject" and isinstance(value, dict):
+            encrypted[field] = {
+                "id": value.get("id"),
+                "encrypted_name": encrypt_field(value.get("name"), cipher),
+            }
+        elif field == "performer" and isinstance(value, dict):
+            encrypted[field] = {
+                "id": value.get("id"),
+                "encrypted_name": encrypt_field(value.get("name"), cipher),
+                "encrypted_period": encrypt_field(value.get("period"), cipher),
+            }
+        elif field.endswith("_id") or field.endswith("_ids"):
+            encrypted[field] = value
+        else:
+            encrypted[f"encrypted_{field}"] = encrypt_field(value, cipher)
+    return {
+        "path": f"residents/{resident_id}/{collection}/{record['id']}",
+        "data": encrypted,
+    }
+
+
+def encrypt_resident_documents(
+    resident: dict, collections: dict, keys: dict, prefix: str = ""
+):
+    """Yields the resident's encrypted document, then each subcollection's.
+
+    `prefix` goes before every `residents/...` path, e.g. `providers/<id>/`
+    for a payload spanning several providers.
+    """
+    document = encrypt_resident(resident, keys)
+    yield {"path": prefix + document["path"], "data": document["data"]}
+    for collection, records in collections.items():
+        for record in records:
+            document = encrypt_record(resident["id"], collection, record, keys)
+            yield {"path": prefix + document["path"], "data": document["data"]}
@@ -0,0 +1,310 @@
+import asyncio
+import json
+import random
+import time
+from .serialisers import get_serialiser
+
+# Writes per batchWrite request, the API's limit
+MAX_BATCH_WRITES = 500
+# Request bodies stay under the 10 MiB request limit
+MAX_BATCH_BYTES = 9 * 2**20
+# gRPC codes of writes worth retrying: DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED,
+# ABORTED and UNAVAILABLE
+RETRYABLE_CODES = {4, 8, 10, 14}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# A response slower than this multiple of the fastest seen counts as congestion
+LATENCY_TOLERANCE = 2.0
+BACKOFF_SECONDS = 0.1
+MAX_BACKOFF_SECONDS = 5.0
+
+
+class FirestoreLoadError(RuntimeError):
+    pass
+
+
+def to_value(value) -> dict:
+    """Encodes a JSON value as a Firestore REST `Value`."""
+    if value is None:
+        return {"nullValue": None}
+    if isinstance(value, bool):
+        return {"booleanValue": value}
+    if isinstance(value, int):
+        return {"integerValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, str):
+        return {"stringValue": value}
+    if isinstance(value, dict):
+        return {"mapValue": {"fields": to_fields(value)}}
+    if isinstance(value, list):
+        return {"arrayValue": {"values": [to_value(item) for item in value]}}
+    raise TypeError(f"Cannot store {type(value).__name__} in Firestore")
+
+
+def to_fields(data: dict) -> dict:
+    return {field: to_value(value) for field, value in data.items()}
+
+
+class HttpConnection:
+    """One keep-alive HTTP/1.1 connection, reopened after any failure."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    async def post(self, target: str, body: bytes) -> tuple:
+        """Sends a JSON POST and returns the response status and body."""
+        try:
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_connection(
+                    self.host, self.port
+                )
+            self._writer.write(
+                (
+                    f"POST {target} HTTP/1.1\r\n"
+                    f"Host: {self.host}:{self.port}\r\n"
+                    # The emulator lets the "owner" token bypass security rules
+                    "Authorization: Bearer owner\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n"
+                ).encode()
+                + body
+            )
+            await self._writer.drain()
+            status, headers = await self._read_head()
+            if headers.get("transfer-encoding", "").lower() == "chunked":
+                response = await self._read_chunked()
+            else:
+                response = await self._reader.readexactly(
+                    int(headers.get("content-length", 0))
+                )
+            if headers.get("connection", "").lower() == "close":
+                self.close()
+            return status, response
+        except BaseException:
+            self.close()
+            raise
+
+    async def _read_head(self) -> tuple:
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by the server")
+        headers = {}
+        while (line := await self._reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return int(status_line.split()[1]), headers
+
+    async def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                raise ConnectionError("Connection closed inside a chunked response")
+            if not (size := int(line.split(b";")[0], 16)):
+                break
+            chunks.append(await self._reader.readexactly(size))
+            await self._reader.readline()
+        # Skip any trailers up to the blank line
+        while (await self._reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        return b"".join(chunks)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class AdaptiveLimiter:
+    """Caps the requests in flight, adapting the cap to latency and errors.
+
+    The cap grows by one after a cap's worth of requests return within
+    `LATENCY_TOLERANCE` times the fastest latency seen. It shrinks by a
+    quarter on a slow response and halves on an error. Only requests sent
+    after the last cut can cut it again, so one burst of congestion counts
+    once.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.peak = initial
+        self.in_flight = 0
+        self._fastest = None
+        self._successes = 0
+        self._last_cut = 0.0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """Waits for a free slot and returns the request's start time."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started: float, ok: bool) -> None:
+        latency = time.monotonic() - started
+        async with self._changed:
+            self.in_flight -= 1
+            if ok:
+                self._fastest = min(self._fastest or latency, latency)
+            if not ok:
+                self._cut(started, 0.5)
+            elif latency > self._fastest * LATENCY_TOLERANCE:
+                self._cut(started, 0.75)
+            else:
+                self._successes += 1
+                if self._successes >= self.limit:
+                    self.limit = min(self.maximum, self.limit + 1)
+                    self.peak = max(self.peak, self.limit)
+                    self._successes = 0
+            self._changed.notify_all()
+
+    def _cut(self, started: float, factor: float) -> None:
+        if started < self._last_cut:
+            return
+        self.limit = max(self.minimum, int(self.limit * factor))
+        self._successes = 0
+        self._last_cut = time.monotonic()
+
+
+class EmulatorLoader:
+    """Writes documents to the Firestore emulator with concurrent batchWrite requests.
+
+    Each document is encoded into its `update` write once, as it is read;
+    request bodies are spliced from those bytes, so retries re-encode
+    nothing. Requests share a pool of keep-alive connections, and an
+    `AdaptiveLimiter` sets how many are in flight. Documents are read
+    lazily, with at most `maximum` batches waiting, so memory stays flat.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        project: str,
+        database: str,
+        concurrency: tuple = (8, 1, 64),
+        batch_size: int = MAX_BATCH_WRITES,
+        retries: int = 8,
+    ):
+        hostname, _, port = host.rpartition(":")
+        self.batch_size = batch_size
+        self.retries = retries
+        self.limiter = AdaptiveLimiter(*concurrency)
+        self.documents_root = f"projects/{project}/databases/{database}/documents"
+        self.target = f"/v1/{self.documents_root}:batchWrite"
+        self.stats = {"documents": 0, "requests": 0, "retried_writes": 0}
+        self._dumps = get_serialiser("auto").dumps
+        self._pool = asyncio.LifoQueue()
+        for _ in range(self.limiter.maximum):
+            self._pool.put_nowait(HttpConnection(hostname, int(port)))
+
+    def encode(self, path: str, data: dict) -> bytes:
+        return self._dumps(
+            {
+                "update": {
+                    "name": f"{self.documents_root}/{path}",
+                    "fields": to_fields(data),
+                }
+            }
+        )
+
+    def _batches(self, documents):
+        batch, size = [], 0
+        for path, data in documents:
+            write = self.encode(path, data)
+            if batch and (
+                len(batch) == self.batch_size or size + len(write) > MAX_BATCH_BYTES
+            ):
+                yield batch
+                batch, size = [], 0
+            batch.append(write)
+            size += len(write) + 1
+        if batch:
+            yield batch
+
+    async def load(self, documents, progress=None) -> dict:
+        """Writes `(path, data)` pairs and returns counts of what was sent.
+
+        `progress(stats, limit)` is called after each batch is queued.
+        """
+        started = time.monotonic()
+        pending = set()
+        try:
+            for batch in self._batches(documents):
+                if len(pending) >= self.limiter.maximum:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        task.result()
+                pending.add(asyncio.create_task(self._send(batch)))
+                if progress:
+                    progress(self.stats, self.limiter.limit)
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                for task in done:
+                    task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            while not self._pool.empty():
+                self._pool.get_nowait().close()
+        return self.stats | {
+            "seconds": time.monotonic() - started,
+            "peak_concurrency": self.limiter.peak,
+            "final_concurrency": self.limiter.limit,
+        }
+
+    async def _send(self, writes: list) -> None:
+        """Sends one batch, retrying failed requests and writes with backoff."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retried_writes"] += len(writes)
+                delay = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2**attempt)
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+            status, response = await self._post(writes)
+            if status in RETRYABLE_STATUSES or status is None:
+                continue
+            if status != 200:
+                raise FirestoreLoadError(
+                    f"batchWrite failed with HTTP {status}: {response[:500]!r}"
+                )
+            failed = []
+            for write, result in zip(writes, json.loads(response).get("status", [])):
+                code = result.get("code", 0)
+                if code in RETRYABLE_CODES:
+                    failed.append(write)
+                elif code:
+                    raise FirestoreLoadError(
+                        f"Write failed with code {code}: {result.get('message')}"
+                    )
+            self.stats["documents"] += len(writes) - len(failed)
+            if not failed:
+                return
+            writes = failed
+        raise FirestoreLoadError(
+            f"{len(writes)} writes still failing after {self.retries} retries; "
+            f"last response: {response[:500]!r}"
+        )
+
+    async def _post(self, writes: list) -> tuple:
+        """POSTs one batch; the status is None when the connection failed."""
+        body = b'{"writes":[' + b",".join(writes) + b"]}"
+        started = await self.limiter.acquire()
+        connection = await self._pool.get()
+        try:
+            status, response = await connection.post(self.target, body)
+        except (OSError, asyncio.IncompleteReadError) as error:
+            status, response = None, str(error).encode()
+        finally:
+            self._pool.put_nowait(connection)
+        self.stats["requests"] += 1
+        await self.limiter.release(
+            started, status is not None and status not in RETRYABLE_STATUSES
+        )
+        return status, response
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+
+# Written next to the outputs after every run, and copied to the deployed
+# manifest once those outputs are uploaded
+CONTENT_MANIFEST_FILE = "content-manifest.json"
+DEPLOYED_MANIFEST_FILE = "deployed-manifest.json"
+DIGEST_MODULUS = 2**128
+
+
+class ContentDigest:
+    """An order-independent digest of a collection of serialised records.
+
+    The blake2b hashes of the records are summed modulo 2**128, so the
+    digests of shard files merge by addition. A file's digest is then the
+    same whatever the worker count or partitioning, and it is taken before
+    compression, so only a change to the records themselves changes it.
+    """
+
+    def __init__(self, hexdigest=None):
+        self.value = int(hexdigest, 16) if hexdigest else 0
+
+    def add(self, data: bytes) -> None:
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        self.value = (self.value + int.from_bytes(digest, "big")) % DIGEST_MODULUS
+
+    def merge(self, hexdigest: str) -> None:
+        self.value = (self.value + int(hexdigest, 16)) % DIGEST_MODULUS
+
+    def hexdigest(self) -> str:
+        return f"{self.value:032x}"
+
+
+def source_digest(paths: list) -> str:
+    """Hashes the Python files at `paths`, searching directories recursively."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, name) for name in names if name.endswith(".py")
+                )
+        else:
+            files.append(path)
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sorted(files, key=os.path.normpath):
+        with open(path, "rb") as f:
+            digest.update(os.path.basename(path).encode() + b"\0" + f.read())
+    return digest.hexdigest()
+
+
+def config_digest(config: dict) -> str:
+    encoded = json.dumps(config, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def content_manifest(shards: dict, generator_version: str, config: dict) -> dict:
+    """`shards` maps each output file, relative to the output directory, to its
+    collection, record count, bytes and content digest."""
+    return {
+        "generator_version": generator_version,
+        "config_hash": config_digest(config),
+        "config": config,
+        "shards": dict(sorted(shards.items())),
+    }
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+
+def load_manifest(path: str) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def changed_collections(shard: dict, deployed) -> list:
+    """The collections of `shard` whose digests differ from the `deployed` shard."""
+    collections = shard.get("collections") or {shard["collection"]: shard["digest"]}
+    if deployed is None:
+        return sorted(collections)
+    deployed_collections = deployed.get("collections") or {
+        deployed["collection"]: deployed["digest"]
+    }
+    return sorted(
+        name
+        for name in collections.keys() | deployed_collections.keys()
+        if collections.get(name) != deployed_collections.get(name)
+    )
+
+
+def plan_upload(current: dict, deployed=None) -> dict:
+    """Compares a content manifest against the last deployed one.
+
+    Returns the shards to upload, by path, with the collections that
+    changed in each; the deployed shards no longer generated; and the count
+    of unchanged shards. Without a deployed manifest every shard is new.
+    """
+    deployed_shards = deployed["shards"] if deployed else {}
+    upload = {}
+    for path, shard in current["shards"].items():
+        if shard["digest"] != deployed_shards.get(path, {}).get("digest"):
+            upload[path] = changed_collections(shard, deployed_shards.get(path))
+    return {
+        "upload": upload,
+        "removed": sorted(deployed_shards.keys() - current["shards"].keys()),
+        "unchanged": len(current["shards"]) - len(upload),
+    }
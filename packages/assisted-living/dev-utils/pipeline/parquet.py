@@ -0,0 +1,180 @@
+import os
+import shutil
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Column kinds; "code" columns hold a handful of distinct values and are
+# dictionary-encoded in Arrow as well as in the Parquet pages
+STRING, CODE, TIMESTAMP, FLOAT, INTEGER = "string", "code", "timestamp", "float", "int"
+
+# Flattened columns per collection: (column, kind, path into the record)
+PARQUET_COLUMNS = {
+    "prescription_administration": [
+        ("id", STRING, ("id",)),
+        ("resident_id", STRING, ("data", "resident_id")),
+        ("prescription_id", STRING, ("data", "prescription_id")),
+        ("recorder_id", CODE, ("data", "recorder_id")),
+        ("status", CODE, ("data", "status")),
+        ("effective_datetime", TIMESTAMP, ("data", "effective_datetime")),
+        (
+            "medication_code",
+            CODE,
+            ("data", "medication", "code", "coding", 0, "code"),
+        ),
+        (
+            "medication_display",
+            CODE,
+            ("data", "medication", "code", "coding", 0, "display"),
+        ),
+        ("dose_number", INTEGER, ("data", "dosage", "dose_number")),
+        ("dose_value", FLOAT, ("data", "dosage", "administered_dose", "value")),
+        ("dose_unit", CODE, ("data", "dosage", "administered_dose", "unit")),
+        ("route_code", CODE, ("data", "dosage", "route", "coding", 0, "code")),
+    ],
+    "observations": [
+        ("id", STRING, ("id",)),
+        ("resident_id", STRING, ("data", "resident_id")),
+        ("recorder_id", CODE, ("data", "recorder_id")),
+        ("status", CODE, ("data", "status")),
+        ("effective_datetime", TIMESTAMP, ("data", "effective_datetime")),
+        ("loinc_code", CODE, ("data", "code", "coding", 0, "code")),
+        ("loinc_display", CODE, ("data", "code", "coding", 0, "display")),
+        ("value", FLOAT, ("data", "value_quantity", "value")),
+        ("unit", CODE, ("data", "value_quantity", "code")),
+        ("body_site_code", CODE, ("data", "body_site", "coding", 0, "code")),
+        ("method_code", CODE, ("data", "method", "coding", 0, "code")),
+        ("device_code", CODE, ("data", "device", "coding", 0, "code")),
+    ],
+    "encounters": [
+        ("id", STRING, ("id",)),
+        ("resident_id", STRING, ("data", "subject", "id")),
+        ("participant_id", CODE, ("data", "participant_id")),
+        ("episodes_of_care_id", STRING, ("data", "episodes_of_care_id")),
+        ("status", CODE, ("data", "status")),
+        ("type_code", CODE, ("data", "type", "coding", 0, "code")),
+        ("period_start", TIMESTAMP, ("data", "period", "start")),
+        ("period_end", TIMESTAMP, ("data", "period", "end")),
+        ("recorded_at", TIMESTAMP, ("data", "recorded_at")),
+    ],
+}
+# Column whose month picks the file a row goes to
+PARQUET_PARTITION_COLUMNS = {
+    "prescription_administration": "effective_datetime",
+    "observations": "effective_datetime",
+    "encounters": "period_start",
+}
+
+
+def _lookup(record: dict, path: tuple):
+    value = record
+    for key in path:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return value
+
+
+def _month(value) -> str:
+    """`YYYY-MM` of a datetime or of an ISO string such as eMAR's timestamps."""
+    if value is None:
+        return "__NULL__"
+    if isinstance(value, datetime):
+        return f"{value.year:04d}-{value.month:02d}"
+    return value[:7]
+
+
+def _column(kind: str, values: list):
+    if kind == TIMESTAMP:
+        # eMAR timestamps are already ISO strings; Arrow parses those itself
+        if any(isinstance(value, str) for value in values):
+            return pa.array(values, pa.string()).cast(pa.timestamp("us", tz="UTC"))
+        return pa.array(values, pa.timestamp("us", tz="UTC"))
+    if kind == CODE:
+        return pa.array(values, pa.string()).dictionary_encode()
+    return pa.array(
+        values, {STRING: pa.string(), FLOAT: pa.float64(), INTEGER: pa.int32()}[kind]
+    )
+
+
+class ClinicalParquetExport:
+    """Writes flattened, typed Parquet files for the high-volume clinical collections.
+
+    Each collection gets one file per month, `<collection>/<YYYY-MM>.parquet`,
+    so a reader scanning a date range opens only the months it needs. Rows are
+    buffered and each flush appends one row group to every month it touched.
+    """
+
+    def __init__(self, path: str, flush_rows: int = 200_000):
+        if pa is None:
+            raise ValueError("Parquet output needs pyarrow: uv sync --extra parquet")
+        self.path = path
+        self.count = 0
+        self.flush_rows = flush_rows
+        shutil.rmtree(path, ignore_errors=True)
+        self._buffers = {}
+        self._buffered = 0
+        self._writers = {}
+
+    def write(self, collection: str, records) -> None:
+        columns = PARQUET_COLUMNS[collection]
+        partition = [name for name, _, _ in columns].index(
+            PARQUET_PARTITION_COLUMNS[collection]
+        )
+        for record in records:
+            row = tuple(_lookup(record, path) for _, _, path in columns)
+            self._buffers.setdefault((collection, _month(row[partition])), []).append(
+                row
+            )
+            self._buffered += 1
+            self.count += 1
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def _writer(self, collection: str, month: str, schema):
+        key = (collection, month)
+        if key not in self._writers:
+            path = os.path.join(self.path, collection, f"{month}.parquet")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._writers[key] = pq.ParquetWriter(path, schema, compression="zstd")
+        return self._writers[key]
+
+    def _write_table(self, collection: str, month: str, table) -> None:
+        self._writer(collection, month, table.schema).write_table(table)
+
+    def flush(self) -> None:
+        for (collection, month), rows in sorted(self._buffers.items()):
+            columns = PARQUET_COLUMNS[collection]
+            table = pa.table(
+                {
+                    name: _column(kind, [row[i] for row in rows])
+                    for i, (name, kind, _) in enumerate(columns)
+                }
+            )
+            self._write_table(collection, month, table)
+        self._buffers = {}
+        self._buffered = 0
+
+    def append_shard(self, path: str, count: int) -> None:
+        """Copies another export's row groups into this one's month files, in order."""
+        self.flush()
+        for collection in PARQUET_COLUMNS:
+            shard_dir = os.path.join(path, collection)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in sorted(os.listdir(shard_dir)):
+                shard = pq.ParquetFile(os.path.join(shard_dir, name))
+                month = os.path.splitext(name)[0]
+                for i in range(shard.num_row_groups):
+                    self._write_table(collection, month, shard.read_row_group(i))
+        self.count += count
+
+    def close(self) -> None:
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
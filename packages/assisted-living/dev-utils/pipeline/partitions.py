@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+# --partition-by choices
+PARTITION_MODES = ["provider", "facility", "hash", "size"]
+MANIFEST_FILE = "manifest.json"
+# Partitions whose files are open at once; the least recently used are
+# suspended and reopened for appending when their next resident comes along
+MAX_OPEN_PARTITIONS = 32
+
+
+def resident_bucket(resident_id: str, buckets: int) -> int:
+    """A resident's hash bucket, the same in every process and run."""
+    digest = hashlib.blake2b(resident_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % buckets
+
+
+class PartitionedWriters:
+    """Splits the per-resident outputs into partitions that upload independently.
+
+    Each partition is a directory laid out like the output directory, and
+    every document of a resident lands in the same one, so partitions cover
+    disjoint `residents/<id>` key ranges. `mode` picks the partition:
+
+    - provider: the provider owning the resident's facility
+    - facility: the resident's `facility_id`
+    - hash: `bucket-<n>`, a stable hash of the resident ID modulo `buckets`
+    - size: contiguous runs of residents, named after the index of their
+      first resident, cut once a partition holds `target_bytes` before
+      compression. Each worker shard cuts its own range from its first
+      resident, and merging only appends partitions of the same name, so
+      the boundaries, names and count of size partitions depend on the
+      number of workers; the other modes do not
+
+    `open_partition(dir)` opens one partition's writers. Closing writes
+    `manifest.json` with each partition's files, record counts, bytes and
+    content digests, and keeps it as `manifest`; worker shards write one
+    too, which is how they are merged.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        open_partition,
+        mode: str,
+        buckets: int = 16,
+        target_bytes: int = 256 * 2**20,
+    ):
+        self.path = path
+        self.count = 0
+        self.mode = mode
+        self.buckets = buckets
+        self.target_bytes = target_bytes
+        # Partitions are appended to, so start from an empty directory
+        shutil.rmtree(path, ignore_errors=True)
+        self._open_partition = open_partition
+        self._partitions = {}
+        self._residents = {}
+        # Partitions with open files, least recently used first
+        self._open = OrderedDict()
+        self._current = None
+        self.manifest = None
+
+    def _key(self, index: int, resident: dict, provider_id: str) -> str:
+        if self.mode == "provider":
+            return provider_id
+        if self.mode == "facility":
+            return resident["data"]["facility_id"]
+        if self.mode == "hash":
+            return f"bucket-{resident_bucket(resident['id'], self.buckets):03d}"
+        if self._current is None or self._size(self._current) >= self.target_bytes:
+            self._current = f"residents-{index:07d}"
+        return self._current
+
+    def _size(self, key: str) -> int:
+        return sum(writer.bytes_written for writer in self._partitions[key].values())
+
+    def partition(self, key: str) -> dict:
+        """Returns a partition's writers, opening or resuming them as needed."""
+        if key not in self._partitions:
+            self._evict()
+            self._partitions[key] = self._open_partition(os.path.join(self.path, key))
+            self._residents[key] = 0
+        elif key not in self._open:
+            self._evict()
+            for writer in self._partitions[key].values():
+                writer.resume()
+        self._open[key] = True
+        self._open.move_to_end(key)
+        return self._partitions[key]
+
+    def _evict(self) -> None:
+        while len(self._open) >= MAX_OPEN_PARTITIONS:
+            key, _ = self._open.popitem(last=False)
+            for writer in self._partitions[key].values():
+                writer.suspend()
+
+    def writers_for(self, index: int, resident: dict, provider_id: str) -> dict:
+        """Returns the writers for a resident's documents; `index` is its position in the run."""
+        key = self._key(index, resident, provider_id)
+        writers = self.partition(key)
+        self._residents[key] += 1
+        self.count += 1
+        return writers
+
+    def append_shard(self, path: str, count: int) -> None:
+        """Appends another set of partitions, by its manifest, in partition order."""
+        with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+            manifest = json.load(f)
+        for entry in manifest["partitions"]:
+            writers = self.partition(entry["name"])
+            for name, file in entry["files"].items():
+                writers[name].append_shard(
+                    os.path.join(path, file["path"]), file["records"]
+                )
+                writers[name].merge_content(file)
+            self._residents[entry["name"]] += entry["residents"]
+        self.count += count
+
+    def close(self) -> None:
+        partitions = []
+        for key in sorted(self._partitions):
+            writers = self._partitions[key]
+            for writer in writers.values():
+                if key not in self._open:
+                    writer.resume()
+                writer.close()
+            self._open.pop(key, None)
+            files = {
+                name: {
+                    "path": os.path.relpath(writer.path, self.path),
+                    "bytes": os.path.getsize(writer.path),
+                }
+                | writer.content()
+                for name, writer in writers.items()
+            }
+            partitions.append(
+                {
+                    "name": key,
+                    "path": key,
+                    "residents": self._residents[key],
+                    "records": sum(file["records"] for file in files.values()),
+                    "bytes": sum(file["bytes"] for file in files.values()),
+                    "files": files,
+                }
+            )
+        self.manifest = {"partition_by": self.mode, "partitions": partitions}
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, MANIFEST_FILE), "w") as f:
+            json.dump(self.manifest, f, indent=2)
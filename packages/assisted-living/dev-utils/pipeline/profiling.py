@@ -0,0 +1,203 @@
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import time as timer
+import tracemalloc
+from contextlib import contextmanager
+
+TOP_FUNCTIONS = 25
+# One sample in this many is traced with tracemalloc and cProfile, the rest
+# only timed. Tracing slows allocation-heavy code several times over, and
+# unevenly, so timing it alongside would skew the ranking.
+TRACE_EVERY = 5
+
+
+class Profiler:
+    """Collects wall time, call counts and allocation deltas for named sections.
+
+    Sections nest: a section's self time excludes the sections called inside
+    it, so a `write` section wrapping `serialise` reports only the framing and
+    file I/O. Allocation deltas are net traced memory across the whole call,
+    so memory a section allocates and its caller frees shows up as positive
+    here and negative there. A cProfile run alongside catches
+    the helpers too small to wrap, such as `generate_uuid`.
+
+    The run is split into samples, each starting at a call of a section
+    instrumented with `sample=True` (one resident, say). Every
+    `trace_every`th sample runs under tracemalloc and cProfile and only
+    contributes allocations and the cProfile listing; the others run with
+    no tracer and only contribute times. Allocations are scaled up from the
+    traced calls to all calls. A generator function's section covers each
+    resumption rather than the call, and counts one call per item.
+    """
+
+    def __init__(self, trace_every: int = TRACE_EVERY):
+        self.sections = {}
+        self.trace_every = trace_every
+        self._stack = []
+        self._profile = cProfile.Profile()
+        self._started = None
+        self._tracing = False
+        self._trace_started = None
+        self.samples = 0
+        self.traced_samples = 0
+        self.traced_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def start(self) -> None:
+        self._started = timer.perf_counter()
+
+    def stop(self) -> None:
+        self._set_tracing(False)
+        self.wall_seconds = timer.perf_counter() - self._started
+
+    def _set_tracing(self, tracing: bool) -> None:
+        if tracing == self._tracing:
+            return
+        now = timer.perf_counter()
+        if tracing:
+            tracemalloc.start()
+            self._profile.enable()
+            self._trace_started = now
+        else:
+            self._profile.disable()
+            tracemalloc.stop()
+            self.traced_seconds += now - self._trace_started
+        self._tracing = tracing
+
+    def _next_sample(self) -> None:
+        # The second sample is the first traced, so a one-sample run is timed
+        traced = self.samples % self.trace_every == 1
+        self.samples += 1
+        self.traced_samples += traced
+        self._set_tracing(traced)
+
+    def _enter(self) -> tuple:
+        # Seconds spent in sections nested inside this one
+        self._stack.append(0.0)
+        if self._tracing:
+            return True, tracemalloc.get_traced_memory()[0]
+        return False, timer.perf_counter()
+
+    def _exit(self, name: str, traced: bool, started) -> None:
+        if traced:
+            allocated = tracemalloc.get_traced_memory()[0] - started
+        else:
+            seconds = timer.perf_counter() - started
+        nested_seconds = self._stack.pop()
+        section = self.sections.setdefault(
+            name,
+            {
+                "calls": 0,
+                "seconds": 0.0,
+                "self_seconds": 0.0,
+                "traced_calls": 0,
+                "alloc_bytes": 0,
+            },
+        )
+        section["calls"] += 1
+        if traced:
+            section["traced_calls"] += 1
+            section["alloc_bytes"] += allocated
+            return
+        section["seconds"] += seconds
+        section["self_seconds"] += seconds - nested_seconds
+        if self._stack:
+            self._stack[-1] += seconds
+
+    @contextmanager
+    def measure(self, name: str):
+        traced, started = self._enter()
+        try:
+            yield
+        finally:
+            self._exit(name, traced, started)
+
+    def wrap(self, name: str, function, sample: bool = False):
+        if inspect.isgeneratorfunction(function):
+            return self._wrap_generator(name, function)
+
+        # Inlines `measure` to keep the wrapper's own cost out of the profile
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if sample:
+                self._next_sample()
+            traced, started = self._enter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._exit(name, traced, started)
+
+        return wrapper
+
+    def _wrap_generator(self, name: str, function):
+        # A generator's work runs as its consumer pulls items, inside whatever
+        # section the consumer is in, so each resumption is measured instead
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            generator = function(*args, **kwargs)
+            while True:
+                traced, started = self._enter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    self._exit(name, traced, started)
+                yield item
+
+        return wrapper
+
+    def instrument(
+        self, owner, attribute: str, name: str, sample: bool = False
+    ) -> None:
+        """Replaces `owner.attribute` (a module or class function) with a measured one.
+
+        With `sample`, each call starts a new sample.
+        """
+        setattr(owner, attribute, self.wrap(name, getattr(owner, attribute), sample))
+
+    def report(self, prefix: str) -> str:
+        """Writes `<prefix>.pstats` and `<prefix>.txt`, returning the text report.
+
+        Sections are ranked by self time over the untraced samples; the
+        cProfile listing of the traced samples follows.
+        """
+        timed_seconds = self.wall_seconds - self.traced_seconds
+        lines = [
+            f"Wall time: {self.wall_seconds:.2f}s, of which {timed_seconds:.2f}s "
+            f"untraced; {self.traced_samples} of {self.samples} samples traced "
+            "for allocations and cProfile",
+            "",
+            f"{'section':<60} {'calls':>9} {'total s':>9} {'self s':>9} {'self %':>7} {'alloc Δ MiB':>12}",
+        ]
+        ranked = sorted(
+            self.sections.items(),
+            key=lambda item: item[1]["self_seconds"],
+            reverse=True,
+        )
+        for name, section in ranked:
+            share = section["self_seconds"] / timed_seconds if timed_seconds else 0
+            alloc_bytes = (
+                section["alloc_bytes"] * section["calls"] / section["traced_calls"]
+                if section["traced_calls"]
+                else 0
+            )
+            lines.append(
+                f"{name:<60} {section['calls']:>9} {section['seconds']:>9.2f} "
+                f"{section['self_seconds']:>9.2f} {share:>7.1%} "
+                f"{alloc_bytes / 2**20:>12.1f}"
+            )
+        stream = io.StringIO()
+        if self.traced_samples:
+            self._profile.dump_stats(f"{prefix}.pstats")
+            stats = pstats.Stats(self._profile, stream=stream)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_FUNCTIONS)
+        else:
+            stream.write("No sample was traced; profile more residents for cProfile.\n")
+        text = "\n".join(lines) + "\n\n" + stream.getvalue()
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(text)
+        return text
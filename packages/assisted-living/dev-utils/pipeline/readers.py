@@ -0,0 +1,48 @@
+import json
+from .compression import open_input
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+loads = orjson.loads if orjson else json.loads
+
+
+class RecordFormatError(ValueError):
+    pass
+
+
+def iter_records(path: str, dictionary=None):
+    """Streams the records of a file written by `pipeline.writers`, one at a time.
+
+    Reads JSONL, and JSON arrays with one record per line or indented two
+    spaces (`--indent`, or `json.dump(..., indent=2)`), without loading the
+    whole file. Files ending in `.gz` or `.zst` are decompressed as they are
+    read, zstd ones with the `dictionary` they were compressed with, if any.
+    Any other layout, such as a whole array on one line, raises
+    `RecordFormatError` rather than yielding nothing.
+    """
+    with open_input(path, dictionary) as f:
+        lines = []
+        for number, line in enumerate(f, 1):
+            line = line.rstrip(b"\r\n")
+            if not lines:
+                if line in (b"[", b"]", b"[]", b""):
+                    continue
+                if line.startswith(b"{"):
+                    # A whole record on one line
+                    yield loads(line[:-1] if line.endswith(b",") else line)
+                    continue
+                if line != b"  {":
+                    raise RecordFormatError(
+                        f"{path}:{number} is not a record written one per line "
+                        "or indented two spaces."
+                    )
+            lines.append(line)
+            # An indented record ends with its closing brace at the array's indent
+            if line in (b"  }", b"  },"):
+                yield loads(b"\n".join(lines).rstrip(b","))
+                lines = []
+        if lines:
+            raise RecordFormatError(f"{path} ends inside an unterminated record.")
@@ -0,0 +1,535 @@
+import array
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from .readers import iter_records
+
+# (source collection, field in `data`, target collection); a list-valued
+# field holds several IDs. Null references are allowed.
+REFERENCES = [
+    ("prescription_administration", "prescription_id", "prescriptions"),
+    ("claims", "charge_ids", "charges"),
+    ("claims", "coverage_id", "coverages"),
+    ("payments", "claim_id", "claims"),
+    ("payments", "coverage_id", "coverages"),
+    ("adjustments", "claim_id", "claims"),
+    ("care_plans", "goal_ids", "goals"),
+    ("care_plan_activities", "careplan_id", "care_plans"),
+    ("encounters", "episodes_of_care_id", "episodes_of_care"),
+]
+# Where a record names its resident, when that is not `data.resident_id`.
+# Activities only name their care plan, so their links are checked for
+# existence but not for the resident they belong to.
+RESIDENT_PATHS = {
+    "residents": None,
+    "encounters": ("subject", "id"),
+    "procedures": ("subject", "id"),
+    "accounts": ("subject", "id"),
+    "coverages": ("beneficiary_id",),
+    "care_plan_activities": None,
+}
+DEFAULT_RESIDENT_PATH = ("resident_id",)
+# Every other record's resident must exist; reported under this field
+RESIDENT_FIELD = "resident_id"
+
+# References are checked in batches of this many
+BATCH_SIZE = 100_000
+# Bytes a pending key takes in its `array('q')`
+KEY_BYTES = 8
+# A spilled key set over the budget flushes its pending keys once it has
+# this many, so a budget held by other sets' keys costs one append per
+# batch of keys rather than one per key
+MIN_FLUSH_KEYS = 4096
+BLOOM_BITS_PER_KEY = 10
+# A spilled key set is split into at most 2**this many partition files at
+# once, keeping the open files bounded; a partition still over budget is
+# split again on the next bits of its keys
+PARTITION_BITS = 8
+BLOOM_HASHES = 7
+# A spilled key set's Bloom filter is sized for this many times the keys it
+# held when it spilled; more keys only raise its false-positive rate
+BLOOM_HEADROOM = 2
+# Candidate references awaiting an exact check against a spilled key set
+CANDIDATE = np.dtype([("id", "<i8"), ("owned", "<i8"), ("context", "<i8")])
+# `owned` of a candidate whose resident is not checked
+NO_OWNER = 0
+
+
+def record_resident(collection: str, data: dict):
+    """The ID of the resident a record belongs to, or None if it does not say."""
+    path = RESIDENT_PATHS.get(collection, DEFAULT_RESIDENT_PATH)
+    if path is None:
+        return None
+    value = data
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def id_key(record_id: str) -> int:
+    return hash(record_id)
+
+
+def owned_key(resident_id: str, record_id: str) -> int:
+    # 0 marks candidates without an owner check, so it is never a real key
+    return hash((resident_id, record_id)) or 1
+
+
+def stream_order(collections) -> list:
+    """Orders collections so every reference target is read before its sources."""
+    order = []
+
+    def visit(collection):
+        if collection in order:
+            return
+        for source, _, target in REFERENCES:
+            if source == collection:
+                visit(target)
+        order.append(collection)
+
+    visit("residents")
+    for collection in collections:
+        visit(collection)
+    return [collection for collection in order if collection in collections]
+
+
+class MemoryBudget:
+    """Shared byte budget of every key set's in-memory keys and Bloom filters.
+
+    `used_bytes` is a running total: key sets add to it on every key and
+    adjust it whenever they sort, spill or flush, so checking it is cheap
+    enough to do per key.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self.key_sets = []
+
+    def exceeded(self) -> bool:
+        return self.used_bytes > self.limit_bytes
+
+
+def _bit_field(keys: np.ndarray, shift: int, bits: int) -> np.ndarray:
+    mask = np.uint64((1 << bits) - 1)
+    return (keys.view(np.uint64) >> np.uint64(shift)) & mask
+
+
+def _in_partition(keys: np.ndarray, level: tuple) -> np.ndarray:
+    """Marks the keys whose bit fields match a `KeySet` partition's `level`."""
+    inside = np.ones(len(keys), dtype=bool)
+    for shift, bits, value in level:
+        inside &= _bit_field(keys, shift, bits) == value
+    return inside
+
+
+class KeySet:
+    """Set of 64-bit ID hashes, held in memory while the budget allows.
+
+    Keys accumulate in an `array('q')` and are sorted into a NumPy array
+    once their collection has been read. A set that pushes the budget over
+    spills instead: its keys move to a file, and a Bloom filter answers
+    lookups. Keys the filter rules out are definitely absent; possible hits
+    go to a candidates file and are checked exactly, partition by
+    partition, once every collection has been read.
+    """
+
+    def __init__(self, name: str, budget: MemoryBudget, spill_dir: str):
+        self.name = name
+        self.count = 0
+        self._budget = budget
+        self._spill_dir = spill_dir
+        self._pending = array.array("q")
+        self._keys = np.empty(0, dtype=np.int64)
+        self._bloom = None
+        self._path = None
+        budget.key_sets.append(self)
+
+    @property
+    def spilled(self) -> bool:
+        return self._bloom is not None
+
+    def memory_bytes(self) -> int:
+        bloom_bytes = 0 if self._bloom is None else self._bloom.nbytes
+        return (
+            self._pending.itemsize * len(self._pending)
+            + self._keys.nbytes
+            + bloom_bytes
+        )
+
+    def add(self, key: int) -> None:
+        self._pending.append(key)
+        self.count += 1
+        budget = self._budget
+        budget.used_bytes += KEY_BYTES
+        if budget.used_bytes > budget.limit_bytes:
+            if not self.spilled:
+                self.spill()
+            elif len(self._pending) >= MIN_FLUSH_KEYS:
+                self._flush_pending()
+
+    def spill(self) -> None:
+        before = self.memory_bytes()
+        self._path = os.path.join(self._spill_dir, f"{self.name}.keys")
+        bits = max(self.count * BLOOM_HEADROOM * BLOOM_BITS_PER_KEY, 1 << 16)
+        self._bloom = np.zeros(-(-bits // 8), dtype=np.uint8)
+        self._bloom_add(self._keys)
+        with open(self._path, "wb") as f:
+            self._keys.tofile(f)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._budget.used_bytes += self.memory_bytes() - before
+        self._flush_pending()
+
+    def freeze(self) -> None:
+        """Called once the collection has been read; finishes the set for lookups."""
+        if self.spilled:
+            self._flush_pending()
+            return
+        before = self.memory_bytes()
+        self._keys = np.unique(
+            np.concatenate([self._keys, np.frombuffer(self._pending, dtype=np.int64)])
+        )
+        self._pending = array.array("q")
+        self._budget.used_bytes += self.memory_bytes() - before
+
+    def _flush_pending(self) -> None:
+        keys = np.frombuffer(self._pending, dtype=np.int64)
+        self._bloom_add(keys)
+        with open(self._path, "ab") as f:
+            keys.tofile(f)
+        self._budget.used_bytes -= KEY_BYTES * len(self._pending)
+        self._pending = array.array("q")
+
+    def _bloom_positions(self, keys: np.ndarray) -> np.ndarray:
+        # Double hashing: the key's two halves stand in for BLOOM_HASHES hashes
+        keys = keys.view(np.uint64)
+        low, high = keys & np.uint64(0xFFFFFFFF), (keys >> np.uint64(32)) | np.uint64(1)
+        rounds = np.arange(BLOOM_HASHES, dtype=np.uint64)
+        return (low[:, None] + rounds[None, :] * high[:, None]) % np.uint64(
+            len(self._bloom) * 8
+        )
+
+    def _bloom_add(self, keys: np.ndarray) -> None:
+        positions = self._bloom_positions(keys).ravel()
+        np.bitwise_or.at(
+            self._bloom,
+            positions >> np.uint64(3),
+            np.left_shift(1, positions & np.uint64(7)).astype(np.uint8),
+        )
+
+    def lookup(self, keys: np.ndarray) -> tuple:
+        """Returns `(present, maybe)` masks; `maybe` is only set once spilled."""
+        if not self.spilled:
+            index = np.searchsorted(self._keys, keys)
+            present = index < len(self._keys)
+            present[present] = self._keys[index[present]] == keys[present]
+            return present, np.zeros(len(keys), dtype=bool)
+        positions = self._bloom_positions(keys)
+        bits = (
+            self._bloom[positions >> np.uint64(3)] >> (positions & np.uint64(7))
+        ) & 1
+        return np.zeros(len(keys), dtype=bool), bits.all(axis=1)
+
+    def _partitions(self):
+        """Yields each partition of the keys small enough for the budget.
+
+        A partition is `(level, keys)`: its sorted keys, and the
+        `(shift, bits, value)` bit fields every key in it has, which
+        `_in_partition` tests candidates against.
+        """
+        if not self.spilled:
+            yield (), self._keys
+            return
+        yield from self._split(self._path, ())
+
+    def _split(self, path: str, level: tuple):
+        size = os.path.getsize(path)
+        shift = sum(bits for _, bits, _ in level)
+        # Each partition is loaded whole, alongside a chunk of candidates
+        count = -(-size * 2 // max(self._budget.limit_bytes, 1))
+        if count <= 1 or shift >= 64:
+            keys = np.unique(np.fromfile(path, dtype=np.int64))
+            # The spilled keys themselves are read again for every field
+            if level:
+                os.remove(path)
+            yield level, keys
+            return
+        bits = min((count - 1).bit_length(), PARTITION_BITS, 64 - shift)
+        paths = [f"{path}.{p}" for p in range(1 << bits)]
+        files = [open(part, "wb") for part in paths]
+        try:
+            with open(path, "rb") as f:
+                while len(
+                    chunk := np.fromfile(f, dtype=np.int64, count=BATCH_SIZE * 10)
+                ):
+                    partition = _bit_field(chunk, shift, bits)
+                    for p, out in enumerate(files):
+                        chunk[partition == p].tofile(out)
+        finally:
+            for out in files:
+                out.close()
+        if level:
+            os.remove(path)
+        for p, part in enumerate(paths):
+            yield from self._split(part, level + ((shift, bits, p),))
+
+    def resolve(self, candidates_path: str, field: str) -> tuple:
+        """Checks candidates exactly, splitting them into present and absent files."""
+        present_path = f"{candidates_path}.present"
+        absent_path = f"{candidates_path}.absent"
+        with open(present_path, "wb") as present, open(absent_path, "wb") as absent:
+            for level, keys in self._partitions():
+                with open(candidates_path, "rb") as f:
+                    while len(
+                        chunk := np.fromfile(f, dtype=CANDIDATE, count=BATCH_SIZE)
+                    ):
+                        chunk = chunk[_in_partition(chunk[field], level)]
+                        index = np.searchsorted(keys, chunk[field])
+                        found = index < len(keys)
+                        found[found] = keys[index[found]] == chunk[field][found]
+                        chunk[found].tofile(present)
+                        chunk[~found].tofile(absent)
+        os.remove(candidates_path)
+        return present_path, absent_path
+
+
+class ReferenceCheck:
+    """Counts and sample failures of one `source.field -> target` reference."""
+
+    def __init__(self, source: str, field: str, target: str, spill_dir: str):
+        self.source, self.field, self.target = source, field, target
+        self.name = f"{source}.{field} -> {target}"
+        self.checked = 0
+        self.problems = {"dangling": 0, "cross_resident": 0}
+        self.examples = []
+        self._batch = []
+        self._stem = os.path.join(spill_dir, f"{source}.{field}")
+        self._contexts = None
+        self.deferred = {"id": 0, "owned": 0}
+
+    def add(self, reference: str, resident_id, record_id: str) -> bool:
+        """Queues a reference; returns True once the batch is due for checking."""
+        self._batch.append((reference, resident_id, record_id))
+        return len(self._batch) >= BATCH_SIZE
+
+    def take_batch(self) -> list:
+        batch, self._batch = self._batch, []
+        return batch
+
+    def report(self, problem: str, contexts, limit: int) -> None:
+        self.problems[problem] += len(contexts)
+        for reference, resident_id, record_id in contexts[
+            : max(0, limit - len(self.examples))
+        ]:
+            self.examples.append(
+                {
+                    "problem": problem,
+                    "id": record_id,
+                    "resident_id": resident_id,
+                    "reference": reference,
+                }
+            )
+
+    def defer(self, stage: str, rows: np.ndarray, contexts: list) -> None:
+        """Queues candidates for an exact check, keeping their context on disk."""
+        if self._contexts is None:
+            self._contexts = open(f"{self._stem}.contexts", "w+b")
+        offsets = []
+        for context in contexts:
+            offsets.append(self._contexts.tell())
+            self._contexts.write(json.dumps(context).encode() + b"\n")
+        rows["context"] = offsets
+        with open(f"{self._stem}.{stage}", "ab") as f:
+            rows.tofile(f)
+        self.deferred[stage] += len(rows)
+
+    def candidates_path(self, stage: str) -> str:
+        return f"{self._stem}.{stage}"
+
+    def read_contexts(self, rows: np.ndarray) -> list:
+        contexts = []
+        for offset in rows["context"].tolist():
+            self._contexts.seek(offset)
+            contexts.append(tuple(json.loads(self._contexts.readline())))
+        return contexts
+
+    def close(self) -> None:
+        if self._contexts is not None:
+            self._contexts.close()
+
+
+class ReferenceValidator:
+    """Streams a generated dataset once and checks every reference in it.
+
+    Each collection that is a reference target gets two key sets: hashes of
+    its record IDs, and of (resident, ID) pairs. A reference whose ID is
+    missing is dangling; one whose ID exists only under another resident is
+    a cross-resident link, which breaks once records live under
+    `residents/<id>/`. Keys are 64-bit hashes, so a dangling reference can
+    be missed with a probability of about n^2 / 2^64 for n keys.
+    """
+
+    def __init__(self, memory_bytes: int, spill_dir: str = None, examples: int = 10):
+        self.budget = MemoryBudget(memory_bytes)
+        self.examples = examples
+        self._spill_dir = tempfile.mkdtemp(prefix="references-", dir=spill_dir)
+        targets = {"residents"} | {target for _, _, target in REFERENCES}
+        self.id_sets = {
+            name: KeySet(f"{name}.id", self.budget, self._spill_dir)
+            for name in sorted(targets)
+        }
+        self.owned_sets = {
+            name: KeySet(f"{name}.owned", self.budget, self._spill_dir)
+            for name in sorted(targets - {"residents"})
+        }
+        self.counts = {}
+        self.checks = {}
+
+    def _checks_for(self, collection: str) -> list:
+        checks = []
+        for source, field, target in REFERENCES:
+            if source == collection:
+                checks.append(self._check(source, field, target))
+        if collection != "residents" and RESIDENT_PATHS.get(
+            collection, DEFAULT_RESIDENT_PATH
+        ):
+            checks.append(self._check(collection, RESIDENT_FIELD, "residents"))
+        return checks
+
+    def _check(self, source: str, field: str, target: str) -> ReferenceCheck:
+        key = (source, field)
+        if key not in self.checks:
+            self.checks[key] = ReferenceCheck(source, field, target, self._spill_dir)
+        return self.checks[key]
+
+    def run(self, paths: dict, dictionaries: dict = None) -> dict:
+        """Validates the collections in `paths` (name to file) and returns the report.
+
+        `dictionaries` holds the zstd dictionaries of compressed files, by
+        collection.
+        """
+        dictionaries = dictionaries or {}
+        try:
+            for collection in stream_order(paths):
+                self._read(collection, paths[collection], dictionaries.get(collection))
+            for check in self.checks.values():
+                self._resolve(check)
+        finally:
+            for check in self.checks.values():
+                check.close()
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+        return self.report()
+
+    def _read(self, collection: str, path: str, dictionary=None) -> None:
+        id_set = self.id_sets.get(collection)
+        owned_set = self.owned_sets.get(collection)
+        checks = self._checks_for(collection)
+        count = 0
+        for record in iter_records(path, dictionary):
+            count += 1
+            record_id = record.get("id")
+            data = record.get("data") or {}
+            resident_id = record_resident(collection, data)
+            if id_set is not None:
+                id_set.add(id_key(record_id))
+            if owned_set is not None and resident_id is not None:
+                owned_set.add(owned_key(resident_id, record_id))
+            for check in checks:
+                if check.target == "residents":
+                    references = [resident_id]
+                else:
+                    value = data.get(check.field)
+                    references = value if isinstance(value, list) else [value]
+                for reference in references:
+                    if reference is not None and check.add(
+                        reference, resident_id, record_id
+                    ):
+                        self._check_batch(check)
+        for check in checks:
+            self._check_batch(check)
+        if id_set is not None:
+            id_set.freeze()
+        if owned_set is not None:
+            owned_set.freeze()
+        self.counts[collection] = count
+
+    def _check_batch(self, check: ReferenceCheck) -> None:
+        batch = check.take_batch()
+        if not batch:
+            return
+        check.checked += len(batch)
+        rows = np.zeros(len(batch), dtype=CANDIDATE)
+        rows["id"] = [id_key(reference) for reference, _, _ in batch]
+        owned_set = self.owned_sets.get(check.target)
+        if owned_set is not None:
+            rows["owned"] = [
+                NO_OWNER if owner is None else owned_key(owner, reference)
+                for reference, owner, _ in batch
+            ]
+
+        present, maybe = self.id_sets[check.target].lookup(rows["id"])
+        absent = np.flatnonzero(~present & ~maybe)
+        check.report("dangling", [batch[i] for i in absent], self.examples)
+        maybe = np.flatnonzero(maybe)
+        if len(maybe):
+            check.defer("id", rows[maybe], [batch[i] for i in maybe])
+
+        owned = np.flatnonzero(present & (rows["owned"] != NO_OWNER))
+        if owned_set is None or not len(owned):
+            return
+        present, maybe = owned_set.lookup(rows["owned"][owned])
+        absent = owned[~present & ~maybe]
+        check.report("cross_resident", [batch[i] for i in absent], self.examples)
+        maybe = owned[maybe]
+        if len(maybe):
+            check.defer("owned", rows[maybe], [batch[i] for i in maybe])
+
+    def _resolve(self, check: ReferenceCheck) -> None:
+        """Settles the candidates deferred against spilled key sets."""
+        if check.deferred["id"]:
+            present_path, absent_path = self.id_sets[check.target].resolve(
+                check.candidates_path("id"), "id"
+            )
+            self._report_file(check, "dangling", absent_path)
+            with open(present_path, "rb") as f:
+                while len(chunk := np.fromfile(f, dtype=CANDIDATE, count=BATCH_SIZE)):
+                    chunk = chunk[chunk["owned"] != NO_OWNER]
+                    if check.target in self.owned_sets and len(chunk):
+                        with open(check.candidates_path("owned"), "ab") as out:
+                            chunk.tofile(out)
+                        check.deferred["owned"] += len(chunk)
+            os.remove(present_path)
+        if check.deferred["owned"]:
+            present_path, absent_path = self.owned_sets[check.target].resolve(
+                check.candidates_path("owned"), "owned"
+            )
+            self._report_file(check, "cross_resident", absent_path)
+            os.remove(present_path)
+
+    def _report_file(self, check: ReferenceCheck, problem: str, path: str) -> None:
+        with open(path, "rb") as f:
+            while len(chunk := np.fromfile(f, dtype=CANDIDATE, count=BATCH_SIZE)):
+                shown = chunk[: max(0, self.examples - len(check.examples))]
+                check.report(problem, check.read_contexts(shown), self.examples)
+                check.problems[problem] += len(chunk) - len(shown)
+        os.remove(path)
+
+    def report(self) -> dict:
+        return {
+            "collections": self.counts,
+            "spilled": [
+                key_set.name for key_set in self.budget.key_sets if key_set.spilled
+            ],
+            "references": {
+                check.name: {
+                    "checked": check.checked,
+                    **check.problems,
+                    "examples": check.examples,
+                }
+                for check in self.checks.values()
+            },
+        }
@@ -0,0 +1,139 @@
+import math
+import random
+from datetime import datetime
+from decimal import Decimal
+from .bigquery import load_schema
+from .checkpoint import random_state, set_random_state
+
+# Collections checked against their BigQuery schema file while generating
+VALIDATED_COLLECTIONS = ["charges", "claims", "payments", "adjustments"]
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def _is_timestamp(value) -> bool:
+    if isinstance(value, datetime):
+        return True
+    if not isinstance(value, str):
+        return False
+    try:
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    return True
+
+
+def _is_number(value) -> bool:
+    return (
+        isinstance(value, (int, float, Decimal))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def _record_check(validate):
+    """A RECORD field's check: a dict, returning its nested errors."""
+    return lambda value: validate(value) if isinstance(value, dict) else False
+
+
+# Checks for each scalar BigQuery type, on non-null values
+TYPE_CHECKS = {
+    "STRING": lambda value: isinstance(value, str),
+    "INTEGER": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "FLOAT": _is_number,
+    "NUMERIC": _is_number,
+    "BOOLEAN": lambda value: isinstance(value, bool),
+    "TIMESTAMP": _is_timestamp,
+}
+
+
+def compile_schema(fields: list, path: str = ""):
+    """Compiles a BigQuery JSON schema into a function returning a row's errors.
+
+    The schema is walked once here; the returned closure only runs the
+    precomputed per-field checks. Fields the schema does not declare are
+    errors too, since `to_row` would silently drop them.
+    """
+    checks = []
+    for field in fields:
+        name, mode = field["name"], field.get("mode", "NULLABLE")
+        field_path = f"{path}{name}"
+        if field["type"] == "RECORD":
+            check = _record_check(compile_schema(field["fields"], f"{field_path}."))
+        else:
+            check = TYPE_CHECKS[field["type"]]
+        checks.append((name, field_path, mode, field["type"], check))
+    known = {field["name"] for field in fields}
+
+    def validate(row: dict) -> list:
+        errors = []
+        for name, field_path, mode, field_type, check in checks:
+            value = row.get(name)
+            if value is None:
+                if mode == "REQUIRED":
+                    errors.append(f"{field_path}: required")
+                continue
+            values = value if mode == "REPEATED" else [value]
+            if mode == "REPEATED" and not isinstance(value, list):
+                errors.append(f"{field_path}: expected a list")
+                continue
+            for item in values:
+                result = check(item)
+                if isinstance(result, list):
+                    errors.extend(result)
+                elif not result:
+                    errors.append(
+                        f"{field_path}: expected {field_type}, got {type(item).__name__}"
+                    )
+        for name in row.keys() - known:
+            errors.append(f"{path}{name}: not in the schema")
+        return errors
+
+    return validate
+
+
+class SchemaValidator:
+    """Checks a sample of generated financial records against their schema files.
+
+    The first record of each collection is always checked, so drift fails
+    a run within its first resident; after that each record is checked with
+    probability `sample_rate`. Sampling draws from its own generator and
+    never touches the seeded streams records are generated from. A `state`
+    from `checkpoint` continues the sampling where the checkpoint left it.
+    """
+
+    def __init__(self, sample_rate: float, seed, state=None):
+        self.sample_rate = sample_rate
+        self.checked = 0
+        self._validators = {
+            name: compile_schema(load_schema(name)) for name in VALIDATED_COLLECTIONS
+        }
+        self._sample = random.Random(f"{seed}:schema-sample")
+        self._seen = set()
+        if state is not None:
+            self.checked = state["checked"]
+            self._seen = set(state["seen"])
+            set_random_state(self._sample, state["random"])
+
+    def checkpoint(self) -> dict:
+        return {
+            "checked": self.checked,
+            "seen": sorted(self._seen),
+            "random": random_state(self._sample),
+        }
+
+    def validate(self, collection: str, records) -> None:
+        validate = self._validators[collection]
+        for record in records:
+            if collection in self._seen and self._sample.random() >= self.sample_rate:
+                continue
+            self._seen.add(collection)
+            self.checked += 1
+            errors = validate({"id": record["id"], **record["data"]})
+            if errors:
+                raise SchemaError(
+                    f"{collection}/{record['id']} does not match "
+                    f"{collection}_schema.json: {'; '.join(errors)}"
+                )
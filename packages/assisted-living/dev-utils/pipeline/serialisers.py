@@ -0,0 +1,95 @@
+import json
+from datetime import datetime, time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def encode_time(obj):
+    """Encodes the datetime and time values generators leave in their records.
+
+    UTC datetimes end in "Z", matching what orjson and msgspec emit natively.
+    """
+    if isinstance(obj, datetime):
+        return obj.isoformat().replace("+00:00", "Z")
+    if isinstance(obj, time):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JsonSerialiser:
+    """Standard library fallback, always available."""
+
+    name = "json"
+
+    def __init__(self, indent: bool = False):
+        self.indent = indent
+        # Compact separators and raw UTF-8 so the output matches the fast
+        # backends. json.dump's default escapes non-ASCII as \uXXXX, so
+        # --indent output differs from it wherever the data is not ASCII.
+        self._encoder = json.JSONEncoder(
+            ensure_ascii=False,
+            indent=2 if indent else None,
+            separators=(",", ": ") if indent else (",", ":"),
+            default=encode_time,
+        )
+
+    def dumps(self, obj) -> bytes:
+        return self._encoder.encode(obj).encode()
+
+
+class OrjsonSerialiser:
+    name = "orjson"
+
+    def __init__(self, indent: bool = False):
+        self.indent = indent
+        self._option = orjson.OPT_UTC_Z | (orjson.OPT_INDENT_2 if indent else 0)
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj, default=encode_time, option=self._option)
+
+
+class MsgspecSerialiser:
+    name = "msgspec"
+
+    def __init__(self, indent: bool = False):
+        self.indent = indent
+        self._encoder = msgspec.json.Encoder(enc_hook=encode_time)
+
+    def dumps(self, obj) -> bytes:
+        encoded = self._encoder.encode(obj)
+        return msgspec.json.format(encoded, indent=2) if self.indent else encoded
+
+
+# In order of preference; a backend is only offered if its package imports
+SERIALISERS = {
+    name: serialiser
+    for name, serialiser, module in [
+        ("orjson", OrjsonSerialiser, orjson),
+        ("msgspec", MsgspecSerialiser, msgspec),
+        ("json", JsonSerialiser, json),
+    ]
+    if module is not None
+}
+
+
+def get_serialiser(name: str = "auto", indent: bool = False):
+    """Returns the named serialiser, or the fastest installed one for "auto".
+
+    Serialisers encode datetimes while dumping, so records are never copied
+    into a JSON-ready form first.
+    """
+    if name == "auto":
+        name = next(iter(SERIALISERS))
+    if name not in SERIALISERS:
+        raise ValueError(
+            f"Serialiser {name!r} is not installed; available: {', '.join(SERIALISERS)}"
+        )
+    return SERIALISERS[name](indent)
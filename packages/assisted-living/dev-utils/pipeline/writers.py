@@ -0,0 +1,323 @@
+import os
+from functools import partial
+from itertools import islice
+from .checkpoint import truncate_output
+from .compression import compressed_path, copy_file, open_input, open_output
+from .manifest import ContentDigest
+from .serialisers import get_serialiser
+
+OUTPUT_FORMATS = ["json", "jsonl"]
+# Records serialised per `encode` call. Writers encode a batch and then
+# write it, so memory stays bounded by a batch and --profile times
+# serialising once per batch rather than once per record.
+ENCODE_BATCH = 512
+
+
+def batches(records, size: int = ENCODE_BATCH):
+    """Splits an iterable of records into lists of at most `size`."""
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+class JsonArrayWriter:
+    """Streams records into a JSON array, one record at a time.
+
+    Records go one per line, or pretty-printed like `json.dump(records, f,
+    indent=2)` when the serialiser indents. Records are encoded
+    `ENCODE_BATCH` at a time, so only one batch is ever held in memory.
+    With `compression` the array is compressed as it is written.
+    `bytes_written` counts the bytes encoded by `write`, before
+    compression, and `digest` is the `ContentDigest` of the records. A
+    `state` from `checkpoint` reopens the file where the checkpoint left it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        serialiser,
+        compression=None,
+        level=None,
+        dictionary=None,
+        state=None,
+    ):
+        self.path = path
+        self.count = 0
+        self._serialiser = serialiser
+        self._indent = b"  " if serialiser.indent else b""
+        self._dictionary = dictionary
+        self.bytes_written = 0
+        self.digest = ContentDigest()
+        self._open = partial(open_output, path, compression, level, dictionary)
+        self._file = self._open() if state is None else self._restore(state)
+
+    def encode(self, records: list) -> list:
+        """Serialises a batch of records into array elements, indented as needed."""
+        bodies = [self._serialiser.dumps(record) for record in records]
+        if self._indent:
+            bodies = [body.replace(b"\n", b"\n  ") for body in bodies]
+        return bodies
+
+    def write(self, records) -> None:
+        for batch in batches(records):
+            for body in self.encode(batch):
+                separator = (b"[\n" if self.count == 0 else b",\n") + self._indent
+                self._file.write(separator)
+                self._file.write(body)
+                self.bytes_written += len(separator) + len(body)
+                self.digest.add(body)
+                self.count += 1
+
+    def append_shard(self, path: str, count: int) -> None:
+        """Splices the elements of another array file in without re-encoding.
+
+        A compressed shard is decompressed and its elements compressed again
+        into this file, since the brackets around them cannot be cut out of
+        the compressed bytes.
+        """
+        if not count:
+            return
+        # Skip the shard's opening "[\n" plus indent, and hold back the last
+        # two bytes read so its closing "\n]" is never written
+        with open_input(path, self._dictionary) as shard:
+            shard.read(2 + len(self._indent))
+            self._file.write((b"[\n" if self.count == 0 else b",\n") + self._indent)
+            held = b""
+            while chunk := shard.read(1 << 20):
+                held += chunk
+                self._file.write(held[:-2])
+                held = held[-2:]
+        self.count += count
+
+    def suspend(self) -> None:
+        """Closes the file until `resume`, leaving the array open."""
+        self._file.close()
+
+    def resume(self) -> None:
+        self._file = self._open(append=True)
+
+    def checkpoint(self) -> dict:
+        """Flushes the records written so far to disk and returns the state to reopen from.
+
+        The array is left open; reopening truncates whatever follows.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self.content() | {
+            "offset": os.path.getsize(self.path),
+            "bytes_written": self.bytes_written,
+        }
+
+    def _restore(self, state: dict):
+        truncate_output(self.path, state["offset"])
+        self.count = state["records"]
+        self.bytes_written = state["bytes_written"]
+        self.merge_content(state)
+        return self._open(append=True)
+
+    def close(self) -> None:
+        self._file.write(b"\n]" if self.count else b"[]")
+        self._file.close()
+
+    def content(self) -> dict:
+        """The record count and digest a content manifest records for this file."""
+        return {"records": self.count, "digest": self.digest.hexdigest()}
+
+    def merge_content(self, content: dict) -> None:
+        """Adds the digest of a shard appended with `append_shard`."""
+        self.digest.merge(content["digest"])
+
+
+class JsonlWriter:
+    """Appends one compact JSON document per line, compressed with `compression`.
+
+    A `state` from `checkpoint` reopens the file where the checkpoint left it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        serialiser,
+        compression=None,
+        level=None,
+        dictionary=None,
+        state=None,
+    ):
+        self.path = path
+        self.count = 0
+        self.bytes_written = 0
+        self.digest = ContentDigest()
+        self._serialiser = serialiser
+        self._open = partial(open_output, path, compression, level, dictionary)
+        self._file = self._open() if state is None else self._restore(state)
+
+    def encode(self, records: list) -> list:
+        """Serialises a batch of records into JSONL lines."""
+        return [self._serialiser.dumps(record) + b"\n" for record in records]
+
+    def write(self, records) -> None:
+        for batch in batches(records):
+            lines = self.encode(batch)
+            self._file.write(b"".join(lines))
+            for line in lines:
+                self.bytes_written += len(line)
+                self.digest.add(line)
+            self.count += len(lines)
+
+    def append_shard(self, path: str, count: int) -> None:
+        """Copies another JSONL file verbatim, compressed members or frames included."""
+        if hasattr(self._file, "append_compressed"):
+            self._file.append_compressed(path)
+        else:
+            copy_file(path, self._file)
+        self.count += count
+
+    def suspend(self) -> None:
+        """Closes the file until `resume` reopens it for appending."""
+        self._file.close()
+
+    def resume(self) -> None:
+        self._file = self._open(append=True)
+
+    def checkpoint(self) -> dict:
+        """Flushes the lines written so far to disk and returns the state to reopen from."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self.content() | {
+            "offset": os.path.getsize(self.path),
+            "bytes_written": self.bytes_written,
+        }
+
+    def _restore(self, state: dict):
+        truncate_output(self.path, state["offset"])
+        self.count = state["records"]
+        self.bytes_written = state["bytes_written"]
+        self.merge_content(state)
+        return self._open(append=True)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def content(self) -> dict:
+        """The record count and digest a content manifest records for this file."""
+        return {"records": self.count, "digest": self.digest.hexdigest()}
+
+    def merge_content(self, content: dict) -> None:
+        """Adds the digest of a shard appended with `append_shard`."""
+        self.digest.merge(content["digest"])
+
+
+class PayloadWriter(JsonlWriter):
+    """Appends encrypted `{path, data}` documents, digesting their plaintext.
+
+    Every run encrypts with fresh keys and nonces, so the ciphertext changes
+    even when the data does not. The digests are instead taken over each
+    collection's plaintext records, under the path prefix they are written
+    to, so a reseed only uploads the collections that really changed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        serialiser,
+        compression=None,
+        level=None,
+        dictionary=None,
+        state=None,
+    ):
+        # Set first, since restoring a checkpoint merges its digests in
+        self.collections = {}
+        super().__init__(path, serialiser, compression, level, dictionary, state)
+
+    def write_resident(self, documents, collections: dict, prefix: str = "") -> None:
+        """Writes one resident's encrypted `documents`, digesting `collections`."""
+        for batch in batches(documents):
+            lines = self.encode(batch)
+            self._file.write(b"".join(lines))
+            self.bytes_written += sum(map(len, lines))
+            self.count += len(lines)
+        prefix = prefix.encode()
+        for name, records in collections.items():
+            digest = self.collections.setdefault(name, ContentDigest())
+            for batch in batches(records):
+                for line in self.encode(batch):
+                    # Digested without the line's newline
+                    digest.add(prefix + line[:-1])
+
+    def content(self) -> dict:
+        digest = ContentDigest()
+        for collection in self.collections.values():
+            digest.merge(collection.hexdigest())
+        return {
+            "records": self.count,
+            "digest": digest.hexdigest(),
+            "collections": {
+                name: self.collections[name].hexdigest()
+                for name in sorted(self.collections)
+            },
+        }
+
+    def merge_content(self, content: dict) -> None:
+        for name, hexdigest in content["collections"].items():
+            self.collections.setdefault(name, ContentDigest()).merge(hexdigest)
+
+
+def output_path(base_dir: str, sub_file: str, fmt: str, compression=None) -> str:
+    """Maps a configured `data-plain.json` path onto the chosen output format."""
+    path = os.path.join(base_dir, sub_file)
+    if fmt == "jsonl":
+        path = os.path.splitext(path)[0] + ".jsonl"
+    return compressed_path(path, compression)
+
+
+def open_writers(base_dir: str, files: dict, output: dict, states=None) -> dict:
+    """Opens one streaming writer per collection, creating directories as needed.
+
+    `output` holds the format, serialiser name, indent flag and compression
+    chosen on the command line, plus any trained zstd dictionaries by
+    collection. JSONL is always compact, one document per line. `states`
+    maps collections to the checkpoint states their files are reopened from.
+    """
+    states = states or {}
+    fmt = output["format"]
+    if fmt == "jsonl":
+        writer_class = JsonlWriter
+        serialiser = get_serialiser(output["serialiser"])
+    else:
+        writer_class = JsonArrayWriter
+        serialiser = get_serialiser(output["serialiser"], output["indent"])
+    writers = {}
+    for name, sub_file in files.items():
+        path = output_path(base_dir, sub_file, fmt, output["compress"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writers[name] = writer_class(
+            path,
+            serialiser,
+            output["compress"],
+            output["compress_level"],
+            output["dictionaries"].get(name),
+            states.get(name),
+        )
+    return writers
+
+
+def close_writers(writers: dict) -> None:
+    for writer in writers.values():
+        writer.close()
+
+
+def merge_shards(shards: list, files: dict, output: dict, writers: dict) -> None:
+    """Appends each collection's shard files to its writer in shard order.
+
+    `shards` holds `{"dir", "counts", "contents"}` entries as returned by the
+    workers.
+    Shards cover contiguous resident ranges, so merging them in order yields
+    the same record order as a single-process run.
+    """
+    for name, sub_file in files.items():
+        for shard in shards:
+            path = output_path(
+                shard["dir"], sub_file, output["format"], output["compress"]
+            )
+            writers[name].append_shard(path, shard["counts"][name])
+            writers[name].merge_content(shard["contents"][name])
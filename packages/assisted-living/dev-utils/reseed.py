@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+import shutil
+from generate_demo_subcollection_data import SUBCOLLECTIONS_DIR, SYNTHETIC_DIR
+from pipeline.manifest import (
+    CONTENT_MANIFEST_FILE,
+    DEPLOYED_MANIFEST_FILE,
+    load_manifest,
+    plan_upload,
+)
+
+
+def describe_changes(current: dict, deployed) -> list:
+    """Says whether the generator code and run options differ from the deployed run."""
+    if deployed is None:
+        return ["No deployed manifest; every shard is new."]
+    lines = []
+    if current["generator_version"] != deployed["generator_version"]:
+        lines.append("Generator code changed since the deployed run.")
+    if current["config_hash"] != deployed["config_hash"]:
+        changed = sorted(
+            key
+            for key in current["config"].keys() | deployed["config"].keys()
+            if current["config"].get(key) != deployed["config"].get(key)
+        )
+        lines.append(f"Run options changed: {', '.join(changed)}.")
+    return lines
+
+
+def print_plan(plan: dict, current: dict, deployed, base_dir: str) -> None:
+    for line in describe_changes(current, deployed):
+        print(line)
+    shards = current["shards"]
+    upload_bytes = sum(shards[path]["bytes"] for path in plan["upload"])
+    print(
+        f"Upload {len(plan['upload'])} of {len(shards)} shards "
+        f"({upload_bytes / 2**20:.1f} MiB); {plan['unchanged']} unchanged."
+    )
+    for path, collections in plan["upload"].items():
+        print(f"  {os.path.join(base_dir, path)}: {', '.join(collections)}")
+    if plan["removed"]:
+        print(
+            f"{len(plan['removed'])} deployed shards are no longer generated; "
+            "their documents are left in place:"
+        )
+        for path in plan["removed"]:
+            print(f"  {path}")
+    payloads = [
+        os.path.join(base_dir, path)
+        for path in plan["upload"]
+        if shards[path].get("collections")
+    ]
+    if payloads:
+        collections = sorted(
+            {name for path in plan["upload"] for name in plan["upload"][path]}
+        )
+        print("To seed the emulator with just these changes:")
+        print(
+            f"  python3 dev-utils/load_firestore_emulator.py {' '.join(payloads)} "
+            f"--collections {','.join(collections)}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Plans a reseed from the content manifest, uploading only the shards that changed since the last deploy."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan_parser = commands.add_parser(
+        "plan", help="List the shards whose content differs from the deployed manifest."
+    )
+    plan_parser.add_argument(
+        "--paths",
+        action="store_true",
+        help="Print only the paths of the shards to upload, one per line.",
+    )
+    plan_parser.add_argument(
+        "--json", action="store_true", help="Print the plan as JSON."
+    )
+    commands.add_parser(
+        "record",
+        help="Record the current manifest as deployed, after uploading its shards.",
+    )
+    for command in commands.choices.values():
+        command.add_argument(
+            "--data-dir",
+            default=SUBCOLLECTIONS_DIR,
+            help=f"Directory the generator wrote to, e.g. {SYNTHETIC_DIR} after a --residents run.",
+        )
+        command.add_argument(
+            "--manifest",
+            help=f"Content manifest written by generate_demo_subcollection_data.py (default: {CONTENT_MANIFEST_FILE} in the data dir).",
+        )
+        command.add_argument(
+            "--deployed",
+            help=f"Manifest of the last deployed run (default: {DEPLOYED_MANIFEST_FILE} in the data dir).",
+        )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.manifest = args.manifest or os.path.join(args.data_dir, CONTENT_MANIFEST_FILE)
+    args.deployed = args.deployed or os.path.join(args.data_dir, DEPLOYED_MANIFEST_FILE)
+    try:
+        current = load_manifest(args.manifest)
+    except FileNotFoundError:
+        print(f"Error: content manifest not found at {args.manifest}.")
+        exit(1)
+    if args.command == "record":
+        shutil.copyfile(args.manifest, args.deployed)
+        print(
+            f"Recorded {len(current['shards'])} shards as deployed in {args.deployed}."
+        )
+        exit(0)
+    deployed = load_manifest(args.deployed) if os.path.exists(args.deployed) else None
+    plan = plan_upload(current, deployed)
+    base_dir = os.path.dirname(args.manifest)
+    if args.json:
+        print(json.dumps(plan, indent=2))
+    elif args.paths:
+        for path in plan["upload"]:
+            print(os.path.join(base_dir, path))
+    else:
+        print_plan(plan, current, deployed, base_dir)
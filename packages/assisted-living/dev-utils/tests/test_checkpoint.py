@@ -0,0 +1,178 @@
+import gc
+import os
+import runpy
+import sys
+import pytest
+from pipeline import checkpoint
+from pipeline.checkpoint import CheckpointError, truncate_output
+from pipeline.compression import compressed_path
+from pipeline.readers import iter_records
+from pipeline.serialisers import get_serialiser
+from pipeline.writers import JsonArrayWriter, JsonlWriter
+
+DEV_UTILS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The generation script reads its reference data relative to the package
+PACKAGE_DIR = os.path.dirname(DEV_UTILS_DIR)
+SCRIPT = os.path.join(DEV_UTILS_DIR, "generate_demo_subcollection_data.py")
+# Residents of three records each, checkpointed every two
+RESIDENTS = [
+    [
+        {"id": f"r{r}-{n}", "data": {"name": "Ọkọ", "n": n, "tags": [r, n]}}
+        for n in range(3)
+    ]
+    for r in range(7)
+]
+EVERY = 2
+# A record torn by the interruption, left after the last checkpoint
+TORN = b'{"id": "r9-0", "data": {"na'
+
+
+class Interrupted(BaseException):
+    """Stands in for the process being killed; nothing catches it."""
+
+
+def needs(compression) -> None:
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+
+
+def open_writer(writer_class, path: str, compression, state=None):
+    serialiser = get_serialiser("auto", writer_class is JsonArrayWriter)
+    return writer_class(path, serialiser, compression, state=state)
+
+
+def write_residents(writer, residents: list, start: int = 0) -> list:
+    """Writes residents from index `start`, returning the state of each checkpoint."""
+    states = []
+    for index, records in enumerate(residents[start:], start):
+        writer.write(records)
+        if (index + 1) % EVERY == 0:
+            states.append(writer.checkpoint())
+    return states
+
+
+def tear(path: str) -> None:
+    """Leaves a partial record at the end of a file, as a killed run would."""
+    gc.collect()
+    with open(path, "ab") as f:
+        f.write(TORN)
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+@pytest.mark.parametrize("writer_class", [JsonArrayWriter, JsonlWriter])
+def test_writer_resumes_byte_identical(tmp_path, writer_class, compression):
+    needs(compression)
+    # Both files have the same name, which gzip records in its header
+    name = "data-plain.json" if writer_class is JsonArrayWriter else "data-plain.jsonl"
+    (tmp_path / "full").mkdir()
+    (tmp_path / "resumed").mkdir()
+    full_path = compressed_path(str(tmp_path / "full" / name), compression)
+    writer = open_writer(writer_class, full_path, compression)
+    write_residents(writer, RESIDENTS)
+    full_content = writer.content()
+    writer.close()
+
+    path = compressed_path(str(tmp_path / "resumed" / name), compression)
+    writer = open_writer(writer_class, path, compression)
+    # Interrupted a resident and a half after the checkpoint at four
+    states = write_residents(writer, RESIDENTS[:5])
+    writer.write(RESIDENTS[5][:2])
+    writer._file.flush()
+    del writer
+    tear(path)
+
+    writer = open_writer(writer_class, path, compression, state=states[-1])
+    assert writer.count == 4 * len(RESIDENTS[0])
+    write_residents(writer, RESIDENTS, start=4)
+    assert writer.content() == full_content
+    writer.close()
+
+    with open(full_path, "rb") as full, open(path, "rb") as resumed:
+        assert resumed.read() == full.read()
+    records = [record for resident in RESIDENTS for record in resident]
+    assert list(iter_records(path)) == records
+
+
+def test_truncate_output_refuses_lost_data(tmp_path):
+    path = str(tmp_path / "data-plain.jsonl")
+    with open(path, "wb") as f:
+        f.write(b"0123456789")
+    truncate_output(path, 4)
+    assert os.path.getsize(path) == 4
+    with pytest.raises(CheckpointError, match="shorter"):
+        truncate_output(path, 5)
+    with pytest.raises(CheckpointError):
+        truncate_output(str(tmp_path / "missing.jsonl"), 0)
+
+
+def generate(monkeypatch, *args: str) -> None:
+    """Runs the generation script in this process, as `python3 SCRIPT args`."""
+    monkeypatch.chdir(PACKAGE_DIR)
+    monkeypatch.setattr(sys, "argv", [SCRIPT, *args])
+    runpy.run_path(SCRIPT, run_name="__main__")
+
+
+def interrupt_after(monkeypatch, checkpoints: int, writes: int) -> None:
+    """Makes the next run stop `writes` file writes after its `checkpoints`th checkpoint."""
+    saved, written = [], []
+    save_progress = checkpoint.save_progress
+
+    def counting_save(*args):
+        save_progress(*args)
+        saved.append(args)
+
+    monkeypatch.setattr(checkpoint, "save_progress", counting_save)
+    for writer_class in (JsonArrayWriter, JsonlWriter):
+
+        def interrupting_write(self, records, write=writer_class.write):
+            if len(saved) >= checkpoints:
+                written.append(self.path)
+                if len(written) > writes:
+                    raise Interrupted
+            return write(self, records)
+
+        monkeypatch.setattr(writer_class, "write", interrupting_write)
+
+
+def output_files(root: str) -> dict:
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+@pytest.mark.parametrize(
+    "output_format, compression", [("json", None), ("jsonl", "gzip"), ("json", "zstd")]
+)
+def test_script_resumes_byte_identical(
+    tmp_path, monkeypatch, capsys, output_format, compression
+):
+    needs(compression)
+    options = ["--seed", "7", "--as-of", "2025-06-01", "--residents", "7"]
+    options += ["--format", output_format, "--checkpoint-every", str(EVERY)]
+    if compression:
+        options += ["--compress", compression]
+    full_dir, resumed_dir = str(tmp_path / "full"), str(tmp_path / "resumed")
+    generate(monkeypatch, *options, "--output-dir", full_dir)
+
+    with monkeypatch.context() as interrupted:
+        # Two checkpoints, four residents, then partway through the fifth
+        interrupt_after(interrupted, checkpoints=2, writes=5)
+        with pytest.raises(Interrupted):
+            generate(interrupted, *options, "--output-dir", resumed_dir)
+    checkpoint_dir = os.path.join(resumed_dir, "checkpoint")
+    assert os.path.isdir(checkpoint_dir)
+    for path in output_files(resumed_dir):
+        if "data-plain" in path:
+            tear(os.path.join(resumed_dir, path))
+
+    generate(monkeypatch, *options, "--output-dir", resumed_dir, "--resume")
+    assert "Resuming from the checkpoints" in capsys.readouterr().out
+    assert not os.path.exists(checkpoint_dir)
+    full, resumed = output_files(full_dir), output_files(resumed_dir)
+    assert sorted(resumed) == sorted(full)
+    for path in full:
+        assert resumed[path] == full[path], path
@@ -0,0 +1,252 @@
+import json
+import os
+import random
+import pytest
+from pipeline import diff
+from pipeline.diff import (
+    MAX_FAN_IN,
+    DatasetDiff,
+    ExternalSorter,
+    diff_documents,
+    diff_fields,
+    field_path,
+)
+
+
+def shuffled_pairs(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    # Repeated keys, and keys that are prefixes of others
+    pairs = [
+        (f"residents/r{rng.randrange(count // 4)}".encode(), str(n).encode())
+        for n in range(count)
+    ]
+    pairs += [
+        (b"residents/r1/x", b"1"),
+        (b"residents/r1-x", b"2"),
+        (b"residents/r1", b"0"),
+    ]
+    rng.shuffle(pairs)
+    return pairs
+
+
+def sort_all(pairs: list, memory_bytes: int, spill_dir) -> tuple:
+    sorter = ExternalSorter("test", memory_bytes, str(spill_dir))
+    for key, value in pairs:
+        sorter.add(key, value)
+    runs = len(sorter._runs)
+    return runs, list(sorter.sorted())
+
+
+@pytest.mark.parametrize("memory_bytes", [1 << 20, 300])
+def test_sorter_matches_sorted(tmp_path, memory_bytes):
+    pairs = shuffled_pairs(1000)
+    runs, result = sort_all(pairs, memory_bytes, tmp_path)
+    assert result == sorted(pairs)
+    # A key sorts ahead of the keys it is a prefix of
+    keys = [key for key, _ in result]
+    assert keys.index(b"residents/r1") < keys.index(b"residents/r1-x")
+    assert keys.index(b"residents/r1") < keys.index(b"residents/r1/x")
+    if memory_bytes < 1 << 20:
+        assert runs > MAX_FAN_IN
+    else:
+        assert runs == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_sorter_merges_in_several_passes(tmp_path, monkeypatch):
+    monkeypatch.setattr(diff, "MAX_FAN_IN", 3)
+    merged = []
+    merge = ExternalSorter._merge
+
+    def counting_merge(self, runs, path):
+        merged.append(len(runs))
+        merge(self, runs, path)
+
+    monkeypatch.setattr(ExternalSorter, "_merge", counting_merge)
+    pairs = shuffled_pairs(200)
+    runs, result = sort_all(pairs, 1, tmp_path)
+    assert runs == len(pairs)
+    assert result == sorted(pairs)
+    # Passes merge at most three runs at a time, each merge of k runs leaving
+    # k - 1 fewer, until three are left for the final merge
+    assert max(merged) == 3
+    assert sum(merged) - len(merged) == runs - 3
+    assert os.listdir(tmp_path) == []
+
+
+def test_field_path_quotes():
+    assert field_path(("value", "quantity")) == "value.quantity"
+    assert field_path(("tags.v2", "1st", "_ok")) == "`tags.v2`.`1st`._ok"
+    assert field_path(("a`b", "c\\d")) == "`a\\`b`.`c\\\\d`"
+
+
+def test_diff_fields():
+    old = {
+        "name": "A",
+        "room": {"no": 1, "wing": "E", "bed`s": 1},
+        "contact": {"phone": "1", "email": "a@x"},
+        "codes": [1, 2],
+        "note": "gone",
+        "meta": {"a": 1},
+    }
+    new = {
+        "name": "A",
+        "room": {"no": 2, "wing": "E", "bed`s": 2},
+        # A nested field removed and nothing changed alongside it
+        "contact": {"phone": "1"},
+        "codes": [1, 3],
+        "meta": {},
+        "added": {"x": None},
+    }
+    data, mask = diff_fields(old, new)
+    assert data == {
+        "room": {"no": 2, "bed`s": 2},
+        "codes": [1, 3],
+        "meta": {},
+        "added": {"x": None},
+    }
+    assert sorted(mask) == sorted(
+        [
+            "room.no",
+            "room.`bed\\`s`",
+            "contact.email",
+            "codes",
+            "meta",
+            "added",
+            "note",
+        ]
+    )
+    assert diff_fields(new, new) == ({}, [])
+
+
+def test_diff_documents_skips_reordered_data():
+    old = iter([("a", b'{"x":1,"y":2}')])
+    new = iter([("a", b'{"y":2,"x":1}')])
+    assert list(diff_documents(old, new)) == []
+
+
+def write_dataset(root, collections: dict) -> dict:
+    os.makedirs(root)
+    paths = {}
+    for name, records in collections.items():
+        paths[name] = os.path.join(root, f"{name}.jsonl")
+        with open(paths[name], "w") as f:
+            for record_id, data in records:
+                f.write(json.dumps({"id": record_id, "data": data}) + "\n")
+    return paths
+
+
+OLD = {
+    "residents": [
+        ("r1", {"name": "A", "room": {"no": 1, "wing": "E", "bed`s": 1}}),
+        ("r2", {"name": "B"}),
+    ],
+    "observations": [
+        (
+            "o1",
+            {
+                "resident_id": "r1",
+                "value": {"quantity": 70, "unit": "bpm"},
+                "note": "x",
+            },
+        ),
+        ("o2", {"resident_id": "r2", "value": {"quantity": 1}}),
+    ],
+    "care_plans": [("cp1", {"resident_id": "r1", "title": "T"})],
+    "care_plan_activities": [
+        ("a1", {"careplan_id": "cp1", "status": "planned"}),
+        ("a2", {"careplan_id": "cp-missing", "status": "planned"}),
+    ],
+}
+NEW = {
+    "residents": [
+        (
+            "r1",
+            {
+                "name": "A",
+                "room": {"no": 2, "wing": "E", "bed`s": 2},
+                "tags.v2": {"1st": True},
+            },
+        ),
+        ("r3", {"name": "C"}),
+    ],
+    "observations": [
+        ("o1", {"resident_id": "r1", "value": {"quantity": 72, "unit": "bpm"}}),
+        ("o3", {"resident_id": "r3", "value": {"quantity": 3}}),
+    ],
+    # The same care plan, with its fields in another order
+    "care_plans": [("cp1", {"title": "T", "resident_id": "r1"})],
+    "care_plan_activities": [
+        ("a4", {"careplan_id": "cp1", "status": "planned"}),
+        ("a3", {"careplan_id": "cp-gone", "status": "planned"}),
+        ("a1", {"careplan_id": "cp1", "status": "done"}),
+    ],
+}
+EXPECTED = [
+    {
+        "op": "update",
+        "path": "residents/r1",
+        "data": {"room": {"no": 2, "bed`s": 2}, "tags.v2": {"1st": True}},
+        "mask": ["room.no", "room.`bed\\`s`", "`tags.v2`"],
+    },
+    {
+        "op": "update",
+        "path": "residents/r1/care_plan_activities/a1",
+        "data": {"status": "done"},
+        "mask": ["status"],
+    },
+    {
+        "op": "set",
+        "path": "residents/r1/care_plan_activities/a4",
+        "data": {"careplan_id": "cp1", "status": "planned"},
+    },
+    {
+        "op": "update",
+        "path": "residents/r1/observations/o1",
+        "data": {"value": {"quantity": 72}},
+        "mask": ["value.quantity", "note"],
+    },
+    {"op": "delete", "path": "residents/r2"},
+    {"op": "delete", "path": "residents/r2/observations/o2"},
+    {"op": "set", "path": "residents/r3", "data": {"name": "C"}},
+    {
+        "op": "set",
+        "path": "residents/r3/observations/o3",
+        "data": {"resident_id": "r3", "value": {"quantity": 3}},
+    },
+]
+
+
+def counting(monkeypatch, method: str) -> list:
+    """Records each call of an `ExternalSorter` method, passing it through."""
+    calls = []
+    original = getattr(ExternalSorter, method)
+
+    def wrapper(self, *args):
+        calls.append(self.name)
+        return original(self, *args)
+
+    monkeypatch.setattr(ExternalSorter, method, wrapper)
+    return calls
+
+
+@pytest.mark.parametrize("memory_bytes, fan_in", [(1 << 20, MAX_FAN_IN), (256, 2)])
+def test_dataset_diff(tmp_path, monkeypatch, memory_bytes, fan_in):
+    monkeypatch.setattr(diff, "MAX_FAN_IN", fan_in)
+    spills = counting(monkeypatch, "_spill")
+    merges = counting(monkeypatch, "_merge")
+    old = write_dataset(tmp_path / "old", OLD)
+    new = write_dataset(tmp_path / "new", NEW)
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    dataset_diff = DatasetDiff(memory_bytes, str(spill_dir))
+    assert list(dataset_diff.run(old, new)) == EXPECTED
+    # Each side has one activity whose care plan does not exist
+    assert dataset_diff.unresolved == {"old": 1, "new": 1}
+    assert os.listdir(spill_dir) == []
+    if fan_in == MAX_FAN_IN:
+        assert spills == merges == []
+    else:
+        # Documents and activities of both sides spill and merge in passes
+        sorters = {"old", "old.activities", "new", "new.activities"}
+        assert set(spills) == set(merges) == sorters
@@ -0,0 +1,219 @@
+import base64
+import json
+import shutil
+import subprocess
+from datetime import datetime, time
+import pytest
+import pytz
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from pipeline.encryption import (
+    IV_LENGTH,
+    KEK_NAMES,
+    RESIDENT_ENCRYPTED_FIELDS,
+    SUBCOLLECTION_KEKS,
+    TAG_LENGTH,
+    LocalKms,
+    ResidentKeys,
+    decrypt_data,
+    encrypt_resident_documents,
+)
+
+RESIDENT = {
+    "id": "resident-1",
+    "data": {
+        "facility_id": "facility-1",
+        "created_at": "2024-01-02T03:04:05Z",
+        "resident_name": "Adaeze Ọkọnkwọ",
+        "room_no": 12,
+        "dob": "1941-07-09",
+        "cell_phone": "",
+        "pcp": None,
+    },
+}
+COLLECTIONS = {
+    "charges": [
+        {
+            "id": "charge-1",
+            "data": {
+                "resident_id": "resident-1",
+                "account_id": "account-1",
+                "unit_price": {"value": 1500.0, "currency": "NGN"},
+                "quantity": 2.0,
+                "paid": False,
+                "occurrence_datetime": pytz.utc.localize(datetime(2024, 5, 6, 7, 8)),
+            },
+        }
+    ],
+    "coverages": [
+        {
+            "id": "coverage-1",
+            "data": {
+                "payor": {"id": "payor-1", "organization": "NHIA"},
+                "subject": {"id": "resident-1", "name": "Adaeze Ọkọnkwọ"},
+            },
+        }
+    ],
+    "procedures": [
+        {
+            "id": "procedure-1",
+            "data": {
+                "performer": {"id": "staff-1", "name": "Nurse", "period": None},
+                "goal_ids": ["goal-1", "goal-2"],
+                "scheduled_time": time(9, 30),
+                "note": None,
+            },
+        }
+    ],
+}
+# What each value decrypts to: what `encryptField` in JavaScript would have
+# passed to `encryptData` for the same value
+EXPECTED_TEXT = {
+    "resident_name": "Adaeze Ọkọnkwọ",
+    "room_no": "12",
+    "dob": "1941-07-09",
+    # JSON.stringify writes whole numbers without a fraction, nested or not
+    "unit_price": '{"value":1500,"currency":"NGN"}',
+    "quantity": "2",
+    "paid": "false",
+    "occurrence_datetime": "2024-05-06T07:08:00Z",
+    "organization": "NHIA",
+    "name": "Adaeze Ọkọnkwọ",
+    "scheduled_time": "09:30:00",
+}
+
+
+# The body of `decryptData` in lib/encryption.ts, reading `[dek, encrypted]`
+# pairs from stdin; the module itself needs the KMS client to import
+NODE_DECRYPT = """
+const crypto = require('crypto')
+const pairs = JSON.parse(require('fs').readFileSync(0, 'utf8'))
+console.log(JSON.stringify(pairs.map(([dek, encryptedData]) => {
+  const decipher = crypto.createDecipheriv(
+    'aes-256-gcm',
+    Buffer.from(dek, 'base64'),
+    Buffer.from(encryptedData.iv, 'base64'),
+  )
+  decipher.setAuthTag(Buffer.from(encryptedData.authTag, 'base64'))
+  let decrypted = decipher.update(encryptedData.ciphertext, 'base64', 'utf8')
+  decrypted += decipher.final('utf8')
+  return decrypted
+})))
+"""
+
+
+@pytest.fixture
+def kms(tmp_path):
+    return LocalKms(str(tmp_path / "local-kms.json"))
+
+
+def documents(kms) -> list:
+    keys = ResidentKeys(kms, batch_size=3).next()
+    return list(encrypt_resident_documents(RESIDENT, COLLECTIONS, keys, "p/"))
+
+
+def unwrap(kms, kek_name: str, encrypted_dek: str) -> AESGCM:
+    """The DEK a document names, unwrapped the way the app unwraps it with KMS."""
+    (dek,) = kms.unwrap_data_keys(kek_name, [base64.b64decode(encrypted_dek)])
+    return AESGCM(dek)
+
+
+def test_resident_round_trip(kms):
+    resident = documents(kms)[0]
+    assert resident["path"] == "p/residents/resident-1"
+    data = resident["data"]
+    assert data["facility_id"] == "facility-1"
+    assert data["created_at"] == "2024-01-02T03:04:05Z"
+    ciphers = {
+        name: unwrap(kms, name, data[f"encrypted_dek_{name}"]) for name in KEK_NAMES
+    }
+    # Falsy fields are left out rather than encrypted
+    assert "encrypted_cell_phone" not in data
+    assert "encrypted_pcp" not in data
+    for field in ("resident_name", "room_no", "dob"):
+        cipher = ciphers[RESIDENT_ENCRYPTED_FIELDS[field]]
+        assert decrypt_data(data[f"encrypted_{field}"], cipher) == EXPECTED_TEXT[field]
+        assert field not in data
+
+
+def test_subcollection_round_trip(kms):
+    by_path = {document["path"]: document["data"] for document in documents(kms)}
+    assert len(by_path) == 4
+
+    charge = by_path["p/residents/resident-1/charges/charge-1"]
+    cipher = unwrap(kms, SUBCOLLECTION_KEKS["charges"], charge["encrypted_dek"])
+    assert charge["resident_id"] == "resident-1"
+    assert charge["account_id"] == "account-1"
+    for field in ("unit_price", "quantity", "paid", "occurrence_datetime"):
+        assert (
+            decrypt_data(charge[f"encrypted_{field}"], cipher) == EXPECTED_TEXT[field]
+        )
+
+    coverage = by_path["p/residents/resident-1/coverages/coverage-1"]
+    cipher = unwrap(kms, SUBCOLLECTION_KEKS["coverages"], coverage["encrypted_dek"])
+    assert coverage["payor"]["id"] == "payor-1"
+    assert coverage["subject"]["id"] == "resident-1"
+    payor = coverage["payor"]["encrypted_organization"]
+    assert decrypt_data(payor, cipher) == EXPECTED_TEXT["organization"]
+    subject = coverage["subject"]["encrypted_name"]
+    assert decrypt_data(subject, cipher) == EXPECTED_TEXT["name"]
+
+    procedure = by_path["p/residents/resident-1/procedures/procedure-1"]
+    cipher = unwrap(kms, SUBCOLLECTION_KEKS["procedures"], procedure["encrypted_dek"])
+    assert procedure["goal_ids"] == ["goal-1", "goal-2"]
+    assert procedure["encrypted_note"] is None
+    assert procedure["performer"]["encrypted_period"] is None
+    performer = procedure["performer"]["encrypted_name"]
+    assert decrypt_data(performer, cipher) == "Nurse"
+    scheduled = procedure["encrypted_scheduled_time"]
+    assert decrypt_data(scheduled, cipher) == EXPECTED_TEXT["scheduled_time"]
+
+
+def test_payload_layout(kms):
+    """Fields are base64 with the 16-byte IV and 16-byte tag `decryptData` expects."""
+    data = documents(kms)[0]["data"]
+    encrypted = data["encrypted_resident_name"]
+    assert set(encrypted) == {"ciphertext", "iv", "authTag"}
+    assert len(base64.b64decode(encrypted["iv"])) == IV_LENGTH
+    assert len(base64.b64decode(encrypted["authTag"])) == TAG_LENGTH
+    assert len(base64.b64decode(encrypted["ciphertext"])) == len(
+        EXPECTED_TEXT["resident_name"].encode()
+    )
+
+
+def test_keys_are_per_resident_and_kek(kms):
+    resident_keys = ResidentKeys(kms, batch_size=2)
+    first, second, third = (resident_keys.next() for _ in range(3))
+    wrapped = [keys[name][1] for keys in (first, second, third) for name in KEK_NAMES]
+    assert len(set(wrapped)) == len(wrapped)
+    # A DEK wrapped by one KEK does not unwrap under another
+    with pytest.raises(InvalidTag):
+        unwrap(kms, "clinical", first["general"][1])
+
+
+def test_kek_file_is_reused(tmp_path, kms):
+    data = documents(kms)[0]["data"]
+    reloaded = LocalKms(str(tmp_path / "local-kms.json"))
+    cipher = unwrap(reloaded, "general", data["encrypted_dek_general"])
+    assert decrypt_data(data["encrypted_resident_name"], cipher) == "Adaeze Ọkọnkwọ"
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_node_decrypts(kms):
+    data = documents(kms)[0]["data"]
+    pairs = []
+    for field in ("resident_name", "room_no", "dob"):
+        kek_name = RESIDENT_ENCRYPTED_FIELDS[field]
+        encrypted_dek = base64.b64decode(data[f"encrypted_dek_{kek_name}"])
+        (dek,) = kms.unwrap_data_keys(kek_name, [encrypted_dek])
+        pairs.append([base64.b64encode(dek).decode(), data[f"encrypted_{field}"]])
+    result = subprocess.run(
+        ["node", "-e", NODE_DECRYPT],
+        input=json.dumps(pairs),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert json.loads(result.stdout) == [
+        EXPECTED_TEXT[field] for field in ("resident_name", "room_no", "dob")
+    ]
@@ -0,0 +1,101 @@
+import random
+from datetime import datetime
+import pytest
+import pytz
+from generators.config import CURRENCY, KOBO_PER_NAIRA
+from generators.financials import generate_financial_data_for_resident
+
+ADMITTED = pytz.utc.localize(datetime(2023, 3, 17, 14, 25))
+AS_OF = pytz.utc.localize(datetime(2025, 6, 1))
+# Seed 13 draws a self-pay resident, the rest insured ones
+SEEDS = [1, 7, 13, 42, 1234, 99_999]
+
+
+def ledger(seed: int, start=ADMITTED, end=AS_OF) -> dict:
+    random.seed(seed)
+    return generate_financial_data_for_resident("resident-1", "Ada Obi", start, end)
+
+
+def kobo(amount: dict) -> int:
+    """An amount in kobo, checking it is a whole number of kobo in the app's currency."""
+    assert amount["currency"] == CURRENCY
+    value = round(amount["value"] * KOBO_PER_NAIRA)
+    assert value / KOBO_PER_NAIRA == amount["value"]
+    return value
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_balance_reconciles(seed):
+    data = ledger(seed)
+    charged = sum(
+        kobo(charge["data"]["unit_price"]) * charge["data"]["quantity"]
+        for charge in data["charges"]
+    )
+    paid = sum(kobo(payment["data"]["amount"]) for payment in data["payments"])
+    adjusted = sum(
+        kobo(adjustment["data"]["approved_amount"])
+        for adjustment in data["adjustments"]
+    )
+    (account,) = data["accounts"]
+    assert charged > 0
+    assert kobo(account["data"]["balance"]) == charged - paid - adjusted
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_claims_reconcile(seed):
+    data = ledger(seed)
+    charges = {charge["id"]: charge["data"] for charge in data["charges"]}
+    claims = {claim["id"]: claim["data"] for claim in data["claims"]}
+    claimed = [
+        charge_id for claim in claims.values() for charge_id in claim["charge_ids"]
+    ]
+    # A charge is claimed at most once, and every claim covers real charges
+    assert len(claimed) == len(set(claimed))
+    for claim in claims.values():
+        total = sum(
+            kobo(charges[charge_id]["unit_price"]) * charges[charge_id]["quantity"]
+            for charge_id in claim["charge_ids"]
+        )
+        assert kobo(claim["total"]) == total
+    # The insurer and the write-off never exceed what a claim asked for
+    settled = {claim_id: 0 for claim_id in claims}
+    for record in data["payments"] + data["adjustments"]:
+        claim_id = record["data"]["claim_id"]
+        if claim_id is not None:
+            amount = record["data"].get("amount") or record["data"]["approved_amount"]
+            settled[claim_id] += kobo(amount)
+    for claim_id, claim in claims.items():
+        assert settled[claim_id] <= kobo(claim["total"])
+        if claim["status"] == "submitted":
+            assert settled[claim_id] == 0
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_ledger_starts_at_admission(seed):
+    data = ledger(seed)
+    events = (
+        [charge["data"]["occurrence_datetime"] for charge in data["charges"]]
+        + [payment["data"]["occurrence_datetime"] for payment in data["payments"]]
+        + [claim["data"]["authored_on"] for claim in data["claims"]]
+        + [adjustment["data"]["authored_on"] for adjustment in data["adjustments"]]
+    )
+    assert min(events) == ADMITTED
+    assert max(events) <= AS_OF
+    assert data["accounts"][0]["data"]["authored_on"] == ADMITTED
+    # The first rent is billed on admission, the next on the first of the month
+    rents = [
+        charge["data"]["occurrence_datetime"]
+        for charge in data["charges"]
+        if charge["data"]["service"] == "Monthly Rent"
+    ]
+    assert rents[0] == ADMITTED
+    assert rents[1] == pytz.utc.localize(datetime(2023, 4, 1))
+
+
+def test_admitted_after_as_of():
+    data = ledger(7, start=AS_OF.replace(month=9), end=AS_OF)
+    assert data["charges"] == data["claims"] == data["payments"] == []
+    assert kobo(data["accounts"][0]["data"]["balance"]) == 0
+    for coverage in data["coverages"]:
+        period = coverage["data"]["period"]
+        assert period["start"] <= period["end"]
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import pytest
+from pipeline.firestore import EmulatorLoader, FirestoreLoadError, HttpConnection
+
+
+def content_length(body: bytes, status: str = "200 OK", headers: str = "") -> bytes:
+    return (
+        f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n{headers}"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode() + body
+
+
+def chunked(*chunks: bytes, trailers: str = "") -> bytes:
+    response = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+    for n, chunk in enumerate(chunks):
+        # Chunk extensions are allowed after the size and ignored
+        extension = ";n=1" if n % 2 else ""
+        response += f"{len(chunk):x}{extension}\r\n".encode() + chunk + b"\r\n"
+    return response + f"0\r\n{trailers}\r\n".encode()
+
+
+class Drop(bytes):
+    """A scripted response after which the server hangs up."""
+
+
+class StubServer:
+    """An HTTP server answering each request with the next scripted response.
+
+    A response is raw bytes, sent as is; a `Drop` is sent and then the
+    connection is closed. Every request is recorded with its head and body.
+    """
+
+    def __init__(self, responses: list):
+        self.responses = list(responses)
+        self.requests = []
+        self.connections = 0
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while head := await reader.readuntil(b"\r\n\r\n"):
+                lines = head.decode().split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    if line:
+                        name, value = line.split(": ", 1)
+                        headers[name.lower()] = value
+                body = await reader.readexactly(int(headers["content-length"]))
+                self.requests.append((lines[0], headers, body))
+                response = self.responses.pop(0)
+                writer.write(response)
+                await writer.drain()
+                if isinstance(response, Drop) or b"Connection: close" in response:
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+
+def run(responses: list, scenario):
+    async def main():
+        async with StubServer(responses) as server:
+            connection = HttpConnection("127.0.0.1", server.port)
+            try:
+                return server, await scenario(connection)
+            finally:
+                connection.close()
+
+    return asyncio.run(main())
+
+
+def test_content_length_reuses_connection():
+    async def scenario(connection):
+        return [
+            await connection.post("/v1/a:batchWrite", b'{"n":1}'),
+            await connection.post("/v1/b:batchWrite", b'{"n":22}'),
+        ]
+
+    server, results = run([content_length(b'{"ok":1}'), content_length(b"")], scenario)
+    assert results == [(200, b'{"ok":1}'), (200, b"")]
+    assert server.connections == 1
+    (line, headers, body), second = server.requests
+    assert line == "POST /v1/a:batchWrite HTTP/1.1"
+    assert headers["host"] == f"127.0.0.1:{server.port}"
+    assert headers["authorization"] == "Bearer owner"
+    assert headers["content-type"] == "application/json"
+    assert body == b'{"n":1}'
+    assert second[2] == b'{"n":22}'
+
+
+def test_chunked_reuses_connection():
+    async def scenario(connection):
+        return [
+            await connection.post("/", b"{}"),
+            await connection.post("/", b"{}"),
+            await connection.post("/", b"{}"),
+        ]
+
+    server, results = run(
+        [
+            chunked(b'{"status":', b"[", b"]}"),
+            chunked(b"x" * 70_000, trailers="X-Checksum: 1\r\n"),
+            content_length(b"after"),
+        ],
+        scenario,
+    )
+    assert results == [(200, b'{"status":[]}'), (200, b"x" * 70_000), (200, b"after")]
+    assert server.connections == 1
+
+
+def test_connection_close_reconnects():
+    async def scenario(connection):
+        return [await connection.post("/", b"{}"), await connection.post("/", b"{}")]
+
+    server, results = run(
+        [
+            content_length(b"bye", headers="Connection: close\r\n"),
+            content_length(b"hello"),
+        ],
+        scenario,
+    )
+    assert results == [(200, b"bye"), (200, b"hello")]
+    assert server.connections == 2
+
+
+@pytest.mark.parametrize(
+    "broken, error",
+    [
+        # Closed without answering, as a stale keep-alive connection is
+        (Drop(), ConnectionError),
+        # Closed partway through a Content-Length body
+        (Drop(content_length(b"0123456789")[:-4]), asyncio.IncompleteReadError),
+        # Closed between the chunks of a chunked body
+        (Drop(chunked(b"abc", b"def")[: -len(b"0\r\n\r\n")]), ConnectionError),
+        # Closed partway through a chunk
+        (Drop(chunked(b"abcdef")[:-8]), asyncio.IncompleteReadError),
+    ],
+)
+def test_reconnects_after_errors(broken, error):
+    async def scenario(connection):
+        with pytest.raises(error):
+            await connection.post("/", b"{}")
+        return await connection.post("/", b"{}")
+
+    server, result = run([broken, content_length(b"again")], scenario)
+    assert result == (200, b"again")
+    assert server.connections == 2
+
+
+def test_error_statuses_keep_the_connection():
+    async def scenario(connection):
+        return [await connection.post("/", b"{}"), await connection.post("/", b"{}")]
+
+    server, results = run(
+        [content_length(b"busy", "503 Service Unavailable"), content_length(b"ok")],
+        scenario,
+    )
+    assert results == [(503, b"busy"), (200, b"ok")]
+    assert server.connections == 1
+
+
+def batch_response(*codes: int) -> bytes:
+    return content_length(
+        json.dumps({"status": [{"code": code} for code in codes]}).encode()
+    )
+
+
+def load(responses: list, documents: list, **options) -> tuple:
+    async def main():
+        async with StubServer(responses) as server:
+            loader = EmulatorLoader(
+                f"127.0.0.1:{server.port}",
+                "demo",
+                "(default)",
+                concurrency=(1, 1, 1),
+                **options,
+            )
+            return server, await loader.load(documents)
+
+    return asyncio.run(main())
+
+
+def test_loader_retries_failed_requests_and_writes():
+    documents = [(f"residents/r{n}", {"n": n}) for n in range(3)]
+    server, stats = load(
+        [
+            # A dropped connection, a retryable status, then one write aborted
+            Drop(),
+            content_length(b"", "503 Service Unavailable"),
+            batch_response(0, 10, 0),
+            batch_response(0),
+        ],
+        documents,
+    )
+    assert stats["documents"] == 3
+    assert stats["requests"] == 4
+    assert stats["retried_writes"] == 3 + 3 + 1
+    writes = [json.loads(body)["writes"] for _, _, body in server.requests]
+    assert [len(batch) for batch in writes] == [3, 3, 3, 1]
+    assert writes[3][0]["update"] == {
+        "name": "projects/demo/databases/(default)/documents/residents/r1",
+        "fields": {"n": {"integerValue": "1"}},
+    }
+
+
+def test_loader_stops_on_permanent_errors():
+    with pytest.raises(FirestoreLoadError, match="HTTP 400"):
+        load([content_length(b"bad", "400 Bad Request")], [("residents/r", {})])
+    with pytest.raises(FirestoreLoadError, match="code 3"):
+        load([batch_response(3)], [("residents/r", {})])
@@ -0,0 +1,203 @@
+import json
+import os
+import numpy as np
+import pytest
+from pipeline.references import (
+    CANDIDATE,
+    NO_OWNER,
+    KeySet,
+    MemoryBudget,
+    ReferenceValidator,
+    _in_partition,
+)
+
+RESIDENTS = 200
+PRESCRIPTIONS_PER_RESIDENT = 30
+DOSES_PER_PRESCRIPTION = 3
+# Budgets that keep every key set in memory, and that spill most of them
+LARGE_BUDGET = 1 << 30
+SMALL_BUDGET = 64 << 10
+ADMINISTRATION = "prescription_administration.prescription_id -> prescriptions"
+CLAIM_CHARGES = "claims.charge_ids -> charges"
+CLAIM_RESIDENTS = "claims.resident_id -> residents"
+
+
+def write_jsonl(path, records) -> str:
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory) -> dict:
+    """A dataset with a few known bad references among many good ones."""
+    root = tmp_path_factory.mktemp("dataset")
+    residents = [f"resident-{r}" for r in range(RESIDENTS)]
+    prescriptions = [
+        {"id": f"rx-{r}-{p}", "data": {"resident_id": resident}}
+        for r, resident in enumerate(residents)
+        for p in range(PRESCRIPTIONS_PER_RESIDENT)
+    ]
+    doses = [
+        {
+            "id": f"{rx['id']}-dose-{d}",
+            "data": {
+                "resident_id": rx["data"]["resident_id"],
+                "prescription_id": rx["id"],
+            },
+        }
+        for rx in prescriptions
+        for d in range(DOSES_PER_PRESCRIPTION)
+    ]
+    # Two doses of prescriptions that do not exist, and one of another
+    # resident's prescription
+    doses[10]["data"]["prescription_id"] = "rx-missing-1"
+    doses[5000]["data"]["prescription_id"] = "rx-missing-2"
+    doses[200]["data"]["prescription_id"] = "rx-150-0"
+    charges = [
+        {"id": f"charge-{r}", "data": {"resident_id": resident}}
+        for r, resident in enumerate(residents)
+    ]
+    claims = [
+        {
+            "id": f"claim-{r}",
+            "data": {"resident_id": resident, "charge_ids": [f"charge-{r}"]},
+        }
+        for r, resident in enumerate(residents)
+    ]
+    claims[3]["data"]["charge_ids"].append("charge-missing")
+    claims[4]["data"]["resident_id"] = "resident-missing"
+    collections = {
+        "residents": [{"id": resident, "data": {}} for resident in residents],
+        "prescriptions": prescriptions,
+        "prescription_administration": doses,
+        "charges": charges,
+        "claims": claims,
+    }
+    return {
+        name: write_jsonl(root / f"{name}.jsonl", records)
+        for name, records in collections.items()
+    }
+
+
+def validate(dataset: dict, memory_bytes: int, tmp_path) -> dict:
+    return ReferenceValidator(memory_bytes, str(tmp_path), examples=100).run(dataset)
+
+
+def problems(report: dict) -> dict:
+    """Each reference's problems, as `{(problem, record ID, reference)}`."""
+    return {
+        name: {
+            (example["problem"], example["id"], example["reference"])
+            for example in reference["examples"]
+        }
+        for name, reference in report["references"].items()
+    }
+
+
+@pytest.mark.parametrize("memory_bytes", [LARGE_BUDGET, SMALL_BUDGET])
+def test_finds_planted_problems(dataset, memory_bytes, tmp_path):
+    report = validate(dataset, memory_bytes, tmp_path)
+    found = problems(report)
+    assert found[ADMINISTRATION] == {
+        ("dangling", "rx-0-3-dose-1", "rx-missing-1"),
+        ("dangling", "rx-55-16-dose-2", "rx-missing-2"),
+        ("cross_resident", "rx-2-6-dose-2", "rx-150-0"),
+    }
+    assert found[CLAIM_CHARGES] == {
+        ("dangling", "claim-3", "charge-missing"),
+        # The charge exists, but under the resident the claim no longer names
+        ("cross_resident", "claim-4", "charge-4"),
+    }
+    assert found[CLAIM_RESIDENTS] == {("dangling", "claim-4", "resident-missing")}
+    # Every other reference resolves
+    for name, reference in report["references"].items():
+        assert reference["dangling"] + reference["cross_resident"] == len(found[name])
+    doses = RESIDENTS * PRESCRIPTIONS_PER_RESIDENT * DOSES_PER_PRESCRIPTION
+    assert report["references"][ADMINISTRATION]["checked"] == doses
+    # The spill directory is cleaned up
+    assert os.listdir(tmp_path) == []
+
+
+def test_small_budget_spills(dataset, tmp_path):
+    spilled = validate(dataset, SMALL_BUDGET, tmp_path)["spilled"]
+    assert {"prescriptions.id", "prescriptions.owned"} <= set(spilled)
+    assert validate(dataset, LARGE_BUDGET, tmp_path)["spilled"] == []
+
+
+def keys(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(
+        np.iinfo(np.int64).min, np.iinfo(np.int64).max, size=count, dtype=np.int64
+    )
+
+
+def filled_set(tmp_path, limit_bytes: int, values: np.ndarray) -> KeySet:
+    key_set = KeySet("test", MemoryBudget(limit_bytes), str(tmp_path))
+    for key in values.tolist():
+        key_set.add(key)
+    key_set.freeze()
+    return key_set
+
+
+def test_spills_as_soon_as_the_budget_is_crossed(tmp_path):
+    budget = MemoryBudget(4096)
+    key_set = KeySet("test", budget, str(tmp_path))
+    # 512 keys fill the budget exactly; the next one crosses it
+    for key in keys(512).tolist():
+        key_set.add(key)
+    assert not key_set.spilled
+    key_set.add(1)
+    assert key_set.spilled
+
+
+def test_budget_tracks_memory(tmp_path):
+    budget = MemoryBudget(LARGE_BUDGET)
+    sets = [KeySet(f"set-{n}", budget, str(tmp_path)) for n in range(3)]
+    for n, key_set in enumerate(sets):
+        for key in keys(1000 * (n + 1), seed=n).tolist():
+            key_set.add(key)
+        assert budget.used_bytes == sum(s.memory_bytes() for s in sets)
+    sets[0].freeze()
+    sets[1].spill()
+    for key in keys(5000, seed=9).tolist():
+        sets[1].add(key)
+    sets[1].freeze()
+    sets[2].freeze()
+    assert budget.used_bytes == sum(s.memory_bytes() for s in sets)
+
+
+def test_split_partitions_spilled_keys(tmp_path):
+    values = keys(20_000)
+    # Small enough for partitions of partitions
+    key_set = filled_set(tmp_path, 1024, values)
+    assert key_set.spilled
+    partitions = list(key_set._partitions())
+    assert len(partitions) > 256
+    assert max(len(level) for level, _ in partitions) == 2
+    for level, partition in partitions:
+        assert _in_partition(partition, level).all()
+        assert (np.diff(partition) > 0).all()
+    merged = np.concatenate([partition for _, partition in partitions])
+    assert np.array_equal(np.sort(merged), np.unique(values))
+    # Only the top-level key file is left; partition files are removed
+    assert sorted(os.listdir(tmp_path)) == ["test.keys"]
+
+
+def test_resolve_spilled_candidates(tmp_path):
+    values = keys(20_000)
+    key_set = filled_set(tmp_path, 1024, values)
+    absent = keys(500, seed=1)
+    candidates = np.zeros(1500, dtype=CANDIDATE)
+    candidates["id"][:1000] = values[:1000]
+    candidates["id"][1000:] = absent
+    candidates["owned"] = NO_OWNER
+    candidates["context"] = np.arange(1500)
+    path = str(tmp_path / "candidates")
+    candidates.tofile(path)
+
+    present_path, absent_path = key_set.resolve(path, "id")
+    present = np.fromfile(present_path, dtype=CANDIDATE)
+    missing = np.fromfile(absent_path, dtype=CANDIDATE)
+    assert sorted(present["context"].tolist()) == list(range(1000))
+    assert sorted(missing["context"].tolist()) == list(range(1000, 1500))
@@ -0,0 +1,132 @@
+from datetime import datetime, time, timedelta
+import numpy as np
+import pytest
+import pytz
+from generators.config import DOSAGE_INSTRUCTIONS, PRESCRIPTION_TEMPLATES, VITAL_RANGES
+from generators.encounters import generate_encounters_for_resident
+from generators.observations import generate_observations_for_resident
+from generators.prescription_administration import (
+    dose_draws,
+    generate_prescription_administration_for_resident,
+)
+from generators.prescriptions import generate_prescriptions_for_resident
+from generators.procedures import generate_procedures_for_resident
+from generators.tasks import generate_tasks_for_resident
+from generators.utils import get_loinc_codes, seed_stream
+
+START = pytz.utc.localize(datetime(2023, 1, 1))
+END = pytz.utc.localize(datetime(2025, 6, 1))
+STAFF_IDS = [f"staff-{n}" for n in range(6)]
+WINDOWS = [
+    (datetime(2024, 3, 1), datetime(2024, 9, 30)),
+    (datetime(2023, 1, 1), datetime(2023, 1, 1)),
+    (datetime(2025, 5, 20), None),
+    (None, datetime(2023, 2, 14)),
+]
+
+
+def window(since, until) -> tuple:
+    """A window as the generation script builds it, inclusive of both dates."""
+    return (
+        since and pytz.utc.localize(datetime.combine(since, time())),
+        until and pytz.utc.localize(datetime.combine(until, time.max)),
+    )
+
+
+def inside(value, since, until) -> bool:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return (since is None or value >= since) and (until is None or value <= until)
+
+
+def prescriptions(resident_id: str) -> list:
+    seed_stream(7, resident_id, "prescriptions")
+    return generate_prescriptions_for_resident(
+        resident_id,
+        STAFF_IDS,
+        START,
+        pytz.utc.localize(datetime(2024, 1, 1)),
+        END,
+        PRESCRIPTION_TEMPLATES,
+        DOSAGE_INSTRUCTIONS,
+    )
+
+
+def emar(resident_id: str, resident_prescriptions: list, *window) -> list:
+    seed_stream(7, resident_id, "prescription_administration")
+    return generate_prescription_administration_for_resident(
+        resident_id, resident_prescriptions, STAFF_IDS, END, *window
+    )
+
+
+@pytest.mark.parametrize("since, until", WINDOWS)
+def test_windowed_emar_matches_a_full_run_inside_the_window(since, until):
+    since, until = window(since, until)
+    for n in range(20):
+        resident_id = f"resident-{n}"
+        resident_prescriptions = prescriptions(resident_id)
+        full = emar(resident_id, resident_prescriptions)
+        expected = [
+            record
+            for record in full
+            if inside(record["data"]["effective_datetime"], since, until)
+        ]
+        assert emar(resident_id, resident_prescriptions, since, until) == expected
+
+
+def test_emar_doses_do_not_depend_on_the_first_day_drawn():
+    stream = np.random.Philox()
+    times = [time(8, 0), time(20, 0)]
+    whole = dose_draws(stream, 5, "rx", 0, 30, times, 2, START)
+    tail = dose_draws(stream, 5, "rx", 12, 30, times, 2, START)
+    for full, part in zip(whole, tail):
+        assert (full[12 * 2 :] == part).all()
+
+
+def test_emar_rejects_times_of_day_that_do_not_match_the_frequency():
+    with pytest.raises(ValueError):
+        dose_draws(np.random.Philox(), 5, "rx", 0, 30, [time(9, 0)], 2, START)
+
+
+EVENT_GENERATORS = {
+    "observations": (
+        lambda resident_id, *window: generate_observations_for_resident(
+            resident_id, STAFF_IDS, START, END, get_loinc_codes(VITAL_RANGES), *window
+        ),
+        lambda record: record["data"]["effective_datetime"],
+    ),
+    "tasks": (
+        lambda resident_id, *window: generate_tasks_for_resident(
+            resident_id, STAFF_IDS, START, END, *window
+        ),
+        lambda record: record["data"]["authored_on"],
+    ),
+    "procedures": (
+        lambda resident_id, *window: generate_procedures_for_resident(
+            resident_id, "Name", STAFF_IDS, START, END, *window
+        ),
+        lambda record: record["data"]["occurrence"]["start"],
+    ),
+    "encounters": (
+        lambda resident_id, *window: generate_encounters_for_resident(
+            resident_id, "Name", STAFF_IDS, START, END, "episode", *window
+        ),
+        lambda record: record["data"]["period"]["start"],
+    ),
+}
+
+
+@pytest.mark.parametrize("name", EVENT_GENERATORS)
+@pytest.mark.parametrize("since, until", WINDOWS)
+def test_windowed_events_match_a_full_run_inside_the_window(name, since, until):
+    generate, timestamp = EVENT_GENERATORS[name]
+    since, until = window(since, until)
+    for n in range(50):
+        resident_id = f"resident-{n}"
+        seed_stream(7, resident_id, name)
+        full = generate(resident_id)
+        seed_stream(7, resident_id, name)
+        windowed = generate(resident_id, since, until)
+        assert windowed == [
+            record for record in full if inside(timestamp(record), since, until)
+        ]
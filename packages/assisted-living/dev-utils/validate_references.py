@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+from generate_demo_subcollection_data import (
+    OUTPUT_FILES,
+    SUBCOLLECTIONS_DIR,
+    SYNTHESISED_FILES,
+    SYNTHETIC_DIR,
+    ZSTD_DICT_DIR,
+)
+from pipeline.compression import COMPRESSIONS, load_dictionary
+from pipeline.readers import RecordFormatError
+from pipeline.references import ReferenceValidator
+from pipeline.writers import OUTPUT_FORMATS, output_path
+
+
+def dataset_paths(data_dir: str) -> dict:
+    """Finds each collection's file, preferring the most recently written format."""
+    paths = {}
+    for name, sub_file in (OUTPUT_FILES | SYNTHESISED_FILES).items():
+        candidates = [
+            path
+            for path in (
+                output_path(data_dir, sub_file, fmt, compression)
+                for fmt in OUTPUT_FORMATS
+                for compression in [None, *COMPRESSIONS]
+            )
+            if os.path.exists(path)
+        ]
+        if candidates:
+            paths[name] = max(candidates, key=os.path.getmtime)
+    return paths
+
+
+def dataset_dictionaries(data_dir: str, paths: dict) -> dict:
+    """Loads the zstd dictionaries saved with --zstd-dict for the collections in `paths`."""
+    dictionary_dir = os.path.join(data_dir, ZSTD_DICT_DIR)
+    dictionaries = {name: load_dictionary(dictionary_dir, name) for name in paths}
+    return {name: value for name, value in dictionaries.items() if value}
+
+
+def print_report(report: dict) -> int:
+    """Prints the report and returns the number of broken references."""
+    print(f"{'reference':<62} {'checked':>11} {'dangling':>9} {'cross':>9}")
+    broken = 0
+    for name, result in report["references"].items():
+        print(
+            f"{name:<62} {result['checked']:>11} "
+            f"{result['dangling']:>9} {result['cross_resident']:>9}"
+        )
+        broken += result["dangling"] + result["cross_resident"]
+        for example in result["examples"]:
+            print(
+                f"    {example['problem']}: {example['id']} "
+                f"(resident {example['resident_id']}) -> {example['reference']}"
+            )
+    if report["spilled"]:
+        print(f"Spilled to disk: {', '.join(report['spilled'])}")
+    return broken
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Checks that every reference in a generated dataset resolves within its resident."
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=SUBCOLLECTIONS_DIR,
+        help=f"Directory the generator wrote to, e.g. {SYNTHETIC_DIR} after a --residents run.",
+    )
+    parser.add_argument(
+        "--memory-mb",
+        type=float,
+        default=1024,
+        help="Memory for ID sets; larger sets spill to a Bloom filter and a file on disk.",
+    )
+    parser.add_argument(
+        "--spill-dir", help="Where spilled sets go (default: the system temp dir)."
+    )
+    parser.add_argument(
+        "--examples",
+        type=int,
+        default=5,
+        help="Broken references to show per reference field.",
+    )
+    parser.add_argument("--report", help="Also write the full report as JSON here.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    paths = dataset_paths(args.data_dir)
+    if "residents" not in paths:
+        print(f"Error: no residents file found in {args.data_dir}.")
+        exit(1)
+    validator = ReferenceValidator(
+        int(args.memory_mb * 2**20), args.spill_dir, args.examples
+    )
+    try:
+        report = validator.run(paths, dataset_dictionaries(args.data_dir, paths))
+    except RecordFormatError as error:
+        print(f"Error: {error}")
+        exit(1)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    broken = print_report(report)
+    print(
+        f"Read {sum(report['collections'].values())} records "
+        f"from {len(report['collections'])} collections."
+    )
+    if broken:
+        print(f"{broken} broken reference(s).")
+        exit(1)
+    print("All references resolve.")